@@ -0,0 +1,126 @@
+"""
+Cache du catalogue (rails de la page boutique, liste des catégories).
+
+Toutes les clés sont préfixées par un numéro de version du catalogue.
+Changer la version (à chaque enregistrement / suppression d'un produit
+ou d'une catégorie) rend toutes les anciennes entrées inaccessibles ; elles
+expirent ensuite d'elles-mêmes (TTL). Fonctionne avec n'importe quel backend
+de cache Django (mémoire locale, fichiers, Redis...).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+CLE_VERSION = 'catalogue:version'
+CLE_VERSION_NOTES = 'catalogue:version_notes'
+
+# Durée de vie des entrées (secondes), surchargeable via settings.CATALOGUE_CACHE_TTL
+TTL = getattr(settings, 'CATALOGUE_CACHE_TTL', 60 * 15)
+
+# Alias du cache utilisé, surchargeable via settings.CATALOGUE_CACHE_ALIAS
+ALIAS = getattr(settings, 'CATALOGUE_CACHE_ALIAS', 'default')
+
+TAILLE_PROMOTIONS = 12
+TAILLE_NOUVEAUTES = 8
+TAILLE_MIEUX_NOTES = 8
+
+
+def _cache():
+    return caches[ALIAS]
+
+
+def _nouvelle_version():
+    # Basée sur l'horloge : si la clé de version est évincée, on ne retombe
+    # jamais sur un ancien numéro dont les entrées seraient encore en cache.
+    return time.time_ns()
+
+
+def version():
+    """Version courante du catalogue."""
+    cache = _cache()
+    v = cache.get(CLE_VERSION)
+    if v is None:
+        cache.add(CLE_VERSION, _nouvelle_version(), timeout=None)
+        v = cache.get(CLE_VERSION)
+    return v
+
+
+def version_notes():
+    """Version des notes : change à chaque note ajoutée, modifiée ou supprimée (tri par note, ETag)."""
+    cache = _cache()
+    v = cache.get(CLE_VERSION_NOTES)
+    if v is None:
+        cache.add(CLE_VERSION_NOTES, _nouvelle_version(), timeout=None)
+        v = cache.get(CLE_VERSION_NOTES)
+    return v
+
+
+def _renouveler(cle_version):
+    # Valeur neuve plutôt qu'incr : deux invalidations simultanées ne donnent
+    # jamais la même version, même sans incr atomique (voir panier.py)
+    v = _nouvelle_version()
+    _cache().set(cle_version, v, timeout=None)
+    return v
+
+
+def invalider():
+    """Change la version : toutes les entrées du catalogue deviennent obsolètes."""
+    return _renouveler(CLE_VERSION)
+
+
+def invalider_notes():
+    """
+    Une note a changé : seul le rail des mieux notés est évincé, mais la
+    version des notes change (pages triées par note, moyennes affichées).
+    """
+    evincer('mieux_notes')
+    return _renouveler(CLE_VERSION_NOTES)
+
+
+def cle(nom):
+    return f'catalogue:{version()}:{nom}'
+
+
+def obtenir(nom, calcul, ttl=None):
+    """Retourne l'entrée `nom` du cache, ou la calcule avec `calcul()` et la stocke."""
+    return _cache().get_or_set(cle(nom), calcul, TTL if ttl is None else ttl)
+
+
+def evincer(*noms):
+    """Supprime explicitement des entrées de la version courante."""
+    _cache().delete_many([cle(nom) for nom in noms])
+
+
+# ===================================================================
+# ENTRÉES DU CATALOGUE
+# ===================================================================
+
+def promotions():
+    from .models import Produit
+    return obtenir('promotions', lambda: list(
+        Produit.objects.filter(prix_promo__isnull=False).order_by('-date_creation', '-id')[:TAILLE_PROMOTIONS]
+    ))
+
+
+def nouveautes():
+    from .models import Produit
+    return obtenir('nouveautes', lambda: list(
+        Produit.objects.order_by('-date_creation', '-id')[:TAILLE_NOUVEAUTES]
+    ))
+
+
+def mieux_notes():
+    from . import classement
+    return obtenir('mieux_notes', lambda: classement.meilleurs(TAILLE_MIEUX_NOTES))
+
+
+def categories():
+    from .models import Categorie
+    return obtenir('categories', lambda: list(Categorie.objects.all().order_by('nom')))
+
+
+def arbre_categories():
+    """Racines de l'arborescence, avec `sous_categories` sur chaque nœud (une requête)."""
+    from .models import Categorie
+    return obtenir('arbre_categories', lambda: Categorie.arbre(Categorie.objects.filter(is_active=True)))
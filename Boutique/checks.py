@@ -0,0 +1,35 @@
+"""
+Vérifications système (`manage.py check --deploy`).
+
+Positions GPS, versions du catalogue, du panier et des statistiques, verrou
+de vidage : tout passe par le cache par défaut, qui doit être commun aux
+workers web et aux commandes flush_positions et dispatch_orders.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Caches propres à un processus (ou à une machine, sans add atomique)
+CACHES_LOCAUX = {
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+}
+
+
+def cache_partage():
+    """Le cache par défaut est-il partagé entre les processus ?"""
+    return settings.CACHES['default']['BACKEND'] not in CACHES_LOCAUX
+
+
+@register(Tags.caches, deploy=True)
+def verifier_cache_partage(app_configs, **kwargs):
+    if cache_partage():
+        return []
+    return [
+        Warning(
+            "Le cache par défaut n'est pas partagé entre les processus : positions "
+            "des livreurs, versions du catalogue et du panier diffèrent d'un worker à l'autre.",
+            hint="Définir REDIS_URL (ou configurer Memcached / DatabaseCache).",
+            id='Boutique.W001',
+        )
+    ]
@@ -0,0 +1,96 @@
+"""
+Classement « mieux notés » par moyenne bayésienne.
+
+    score = (C × m + somme des notes) / (C + nombre de notes)
+
+m est la moyenne globale de toutes les notes et C le poids de cet a priori
+(CLASSEMENT_POIDS_A_PRIORI). Les scores sont stockés dans ClassementProduit
+et lus avec une seule requête indexée. Chaque changement de note ne met à
+jour que la ligne du produit concerné ; m est recalculée à chaque
+reconstruction complète (commande rebuild_leaderboard) et stockée en base
+(MoyenneClassement) : tous les processus notent avec le même a priori.
+"""
+from django.db.models import Sum
+
+from .constants import CLASSEMENT_NOTE_A_PRIORI, CLASSEMENT_POIDS_A_PRIORI
+
+TAILLE_LOT = 500
+
+
+def moyenne_globale():
+    """Moyenne globale utilisée comme a priori (figée à la dernière reconstruction)."""
+    from .models import MoyenneClassement
+
+    moyenne = MoyenneClassement.objects.filter(pk=1).values_list('moyenne', flat=True).first()
+    return CLASSEMENT_NOTE_A_PRIORI if moyenne is None else moyenne
+
+
+def calculer_score(somme, nombre, moyenne=None):
+    moyenne = moyenne_globale() if moyenne is None else moyenne
+    return (CLASSEMENT_POIDS_A_PRIORI * moyenne + somme) / (CLASSEMENT_POIDS_A_PRIORI + nombre)
+
+
+def _enregistrer(lignes, moyenne):
+    from .models import ClassementProduit
+
+    ClassementProduit.objects.bulk_create(
+        [
+            ClassementProduit(
+                produit_id=produit_id,
+                score=calculer_score(somme, nombre, moyenne),
+                note_moyenne=somme / nombre if nombre else 0,
+                nombre_notes=nombre,
+            )
+            for produit_id, somme, nombre in lignes
+        ],
+        update_conflicts=True,
+        unique_fields=['produit'],
+        update_fields=['score', 'note_moyenne', 'nombre_notes', 'date_maj'],
+    )
+
+
+def actualiser(produit_ids):
+    """
+    Recalcule la ligne de classement des produits donnés (3 requêtes). Les
+    produits supprimés entre-temps sont ignorés.
+    """
+    from .models import Produit
+
+    produit_ids = [pk for pk in produit_ids if pk]
+    if not produit_ids:
+        return
+    lignes = Produit.objects.filter(pk__in=produit_ids).values_list('id', 'rating_sum', 'rating_count')
+    _enregistrer(list(lignes), moyenne_globale())
+
+
+def reconstruire():
+    """Recalcule la moyenne globale puis tout le classement, par lots. Retourne le nombre de produits."""
+    from .models import MoyenneClassement, Produit
+
+    totaux = Produit.objects.aggregate(somme=Sum('rating_sum'), nombre=Sum('rating_count'))
+    if totaux['nombre']:
+        moyenne = totaux['somme'] / totaux['nombre']
+    else:
+        moyenne = CLASSEMENT_NOTE_A_PRIORI
+    MoyenneClassement.objects.update_or_create(pk=1, defaults={'moyenne': moyenne})
+
+    total = 0
+    lot = []
+    for ligne in Produit.objects.values_list('id', 'rating_sum', 'rating_count').iterator(chunk_size=TAILLE_LOT):
+        lot.append(ligne)
+        if len(lot) >= TAILLE_LOT:
+            _enregistrer(lot, moyenne)
+            total += len(lot)
+            lot = []
+    _enregistrer(lot, moyenne)
+    return total + len(lot)
+
+
+def meilleurs(n):
+    """Les n produits les mieux classés (une requête sur l'index du score)."""
+    from .models import ClassementProduit
+
+    return [
+        c.produit
+        for c in ClassementProduit.objects.select_related('produit').order_by('-score', '-produit')[:n]
+    ]
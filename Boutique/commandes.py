@@ -0,0 +1,146 @@
+"""
+Passage de commande.
+
+Le panier est transformé en commande avec un nombre de requêtes constant,
+quel que soit le nombre de lignes :
+  1. lecture des lignes et des totaux du panier (tarification.py, une requête) ;
+  2. réservation du stock de toutes les lignes (un seul UPDATE conditionnel) ;
+  3. création de la commande ;
+  4. création de tous les articles (bulk_create) ;
+  5. retrait des lignes commandées du panier (un DELETE, un UPDATE) : seules
+     les lignes et quantités lues à l'étape 1 sont retirées, un ajout
+     concurrent validé entre-temps reste dans le panier.
+L'e-mail de confirmation est mis en file (outbox) dans la même transaction :
+il n'existe que si la commande est validée, et l'envoi SMTP se fait hors
+requête. La mise à jour du cache du panier est différée après validation.
+
+Idempotence : le formulaire du panier porte une clé unique. Une commande
+déjà passée avec la même clé est retournée telle quelle (`rejouee = True`),
+sans rien refaire ; deux envois simultanés sont départagés par la
+contrainte d'unicité (user, cle_idempotence), sans verrou applicatif.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from . import panier
+from .models import Commande, CommandeItem, PanierItem, Produit
+from .tarification import calculer_panier
+from .utils import envoyer_mail_statut_commande
+
+
+class PanierVide(Exception):
+    """Levée lorsqu'on tente de commander un panier vide."""
+
+
+class StockInsuffisant(Exception):
+    """Levée si au moins un produit n'a pas assez de stock ; `manquants` liste (produit, demandé, disponible)."""
+
+    def __init__(self, manquants, quantites=None):
+        super().__init__(', '.join(p.nom for p, _, _ in manquants))
+        self.manquants = manquants
+        self.quantites = quantites or {}
+
+
+def _par_pk(quantites):
+    """Expression CASE donnant, pour chaque clé primaire de `quantites`, sa valeur."""
+    return Case(
+        *[When(pk=produit_id, then=Value(n)) for produit_id, n in quantites.items()],
+        output_field=IntegerField(),
+    )
+
+
+def reserver_stock(quantites):
+    """
+    Décrémente le stock de tous les produits {produit_id: quantité} en un seul
+    UPDATE ... SET stock = stock - n WHERE stock >= n (les produits sans stock
+    suivi passent toujours). Si une ligne n'est pas servie, lève StockInsuffisant ;
+    à appeler dans une transaction pour que tout soit annulé.
+    """
+    if not quantites:
+        return
+    besoin = _par_pk(quantites)
+    servis = (
+        Produit.objects.filter(pk__in=quantites)
+        .filter(Q(stock__isnull=True) | Q(stock__gte=besoin))
+        .update(stock=F('stock') - besoin)
+    )
+    if servis != len(quantites):
+        raise StockInsuffisant([], quantites)
+
+
+def produits_en_rupture(quantites):
+    """Produits dont le stock ne couvre pas la quantité demandée : [(produit, demandé, disponible)]."""
+    produits = Produit.objects.filter(pk__in=quantites, stock__lt=_par_pk(quantites)).only('nom', 'stock')
+    return [(p, quantites[p.pk], p.stock) for p in produits]
+
+
+def commande_existante(user, cle_idempotence):
+    """Commande déjà passée par `user` avec cette clé, ou None."""
+    if not cle_idempotence:
+        return None
+    commande = Commande.objects.filter(user=user, cle_idempotence=cle_idempotence).first()
+    if commande is not None:
+        commande.rejouee = True
+    return commande
+
+
+def passer_commande(user, latitude=None, longitude=None, adresse_gps=None, cle_idempotence=None):
+    """
+    Crée la commande de `user` à partir de son panier et la retourne.
+    Avec `cle_idempotence`, un nouvel envoi retourne la commande d'origine.
+    """
+    existante = commande_existante(user, cle_idempotence)
+    if existante is not None:
+        return existante
+
+    try:
+        return _creer_commande(user, latitude, longitude, adresse_gps, cle_idempotence)
+    except StockInsuffisant as e:
+        # Transaction annulée : on relit le stock pour indiquer les produits manquants
+        raise StockInsuffisant(produits_en_rupture(e.quantites), e.quantites) from None
+    except (IntegrityError, PanierVide):
+        # Envoi concurrent avec la même clé : l'autre requête a gagné (et vidé le panier)
+        existante = commande_existante(user, cle_idempotence)
+        if existante is not None:
+            return existante
+        raise
+
+
+def _creer_commande(user, latitude, longitude, adresse_gps, cle_idempotence):
+    with transaction.atomic():
+        resume = calculer_panier(user.pk, avec_produits=False)
+        if not resume:
+            raise PanierVide()
+
+        reserver_stock({ligne.produit_id: ligne.quantite for ligne in resume.lignes})
+
+        commande = Commande.objects.create(
+            user=user,
+            total=resume.total,
+            latitude=latitude,
+            longitude=longitude,
+            adresse_gps=adresse_gps,
+            cle_idempotence=cle_idempotence or None,
+        )
+        CommandeItem.objects.bulk_create([
+            CommandeItem(commande=commande, produit_id=ligne.produit_id, quantite=ligne.quantite, prix_unitaire=ligne.prix_applique)
+            for ligne in resume.lignes
+        ])
+        retirer_lignes_commandees({ligne.pk: ligne.quantite for ligne in resume.lignes})
+
+        envoyer_mail_statut_commande(commande)
+
+        transaction.on_commit(lambda: panier.oublier_resume(user.pk))
+    return commande
+
+
+def retirer_lignes_commandees(quantites):
+    """
+    Retire du panier les quantités commandées {panier_item_id: quantité} :
+    la ligne est supprimée si elle n'a pas bougé, sinon seul l'excédent
+    ajouté depuis la lecture du panier est conservé.
+    """
+    commandee = _par_pk(quantites)
+    lignes = PanierItem.objects.filter(pk__in=quantites)
+    lignes.filter(quantite__lte=commandee).delete()
+    lignes.filter(quantite__gt=commandee).update(quantite=F('quantite') - commandee)
@@ -0,0 +1,103 @@
+"""
+GET conditionnels (ETag / Last-Modified) pour les pages du catalogue et
+les points d'accès JSON.
+
+Les validateurs sont dérivés de numéros de version déjà en cache (version
+du catalogue et des notes, version du panier), du panier de session ou
+d'une lecture de `Commande.updated_at` : une requête dont l'ETag
+correspond reçoit un 304 sans que la vue ne s'exécute (ni gabarit, ni
+requêtes sur les articles).
+"""
+import hashlib
+
+from django.views.decorators.http import condition
+
+from . import catalog_cache
+from .models import Commande, RoleChoices
+from .panier import CLE_SESSION, version_panier
+
+
+def _empreinte(*parties):
+    """Condensé stable des parties fournies (valeur d'un ETag)."""
+    return hashlib.sha1('|'.join(str(p) for p in parties).encode()).hexdigest()
+
+
+# ===================================================================
+# CATALOGUE
+# ===================================================================
+
+def etag_catalogue(request, *args, **kwargs):
+    """
+    La page dépend du catalogue, des notes (tri, moyennes), des paramètres, de
+    l'utilisateur, de son panier (badge) : panier en base pour un client
+    connecté, panier de session (forme compacte) pour un invité, et du secret
+    CSRF, qui change à la connexion et à la déconnexion : un 304 rejouerait
+    sinon un jeton périmé et le prochain POST échouerait en 403. Pas de
+    Last-Modified : une date ne refléterait ni la connexion ni le panier.
+
+    ETag faible : le jeton CSRF est masqué différemment à chaque rendu, deux
+    réponses de même ETag ne sont donc équivalentes qu'au sens sémantique.
+    """
+    if request.user.is_authenticated:
+        user_id = request.user.pk
+        panier = version_panier(user_id)
+    else:
+        user_id = None
+        panier = request.session.get(CLE_SESSION, '')
+    return 'W/"%s"' % _empreinte(
+        'catalogue', catalog_cache.version(), catalog_cache.version_notes(),
+        request.get_full_path(), user_id, panier, request.META.get('CSRF_COOKIE', ''),
+    )
+
+
+catalogue_conditionnel = condition(etag_func=etag_catalogue)
+
+
+# ===================================================================
+# PANIER
+# ===================================================================
+
+def etag_panier(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    return _empreinte('panier', request.user.pk, version_panier(request.user.pk))
+
+
+panier_conditionnel = condition(etag_func=etag_panier)
+
+
+# ===================================================================
+# COMMANDES
+# ===================================================================
+
+def peut_voir_toutes_commandes(user):
+    """Le staff et les livreurs consultent toutes les commandes, les clients les leurs."""
+    return user.is_staff or getattr(getattr(user, 'userprofile', None), 'role', None) == RoleChoices.LIVREUR
+
+
+def _date_commande(request, pk):
+    """updated_at de la commande si l'utilisateur peut la consulter, sinon None."""
+    if not request.user.is_authenticated:
+        return None
+    commandes = Commande.objects.filter(pk=pk)
+    if not peut_voir_toutes_commandes(request.user):
+        commandes = commandes.filter(user=request.user)
+    # Mémorisé sur la requête : une seule lecture pour ETag et Last-Modified
+    cache_requete = request.__dict__.setdefault('_dates_commandes', {})
+    if pk not in cache_requete:
+        cache_requete[pk] = commandes.values_list('updated_at', flat=True).first()
+    return cache_requete[pk]
+
+
+def etag_commande(request, pk, *args, **kwargs):
+    date = _date_commande(request, pk)
+    if date is None:
+        return None
+    return _empreinte('commande', pk, date.isoformat())
+
+
+def last_modified_commande(request, pk, *args, **kwargs):
+    return _date_commande(request, pk)
+
+
+commande_conditionnelle = condition(etag_func=etag_commande, last_modified_func=last_modified_commande)
@@ -6,6 +6,11 @@ from decimal import Decimal
 # Frais de livraison par défaut (en FCFA)
 FRAIS_LIVRAISON_DEFAUT = Decimal('1000')
 
+# Classement bayésien des produits (voir classement.py) :
+# une note "a priori" pesant comme CLASSEMENT_POIDS_A_PRIORI avis fictifs
+CLASSEMENT_POIDS_A_PRIORI = 5
+CLASSEMENT_NOTE_A_PRIORI = 3.0
+
 # Autres constantes
 STATUTS_COMMANDE = [
     ('EN_ATTENTE', 'En attente'),
@@ -0,0 +1,14 @@
+from .panier import compter_panier_session, resume_panier
+
+
+def panier(request):
+    """Expose `cart_count` à tous les gabarits (lu en cache ou en session, sans requête)."""
+    user = getattr(request, 'user', None)
+
+    def cart_count():
+        if user is not None and user.is_authenticated:
+            return resume_panier(user.pk)['count']
+        return compter_panier_session(request.session)
+
+    # Évalué uniquement si le gabarit affiche le badge
+    return {'cart_count': cart_count}
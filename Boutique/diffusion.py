@@ -0,0 +1,124 @@
+"""
+Publication / abonnement en mémoire pour le suivi en direct des commandes.
+
+Les vues (synchrones, exécutées dans des threads) publient des événements
+sur des canaux ('commande:<id>', 'livreur:<id>') ; les flux SSE (vues
+asynchrones) s'y abonnent. Chaque abonné n'est qu'une petite file asyncio :
+une connexion inactive ne coûte ni thread ni requête en base.
+
+Le bus est choisi par settings.BOUTIQUE_BUS (chemin pointé d'une classe
+exposant `publier`, `abonner` et `desabonner`) ; BusMemoire ne relie que
+les connexions d'un même processus, un courtier partagé (Redis...) peut le
+remplacer sans toucher aux vues.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Événements gardés par abonné lent ; au-delà, les plus anciens sont perdus
+TAILLE_FILE = 32
+
+
+class Abonnement:
+    """File d'événements d'un abonné, liée à sa boucle asyncio."""
+
+    def __init__(self, canaux):
+        self.canaux = set(canaux)
+        self.boucle = asyncio.get_running_loop()
+        self.file = asyncio.Queue(maxsize=TAILLE_FILE)
+
+    def _pousser(self, message):
+        if self.file.full():
+            self.file.get_nowait()
+        self.file.put_nowait(message)
+
+    def livrer(self, message):
+        """Appelable depuis n'importe quel thread."""
+        try:
+            self.boucle.call_soon_threadsafe(self._pousser, message)
+        except RuntimeError:
+            # Boucle fermée : l'abonné est parti
+            pass
+
+    async def recevoir(self, timeout=None):
+        """Prochain événement (canal, données) ; lève asyncio.TimeoutError après `timeout` secondes."""
+        return await asyncio.wait_for(self.file.get(), timeout)
+
+
+class BusMemoire:
+    """Bus local au processus."""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._abonnes = {}
+
+    def abonner(self, *canaux):
+        abonnement = Abonnement(canaux)
+        with self._verrou:
+            for canal in canaux:
+                self._abonnes.setdefault(canal, set()).add(abonnement)
+        return abonnement
+
+    def ajouter_canal(self, abonnement, canal):
+        with self._verrou:
+            abonnement.canaux.add(canal)
+            self._abonnes.setdefault(canal, set()).add(abonnement)
+
+    def retirer_canal(self, abonnement, canal):
+        with self._verrou:
+            abonnement.canaux.discard(canal)
+            abonnes = self._abonnes.get(canal)
+            if abonnes is not None:
+                abonnes.discard(abonnement)
+                if not abonnes:
+                    del self._abonnes[canal]
+
+    def desabonner(self, abonnement):
+        for canal in list(abonnement.canaux):
+            self.retirer_canal(abonnement, canal)
+
+    def publier(self, canal, donnees):
+        with self._verrou:
+            abonnes = list(self._abonnes.get(canal, ()))
+        for abonnement in abonnes:
+            abonnement.livrer((canal, donnees))
+        return len(abonnes)
+
+
+_bus = None
+
+
+def bus():
+    """Instance du bus configuré (créée au premier appel)."""
+    global _bus
+    if _bus is None:
+        chemin = getattr(settings, 'BOUTIQUE_BUS', None)
+        _bus = import_string(chemin)() if chemin else BusMemoire()
+    return _bus
+
+
+def canal_commande(commande_id):
+    return f'commande:{commande_id}'
+
+
+def canal_livreur(livreur_id):
+    return f'livreur:{livreur_id}'
+
+
+def publier_statut(commande):
+    """Diffuse le statut (et le livreur) d'une commande à ses abonnés."""
+    bus().publier(canal_commande(commande.pk), {
+        'statut': commande.statut,
+        'livreur_id': commande.livreur_id,
+    })
+
+
+def publier_position(livreur_id, position):
+    """Diffuse la nouvelle position d'un livreur aux clients qui suivent ses commandes."""
+    bus().publier(canal_livreur(livreur_id), {
+        'lat': position['lat'],
+        'lng': position['lng'],
+        'ts': position['ts'].isoformat(),
+    })
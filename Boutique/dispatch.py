@@ -0,0 +1,183 @@
+"""
+Répartition automatique des commandes en attente entre les livreurs.
+
+À chaque passage : les livreurs actifs (dernière position en cache récente)
+sont placés dans une grille régulière de cases en degrés ; chaque commande
+géolocalisée de la file commune, de la plus ancienne à la plus récente, va
+au livreur disponible le plus proche, trouvé en parcourant les cases par
+anneaux autour de la commande. Un livreur ne reçoit pas plus de
+CAPACITE_LIVREUR commandes en cours ; une fois plein, il sort de la grille.
+
+La file est lue par lots de TAILLE_LOT, à la suite du dernier id lu
+(pagination par clé) : une commande qu'aucun livreur ne peut prendre (trop
+loin de tous) est dépassée dans le même passage, et les plus récentes ne
+restent pas bloquées derrière elle. Le passage s'arrête quand tous les
+livreurs sont pleins ou que la file est épuisée.
+
+L'attribution passe par livraison.prendre_commande (UPDATE conditionnel sur
+statut='EN_ATTENTE' et livreur vide) : si un livreur accepte la même
+commande au même moment, un seul des deux l'obtient. Les commandes sans
+coordonnées restent dans la file commune pour une prise manuelle.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count
+from django.utils import timezone
+
+from .geo import distance_km
+from .livraison import file_commune, prendre_commande
+from .models import Commande, RoleChoices
+from .positions import positions_livreurs
+
+# Commandes en cours au maximum par livreur
+CAPACITE_LIVREUR = getattr(settings, 'DISPATCH_CAPACITE_LIVREUR', 3)
+
+# Commandes lues par requête (un passage en lit autant de lots que nécessaire)
+TAILLE_LOT = getattr(settings, 'DISPATCH_TAILLE_LOT', 100)
+
+# Au-delà, la commande attend un livreur plus proche (ou une prise manuelle)
+RAYON_MAX_KM = getattr(settings, 'DISPATCH_RAYON_MAX_KM', 15)
+
+# Intervalle entre deux passages de la commande dispatch_orders --loop (secondes)
+INTERVALLE = getattr(settings, 'DISPATCH_INTERVALLE', 30)
+
+# Un livreur sans relevé GPS depuis ce délai n'est plus considéré comme actif
+FRAICHEUR_POSITION = timedelta(minutes=5)
+
+# Côté d'une case de la grille (degrés, environ 2 km)
+TAILLE_CASE = 0.02
+
+KM_PAR_DEGRE = 111.195
+
+
+class GrilleLivreurs:
+    """Index spatial des livreurs : case (ligne, colonne) -> {livreur_id: (lat, lng)}."""
+
+    def __init__(self, taille_case=TAILLE_CASE):
+        self.taille_case = taille_case
+        self._cases = defaultdict(dict)
+        self._case_de = {}
+
+    def __len__(self):
+        return len(self._case_de)
+
+    def _case(self, lat, lng):
+        return math.floor(lat / self.taille_case), math.floor(lng / self.taille_case)
+
+    def ajouter(self, livreur_id, lat, lng):
+        case = self._case(lat, lng)
+        self._cases[case][livreur_id] = (lat, lng)
+        self._case_de[livreur_id] = case
+
+    def retirer(self, livreur_id):
+        case = self._case_de.pop(livreur_id, None)
+        if case is not None:
+            del self._cases[case][livreur_id]
+            if not self._cases[case]:
+                del self._cases[case]
+
+    def _anneau(self, centre, rang):
+        ligne, colonne = centre
+        if rang == 0:
+            yield centre
+            return
+        for dc in range(-rang, rang + 1):
+            yield ligne - rang, colonne + dc
+            yield ligne + rang, colonne + dc
+        for dl in range(-rang + 1, rang):
+            yield ligne + dl, colonne - rang
+            yield ligne + dl, colonne + rang
+
+    def plus_proche(self, lat, lng, rayon_km=RAYON_MAX_KM):
+        """
+        (livreur_id, distance_km) du livreur le plus proche dans le rayon, ou None.
+        Les anneaux sont parcourus du centre vers l'extérieur ; on s'arrête dès
+        qu'aucune case plus éloignée ne peut contenir de livreur plus proche.
+        """
+        # Largeur d'une case en km, minorée par celle en longitude (qui rétrécit avec la latitude)
+        cote_km = self.taille_case * KM_PAR_DEGRE * max(math.cos(math.radians(min(abs(lat) + 1, 90))), 0.01)
+        centre = self._case(lat, lng)
+        meilleur = None
+        rang = 0
+        while self._case_de:
+            for case in self._anneau(centre, rang):
+                for livreur_id, (lat_l, lng_l) in self._cases.get(case, {}).items():
+                    d = distance_km(lat, lng, lat_l, lng_l)
+                    if d <= rayon_km and (meilleur is None or d < meilleur[1]):
+                        meilleur = (livreur_id, d)
+            # Tout point de l'anneau suivant est au moins à rang cases de distance
+            minimum = rang * cote_km
+            if minimum > rayon_km or (meilleur is not None and meilleur[1] <= minimum):
+                break
+            rang += 1
+        return meilleur
+
+
+def livreurs_disponibles(capacite=CAPACITE_LIVREUR):
+    """
+    Livreurs actifs ayant encore de la place : {livreur_id: (lat, lng, places)}.
+    Trois lectures : les livreurs, leurs positions (cache), leurs commandes en cours.
+    """
+    ids = list(
+        User.objects.filter(is_active=True, userprofile__role=RoleChoices.LIVREUR).values_list('id', flat=True)
+    )
+    limite = timezone.now() - FRAICHEUR_POSITION
+    positions = {i: p for i, p in positions_livreurs(ids).items() if p['ts'] >= limite}
+    if not positions:
+        return {}
+
+    en_cours = dict(
+        Commande.objects.filter(livreur_id__in=positions, statut='EN_COURS')
+        .order_by().values('livreur_id').annotate(n=Count('id')).values_list('livreur_id', 'n')
+    )
+    disponibles = {}
+    for livreur_id, pos in positions.items():
+        places = capacite - en_cours.get(livreur_id, 0)
+        if places > 0:
+            disponibles[livreur_id] = (pos['lat'], pos['lng'], places)
+    return disponibles
+
+
+def repartir(taille_lot=TAILLE_LOT, capacite=CAPACITE_LIVREUR, rayon_km=RAYON_MAX_KM):
+    """
+    Attribue les commandes de la file commune aux livreurs les plus proches.
+    Retourne la liste des (commande_id, livreur_id) effectivement attribuées ; une
+    commande prise entre-temps par un livreur ou hors de portée est simplement sautée.
+    """
+    disponibles = livreurs_disponibles(capacite)
+    if not disponibles:
+        return []
+
+    grille = GrilleLivreurs()
+    places = {}
+    for livreur_id, (lat, lng, libres) in disponibles.items():
+        grille.ajouter(livreur_id, lat, lng)
+        places[livreur_id] = libres
+    livreurs = User.objects.in_bulk(list(disponibles))
+
+    file = file_commune().filter(latitude__isnull=False, longitude__isnull=False).order_by('id')
+    attributions = []
+    dernier_id = 0
+    while len(grille):
+        lot = list(file.filter(id__gt=dernier_id).values_list('id', 'latitude', 'longitude')[:taille_lot])
+        if not lot:
+            break
+        dernier_id = lot[-1][0]
+        for commande_id, lat, lng in lot:
+            if not len(grille):
+                break
+            trouve = grille.plus_proche(float(lat), float(lng), rayon_km)
+            if trouve is None:
+                continue
+            livreur_id = trouve[0]
+            if prendre_commande(commande_id, livreurs[livreur_id]) is None:
+                continue
+            attributions.append((commande_id, livreur_id))
+            places[livreur_id] -= 1
+            if places[livreur_id] <= 0:
+                grille.retirer(livreur_id)
+    return attributions
@@ -0,0 +1,122 @@
+"""
+Facettes de la boutique : nombre de produits par catégorie (sous-catégories
+incluses) et par tranche de prix, pour la recherche en cours.
+
+Chaque facette est calculée en une requête groupée. Les facettes d'une
+dimension ignorent le filtre de cette même dimension (facettes disjonctives),
+pour que l'utilisateur voie les autres choix possibles.
+Sans recherche, le résultat est mis en cache par version du catalogue.
+"""
+from django.db import connection
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+
+from . import catalog_cache
+from .models import Categorie, Produit
+
+# Tranches de prix en FCFA : (minimum inclus, maximum exclu) ; None = sans borne
+TRANCHES_PRIX = [
+    (0, 10000),
+    (10000, 25000),
+    (25000, 50000),
+    (50000, 100000),
+    (100000, 250000),
+    (250000, None),
+]
+
+
+def prix_effectif():
+    """Prix payé par le client : le prix promo s'il existe, sinon le prix."""
+    return Coalesce('prix_promo', 'prix')
+
+
+def tranche_valide(tranche):
+    try:
+        index = int(tranche)
+    except (TypeError, ValueError):
+        return None
+    return index if 0 <= index < len(TRANCHES_PRIX) else None
+
+
+def filtrer_tranche(queryset, tranche):
+    """Restreint le queryset à la tranche de prix `tranche` (index dans TRANCHES_PRIX)."""
+    index = tranche_valide(tranche)
+    if index is None:
+        return queryset
+    minimum, maximum = TRANCHES_PRIX[index]
+    queryset = queryset.alias(prix_effectif=prix_effectif()).filter(prix_effectif__gte=minimum)
+    if maximum is not None:
+        queryset = queryset.filter(prix_effectif__lt=maximum)
+    return queryset
+
+
+def compter_tranches(produits):
+    """Nombre de produits par tranche de prix, en une requête GROUP BY."""
+    tranche = Case(
+        *[
+            When(prix_effectif__lt=maximum, then=Value(index))
+            for index, (_, maximum) in enumerate(TRANCHES_PRIX) if maximum is not None
+        ],
+        default=Value(len(TRANCHES_PRIX) - 1),
+        output_field=IntegerField(),
+    )
+    lignes = (
+        produits.order_by()
+        .alias(prix_effectif=prix_effectif())
+        .annotate(tranche=tranche)
+        .values('tranche')
+        .annotate(nombre=Count('pk'))
+    )
+    nombres = {ligne['tranche']: ligne['nombre'] for ligne in lignes}
+    return [
+        {'index': index, 'min': minimum, 'max': maximum, 'nombre': nombres.get(index, 0)}
+        for index, (minimum, maximum) in enumerate(TRANCHES_PRIX)
+    ]
+
+
+def compter_categories(produits):
+    """
+    {categorie_id: nombre de produits distincts dans la catégorie ou ses descendants}.
+    Une seule requête : chaque lien produit-catégorie est rattaché à tous les
+    ancêtres dont le chemin est un préfixe du sien, puis groupé par ancêtre.
+    """
+    qn = connection.ops.quote_name
+    liens = Produit.categories.through
+    col_produit = qn(liens._meta.get_field('produit').column)
+    col_categorie = qn(liens._meta.get_field('categorie').column)
+    table_categorie = qn(Categorie._meta.db_table)
+
+    sql = (
+        f"SELECT anc.id, COUNT(DISTINCT l.{col_produit}) "
+        f"FROM {qn(liens._meta.db_table)} l "
+        f"INNER JOIN {table_categorie} c ON c.id = l.{col_categorie} "
+        f"INNER JOIN {table_categorie} anc "
+        f"ON anc.chemin <> '' AND SUBSTR(c.chemin, 1, LENGTH(anc.chemin)) = anc.chemin"
+    )
+    params = []
+    if produits.query.where:
+        sous_requete, params = produits.order_by().values('pk').query.sql_with_params()
+        sql += f" WHERE l.{col_produit} IN ({sous_requete})"
+    sql += " GROUP BY anc.id"
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def calculer(base, categorie_id=None, tranche=None, search=None):
+    """
+    Facettes pour `base` (queryset déjà filtré par la recherche).
+    Retourne {'categories': {id: nombre}, 'prix': [tranches]}.
+    """
+    def calcul():
+        pour_categories = filtrer_tranche(base, tranche)
+        pour_prix = base.dans_categorie(categorie_id) if categorie_id else base
+        return {
+            'categories': compter_categories(pour_categories),
+            'prix': compter_tranches(pour_prix),
+        }
+
+    if search:
+        return calcul()
+    return catalog_cache.obtenir(f'facettes:{categorie_id or ""}:{tranche_valide(tranche)}', calcul)
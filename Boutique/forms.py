@@ -3,6 +3,7 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
 from .models import Produit, Categorie, UserProfile, RoleChoices, Adresse
 from django.utils.text import slugify
+from . import images
 
 User = get_user_model()
 class RegisterStep1Form(UserCreationForm):
@@ -78,12 +79,13 @@ class BootstrapModelForm(forms.ModelForm):
 class ProduitForm(BootstrapModelForm):
     class Meta:
         model = Produit
-        fields = ['nom', 'description', 'prix', 'prix_promo', 'image', 'categories']
+        fields = ['nom', 'description', 'prix', 'prix_promo', 'stock', 'image', 'categories']
         labels = {
             'nom': 'Nom',
             'description': 'Description',
             'prix': 'Prix (F)',
             'prix_promo': 'Prix promo (F)',
+            'stock': 'Stock (vide = illimité)',
             'image': 'Image',
             'categories': 'Catégories',
         }
@@ -91,6 +93,7 @@ class ProduitForm(BootstrapModelForm):
             'description': forms.Textarea(attrs={'rows': 4, 'class': 'form-control'}),
             'prix': forms.NumberInput(attrs={'min': 0, 'step': 1, 'class': 'form-control'}),
             'prix_promo': forms.NumberInput(attrs={'min': 0, 'step': 1, 'class': 'form-control'}),
+            'stock': forms.NumberInput(attrs={'min': 0, 'step': 1, 'class': 'form-control'}),
             'image': forms.ClearableFileInput(attrs={'class': 'form-control'}),
             'categories': forms.SelectMultiple(attrs={'size': 6, 'class': 'form-select'}),
             'nom': forms.TextInput(attrs={'class': 'form-control'}),
@@ -114,6 +117,13 @@ class ProduitForm(BootstrapModelForm):
                 self.add_error('prix_promo', 'Le prix promo ne peut pas dépasser le prix.')
         return cleaned
 
+    def save(self, commit=True):
+        produit = super().save(commit=commit)
+        # Variantes redimensionnées de la nouvelle image (voir images.py)
+        if commit and 'image' in self.changed_data:
+            images.generer_pour_champ(produit.image)
+        return produit
+
 # forms.py
 
 from django import forms
@@ -164,8 +174,11 @@ class CategorieForm(forms.ModelForm):
             # Récupère l'ID de l'instance en cours d'édition
             current_id = self.instance.pk
             
-            # Filtre le queryset du champ 'parent' pour exclure l'instance en cours
-            self.fields['parent'].queryset = Categorie.objects.exclude(pk=current_id).order_by('nom')
+            # Filtre le queryset du champ 'parent' pour exclure l'instance et ses descendants
+            parents = Categorie.objects.exclude(pk=current_id)
+            if self.instance.chemin:
+                parents = parents.exclude(chemin__startswith=self.instance.chemin)
+            self.fields['parent'].queryset = parents.order_by('nom')
         
         # Appliquer les classes Bootstrap à tous les champs (sauf le Checkbox)
         for name, field in self.fields.items():
@@ -204,6 +217,12 @@ class CategorieForm(forms.ModelForm):
             raise forms.ValidationError(
                 "Une catégorie ne peut pas être sa propre catégorie parent."
             )
+
+        # Empêche aussi de la rattacher à l'une de ses sous-catégories (cycle)
+        if self.instance.pk and parent and self.instance.chemin and parent.chemin.startswith(self.instance.chemin):
+            raise forms.ValidationError(
+                "Une catégorie ne peut pas être rattachée à l'une de ses sous-catégories."
+            )
             
         return cleaned_data
 
@@ -0,0 +1,150 @@
+"""
+Géohash et regroupement des commandes sur la carte.
+
+Chaque commande géolocalisée porte le géohash de sa position (Commande.geohash,
+indexé). Deux positions proches partagent un long préfixe ; une cellule de la
+grille correspond donc à un intervalle [préfixe, préfixe + '~'[ sur l'index.
+Une requête par boîte englobante parcourt seulement les cellules qui la
+couvrent, puis les points sont regroupés en SQL (GROUP BY préfixe) avec une
+précision qui dépend du niveau de zoom.
+"""
+import math
+
+from django.db.models import Avg, Count, Min, Q
+from django.db.models.functions import Substr
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION_STOCKEE = 9
+RAYON_TERRE_KM = 6371.0088
+
+# Au-delà, la requête couvre trop de cellules : on baisse la précision
+CELLULES_MAX = 32
+
+# Niveau de zoom (Leaflet / OSM) -> longueur du préfixe de regroupement ; None = points individuels
+PRECISION_PAR_ZOOM = [
+    (3, 2), (5, 3), (8, 4), (11, 5), (13, 6), (15, 7),
+]
+
+
+def encoder(lat, lng, precision=PRECISION_STOCKEE):
+    """Géohash de (lat, lng)."""
+    lat_min, lat_max, lng_min, lng_max = -90.0, 90.0, -180.0, 180.0
+    resultat, bits, valeur, pair = [], 0, 0, True
+    while len(resultat) < precision:
+        if pair:
+            milieu = (lng_min + lng_max) / 2
+            if lng >= milieu:
+                valeur, lng_min = valeur * 2 + 1, milieu
+            else:
+                valeur, lng_max = valeur * 2, milieu
+        else:
+            milieu = (lat_min + lat_max) / 2
+            if lat >= milieu:
+                valeur, lat_min = valeur * 2 + 1, milieu
+            else:
+                valeur, lat_max = valeur * 2, milieu
+        pair = not pair
+        bits += 1
+        if bits == 5:
+            resultat.append(BASE32[valeur])
+            bits, valeur = 0, 0
+    return ''.join(resultat)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Distance haversine entre deux points (km)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * RAYON_TERRE_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def taille_cellule(precision):
+    """(hauteur en degrés de latitude, largeur en degrés de longitude) d'une cellule."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def cellules(sud, ouest, nord, est, precision):
+    """Géohashs des cellules couvrant la boîte, à la précision donnée."""
+    hauteur, largeur = taille_cellule(precision)
+    resultat = set()
+    lat = math.floor((sud + 90) / hauteur) * hauteur - 90 + hauteur / 2
+    while lat - hauteur / 2 <= nord and lat < 90:
+        lng = math.floor((ouest + 180) / largeur) * largeur - 180 + largeur / 2
+        while lng - largeur / 2 <= est and lng < 180:
+            resultat.add(encoder(lat, lng, precision))
+            lng += largeur
+        lat += hauteur
+    return resultat
+
+
+def _nombre_cellules(sud, ouest, nord, est, precision):
+    hauteur, largeur = taille_cellule(precision)
+    lignes = math.floor((nord + 90) / hauteur) - math.floor((sud + 90) / hauteur) + 1
+    colonnes = math.floor((est + 180) / largeur) - math.floor((ouest + 180) / largeur) + 1
+    return lignes * colonnes
+
+
+def couverture(sud, ouest, nord, est):
+    """Cellules les plus fines possibles (au plus CELLULES_MAX) couvrant la boîte."""
+    precision = 1
+    while precision < PRECISION_STOCKEE and _nombre_cellules(sud, ouest, nord, est, precision + 1) <= CELLULES_MAX:
+        precision += 1
+    return cellules(sud, ouest, nord, est, precision)
+
+
+def filtrer_boite(queryset, sud, ouest, nord, est):
+    """Restreint `queryset` aux commandes dans la boîte, via des intervalles sur l'index geohash."""
+    intervalles = Q()
+    for cellule in couverture(sud, ouest, nord, est):
+        intervalles |= Q(geohash__gte=cellule, geohash__lt=cellule + '~')
+    return queryset.filter(intervalles).filter(
+        latitude__gte=sud, latitude__lte=nord, longitude__gte=ouest, longitude__lte=est,
+    )
+
+
+def precision_regroupement(zoom):
+    for zoom_max, precision in PRECISION_PAR_ZOOM:
+        if zoom <= zoom_max:
+            return precision
+    return None
+
+
+def regrouper(queryset, zoom):
+    """
+    Regroupe les commandes par cellule selon le zoom (une requête GROUP BY).
+    Retourne une liste de (lng, lat, nombre, id) ; id n'est renseigné que pour un point isolé.
+    """
+    precision = precision_regroupement(zoom)
+    if precision is None:
+        return [
+            (float(lng), float(lat), 1, pk)
+            for pk, lat, lng in queryset.order_by().values_list('id', 'latitude', 'longitude')
+        ]
+
+    groupes = (
+        queryset.order_by()
+        .annotate(cellule=Substr('geohash', 1, precision))
+        .values('cellule')
+        .annotate(nombre=Count('id'), lat=Avg('latitude'), lng=Avg('longitude'), premier=Min('id'))
+    )
+    return [
+        (round(float(g['lng']), 6), round(float(g['lat']), 6), g['nombre'], g['premier'] if g['nombre'] == 1 else None)
+        for g in groupes
+    ]
+
+
+def geojson(points):
+    """FeatureCollection compacte : un Point par groupe, avec `n` (effectif) et `id` pour un point isolé."""
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+                'properties': {'n': nombre, 'id': pk} if pk is not None else {'n': nombre},
+            }
+            for lng, lat, nombre, pk in points
+        ],
+    }
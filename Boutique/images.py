@@ -0,0 +1,125 @@
+"""
+Variantes redimensionnées des images téléversées (produits, photos de profil).
+
+Pour chaque image, on génère plusieurs largeurs (miniature, carte, détail)
+en WebP et en JPEG, stockées à côté des médias sous `variants/`.
+Les gabarits les servent via `srcset` (voir templatetags/boutique_images.py).
+
+Une fois les variantes écrites, le nom de l'image est recopié dans le champ
+`<champ>_variantes` du modèle (Produit.image_variantes, UserProfile.photo_variantes) :
+l'affichage sait si elles existent sans interroger le stockage, et un
+changement d'image (nom différent) retombe sur l'original jusqu'à la
+génération suivante.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Largeur maximale (px) de chaque variante
+VARIANTES = {
+    'thumbnail': 160,
+    'card': 480,
+    'detail': 1200,
+}
+
+# Format Pillow, extension, options d'enregistrement
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+DOSSIER = 'variants'
+
+
+def chemin_variante(nom, variante, fmt):
+    """'produits/logo.jpg' -> 'variants/produits/logo__card.webp'"""
+    base, _ = os.path.splitext(nom)
+    return f"{DOSSIER}/{base}__{variante}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def generer_variantes(nom, storage=None, force=False):
+    """
+    Génère toutes les variantes de l'image `nom` (chemin dans le stockage).
+    Retourne le nombre de fichiers écrits ; 0 si l'image est illisible.
+    """
+    storage = storage or default_storage
+    if not nom or not storage.exists(nom):
+        return 0
+    if not force and variantes_presentes(nom, storage):
+        return 0
+
+    try:
+        with storage.open(nom, 'rb') as fichier:
+            image = Image.open(fichier)
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (UnidentifiedImageError, OSError):
+        return 0
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    ecrits = 0
+    for variante, largeur in VARIANTES.items():
+        copie = image.copy()
+        if copie.width > largeur:
+            copie.thumbnail((largeur, largeur * 10), Image.Resampling.LANCZOS)
+        for fmt, (format_pil, options) in FORMATS.items():
+            rendu = copie.convert('RGB') if format_pil == 'JPEG' else copie
+            tampon = BytesIO()
+            rendu.save(tampon, format_pil, **options)
+            cible = chemin_variante(nom, variante, fmt)
+            if storage.exists(cible):
+                storage.delete(cible)
+            storage.save(cible, ContentFile(tampon.getvalue()))
+            ecrits += 1
+    return ecrits
+
+
+def variantes_presentes(nom, storage=None):
+    """True si toutes les variantes de `nom` sont dans le stockage (interroge le stockage)."""
+    storage = storage or default_storage
+    return all(storage.exists(chemin_variante(nom, v, f)) for v in VARIANTES for f in FORMATS)
+
+
+def champ_variantes(fieldfile):
+    return f'{fieldfile.field.name}_variantes'
+
+
+def generer_pour_champ(fieldfile, force=True):
+    """
+    Génère les variantes d'un ImageField (ignoré s'il est vide) et enregistre
+    sur l'instance le nom de l'image dont les variantes sont disponibles.
+    """
+    if not fieldfile:
+        return 0
+    ecrits = generer_variantes(fieldfile.name, fieldfile.storage, force=force)
+    instance = fieldfile.instance
+    completes = ecrits == len(VARIANTES) * len(FORMATS) or variantes_presentes(fieldfile.name, fieldfile.storage)
+    nom = fieldfile.name if completes else ''
+    setattr(instance, champ_variantes(fieldfile), nom)
+    if instance.pk is not None:
+        type(instance).objects.filter(pk=instance.pk).update(**{champ_variantes(fieldfile): nom})
+    return ecrits
+
+
+def variantes_disponibles(fieldfile):
+    """True si les variantes de cette image ont été générées (sans accès au stockage)."""
+    if not fieldfile:
+        return False
+    return getattr(fieldfile.instance, champ_variantes(fieldfile), '') == fieldfile.name
+
+
+def srcset(fieldfile, fmt='jpeg'):
+    """Valeur d'attribut srcset : 'url 160w, url 480w, url 1200w'."""
+    storage = fieldfile.storage
+    return ', '.join(
+        f"{storage.url(chemin_variante(fieldfile.name, v, fmt))} {largeur}w"
+        for v, largeur in VARIANTES.items()
+    )
+
+
+def url_variante(fieldfile, variante='card', fmt='jpeg'):
+    return fieldfile.storage.url(chemin_variante(fieldfile.name, variante, fmt))
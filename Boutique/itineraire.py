@@ -0,0 +1,141 @@
+"""
+Ordre de passage d'un livreur chez ses clients.
+
+À partir de la position du livreur et des coordonnées de ses commandes en
+cours : matrice des distances (haversine), construction par plus proche
+voisin, puis amélioration 2-opt jusqu'à ce qu'aucune inversion de segment
+ne raccourcisse la tournée. Tous les calculs sont vectorisés avec NumPy
+(une itération 2-opt évalue toutes les paires d'arêtes d'un coup) : une
+cinquantaine d'arrêts se planifient en quelques millisecondes.
+
+C'est une heuristique, pas l'optimum : sur des tournées aléatoires de
+7 arrêts, l'écart à la recherche exhaustive est d'environ 1,5 % en
+moyenne mais atteint 15 à 20 % dans les pires cas (voir ItineraireTests).
+
+La tournée est un chemin ouvert : elle part du livreur et s'arrête au
+dernier client (pas de retour au point de départ).
+"""
+import numpy as np
+
+from .geo import RAYON_TERRE_KM
+from .livraison import commandes_livreur
+from .positions import derniere_position
+
+# Gain minimal (km) pour appliquer une inversion 2-opt
+EPSILON = 1e-9
+
+
+class Itineraire:
+    """Résultat : identifiants des commandes dans l'ordre de passage et distances."""
+
+    __slots__ = ('ordre', 'etapes', 'distance_km')
+
+    def __init__(self, ordre, etapes, distance_km):
+        self.ordre = ordre
+        self.etapes = etapes
+        self.distance_km = distance_km
+
+    def as_dict(self):
+        return {'ordre': self.ordre, 'etapes': self.etapes, 'distance_km': self.distance_km}
+
+
+def matrice_distances(coordonnees):
+    """Distances haversine (km) entre tous les points [(lat, lng), ...]."""
+    rad = np.radians(np.asarray(coordonnees, dtype=float))
+    lat, lng = rad[:, 0], rad[:, 1]
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * RAYON_TERRE_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def plus_proche_voisin(distances, depart=0):
+    """Chemin glouton partant de `depart` : à chaque pas, le point non visité le plus proche."""
+    n = len(distances)
+    visite = np.zeros(n, dtype=bool)
+    chemin = [depart]
+    visite[depart] = True
+    for _ in range(n - 1):
+        ligne = np.where(visite, np.inf, distances[chemin[-1]])
+        suivant = int(np.argmin(ligne))
+        chemin.append(suivant)
+        visite[suivant] = True
+    return np.array(chemin)
+
+
+def deux_opt(distances, chemin):
+    """
+    Améliore un chemin ouvert (premier point fixe) par inversions 2-opt.
+    Un nœud fictif à distance nulle de tous les points ferme le chemin, ce qui
+    ramène le cas ouvert à la formule classique sur les paires d'arêtes.
+    """
+    n = len(distances)
+    if n < 4:
+        return chemin
+
+    etendue = np.zeros((n + 1, n + 1))
+    etendue[:n, :n] = distances
+    chemin = np.append(chemin, n)
+    triangle = np.triu(np.ones((n, n), dtype=bool), k=2)
+
+    while True:
+        a, b = chemin[:-1], chemin[1:]
+        aretes = etendue[a, b]
+        # Remplacer (a[x], b[x]) et (a[y], b[y]) par (a[x], a[y]) et (b[x], b[y])
+        gains = etendue[np.ix_(a, a)] + etendue[np.ix_(b, b)] - aretes[:, None] - aretes[None, :]
+        gains = np.where(triangle, gains, np.inf)
+        x, y = np.unravel_index(np.argmin(gains), gains.shape)
+        if gains[x, y] >= -EPSILON:
+            return chemin[:-1]
+        chemin[x + 1:y + 1] = chemin[x + 1:y + 1][::-1].copy()
+
+
+def planifier(arrets, depart=None):
+    """
+    `arrets` : [(identifiant, lat, lng), ...] ; `depart` : (lat, lng) du livreur ou None.
+    Sans position de départ, la tournée commence par l'arrêt le plus excentré.
+    """
+    if not arrets:
+        return Itineraire([], [], 0.0)
+
+    coordonnees = [(lat, lng) for _, lat, lng in arrets]
+    decalage = 0
+    if depart is not None:
+        coordonnees.insert(0, depart)
+        decalage = 1
+    distances = matrice_distances(coordonnees)
+
+    if depart is not None:
+        debut = 0
+    else:
+        debut = int(np.argmax(distances.sum(axis=1)))
+    chemin = deux_opt(distances, plus_proche_voisin(distances, debut))
+
+    troncons = distances[chemin[:-1], chemin[1:]]
+    cumul = np.concatenate(([0.0], np.cumsum(troncons)))
+    etapes = []
+    for rang, point in enumerate(chemin):
+        if point < decalage:
+            continue
+        identifiant, lat, lng = arrets[point - decalage]
+        etapes.append({
+            'id': identifiant,
+            'lat': lat,
+            'lng': lng,
+            'troncon_km': round(float(troncons[rang - 1]), 3) if rang else 0.0,
+            'cumul_km': round(float(cumul[rang]), 3),
+        })
+    return Itineraire([e['id'] for e in etapes], etapes, round(float(troncons.sum()), 3))
+
+
+def itineraire_livreur(user):
+    """Tournée des commandes en cours du livreur, depuis sa dernière position connue."""
+    arrets = [
+        (pk, float(lat), float(lng))
+        for pk, lat, lng in commandes_livreur(user)
+        .filter(statut='EN_COURS', latitude__isnull=False, longitude__isnull=False)
+        .values_list('id', 'latitude', 'longitude')
+    ]
+    position = derniere_position(user.pk)
+    depart = (position['lat'], position['lng']) if position else None
+    return planifier(arrets, depart)
@@ -0,0 +1,161 @@
+"""
+Services des livreurs.
+
+Chaque commande est soit dans la file commune (en attente, sans livreur),
+soit attribuée à un livreur (`Commande.livreur`). Les deux files sont
+servies par des index dédiés (voir Commande.Meta.indexes). Un livreur
+prend une commande par un UPDATE conditionnel : si deux livreurs cliquent
+en même temps, un seul l'obtient, sans verrou.
+
+Les statistiques d'un livreur (commandes par statut, livraisons du jour et
+du mois, revenus) sont calculées par une seule requête d'agrégation
+conditionnelle (`Count(filter=Q(...))`) puis gardées en cache par livreur.
+Toute modification d'une de ses commandes renouvelle la version de ses
+statistiques (voir signals.py), ce qui rend l'entrée en cache obsolète ;
+la date du jour fait aussi partie de la clé.
+"""
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import diffusion
+from .constants import FRAIS_LIVRAISON_DEFAUT
+from .models import Commande
+from .utils import envoyer_mail_statut_commande
+
+# Les compteurs "aujourd'hui" dépendent de l'heure : durée de vie courte
+TTL_STATS = 60 * 5
+
+# Transitions autorisées pour un livreur : action -> (statut attendu, nouveau statut)
+TRANSITIONS = {
+    'complete': ('EN_COURS', 'LIVREE'),
+    'release': ('EN_COURS', 'EN_ATTENTE'),
+}
+
+
+# ===================================================================
+# FILES DE COMMANDES
+# ===================================================================
+
+def commandes_livreur(user):
+    """Commandes attribuées au livreur (index commande_livreur_statut_idx)."""
+    return Commande.objects.filter(livreur=user).select_related('user').order_by('-id')
+
+
+def file_commune():
+    """Commandes en attente que personne n'a prises (index partiel commande_file_commune_idx)."""
+    return (
+        Commande.objects.filter(statut='EN_ATTENTE', livreur__isnull=True)
+        .select_related('user').order_by('-id')
+    )
+
+
+def prendre_commande(commande_id, livreur):
+    """
+    Attribue une commande de la file commune au livreur et la passe en cours.
+    Retourne la commande, ou None si elle a déjà été prise (ou n'est plus en attente).
+    """
+    with transaction.atomic():
+        pris = Commande.objects.filter(pk=commande_id, statut='EN_ATTENTE', livreur__isnull=True).update(
+            livreur=livreur, statut='EN_COURS', updated_at=timezone.now(),
+        )
+        if not pris:
+            return None
+        commande = Commande.objects.select_related('user').get(pk=commande_id)
+        envoyer_mail_statut_commande(commande, statut_precedent='EN_ATTENTE')
+        transaction.on_commit(lambda: invalider_stats(livreur.pk))
+        transaction.on_commit(lambda: diffusion.publier_statut(commande))
+    return commande
+
+
+def changer_statut(commande_id, livreur, action):
+    """
+    Applique une action du livreur sur une de ses commandes ('complete' : livrée,
+    'release' : remise dans la file commune). Retourne la commande, ou None si
+    la transition n'est pas permise.
+    """
+    if action not in TRANSITIONS:
+        return None
+    attendu, nouveau = TRANSITIONS[action]
+    champs = {'statut': nouveau, 'updated_at': timezone.now()}
+    if nouveau == 'EN_ATTENTE':
+        champs['livreur'] = None
+
+    with transaction.atomic():
+        if not Commande.objects.filter(pk=commande_id, livreur=livreur, statut=attendu).update(**champs):
+            return None
+        commande = Commande.objects.select_related('user').get(pk=commande_id)
+        if nouveau != 'EN_ATTENTE':
+            envoyer_mail_statut_commande(commande, statut_precedent=attendu)
+        transaction.on_commit(lambda: invalider_stats(livreur.pk))
+        transaction.on_commit(lambda: diffusion.publier_statut(commande))
+    return commande
+
+
+# ===================================================================
+# STATISTIQUES
+# ===================================================================
+
+def _cle_version_stats(livreur_id):
+    return f'livraison:{livreur_id}:stats:version'
+
+
+def _version_stats(livreur_id):
+    cle = _cle_version_stats(livreur_id)
+    v = cache.get(cle)
+    if v is None:
+        cache.add(cle, time.time_ns(), timeout=None)
+        v = cache.get(cle)
+    return v
+
+
+def invalider_stats(*livreur_ids):
+    """Rend obsolètes les statistiques en cache des livreurs donnés."""
+    # Valeur neuve plutôt qu'incr : deux invalidations simultanées ne donnent
+    # jamais la même version (même raisonnement que panier.invalider_panier)
+    for livreur_id in set(filter(None, livreur_ids)):
+        cache.set(_cle_version_stats(livreur_id), time.time_ns(), timeout=None)
+
+
+def calculer_stats(commandes):
+    """Statistiques d'un ensemble de commandes, en une requête."""
+    maintenant = timezone.localtime()
+    debut_jour = maintenant.replace(hour=0, minute=0, second=0, microsecond=0)
+    debut_mois = debut_jour.replace(day=1)
+    livree = Q(statut='LIVREE')
+
+    totaux = commandes.order_by().aggregate(
+        count_all=Count('id'),
+        pending=Count('id', filter=Q(statut='EN_ATTENTE')),
+        in_progress=Count('id', filter=Q(statut='EN_COURS')),
+        completed=Count('id', filter=livree),
+        delivered_today=Count('id', filter=livree & Q(
+            date_commande__gte=debut_jour, date_commande__lt=debut_jour + timedelta(days=1)
+        )),
+        delivered_month=Count('id', filter=livree & Q(date_commande__gte=debut_mois)),
+    )
+
+    # Seules les commandes livrées génèrent des revenus pour le livreur
+    frais = FRAIS_LIVRAISON_DEFAUT
+    return {
+        'count_all': totaux['count_all'],
+        'pending': totaux['pending'],
+        'in_progress': totaux['in_progress'],
+        'completed': totaux['completed'],
+        'delivered_today': totaux['delivered_today'],
+        'revenue_total': totaux['completed'] * frais,
+        'revenue_today': totaux['delivered_today'] * frais,
+        'revenue_this_month': totaux['delivered_month'] * frais,
+        'frais_livraison': frais,
+    }
+
+
+def stats_livreur(user):
+    """Statistiques du livreur, lues en cache ou recalculées (une requête)."""
+    jour = timezone.localdate().isoformat()
+    cle = f'livraison:{user.pk}:stats:{_version_stats(user.pk)}:{jour}'
+    return cache.get_or_set(cle, lambda: calculer_stats(commandes_livreur(user)), TTL_STATS)
@@ -0,0 +1,53 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F
+
+from Boutique import images
+from Boutique.models import Produit, UserProfile
+
+
+def _traiter(args):
+    nom, force = args
+    return nom, images.generer_variantes(nom, force=force), images.variantes_presentes(nom)
+
+
+class Command(BaseCommand):
+    help = "Génère les variantes redimensionnées (WebP/JPEG) des images produits et photos de profil existantes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Nombre de processus (défaut : nombre de CPU).")
+        parser.add_argument('--force', action='store_true',
+                            help="Régénère même les variantes déjà présentes.")
+
+    def handle(self, *args, **options):
+        noms = set(Produit.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True))
+        noms |= set(UserProfile.objects.exclude(photo='').exclude(photo__isnull=True).values_list('photo', flat=True))
+        taches = [(nom, options['force']) for nom in sorted(noms)]
+        if not taches:
+            self.stdout.write("Aucune image à traiter.")
+            return
+
+        # Les processus fils n'utilisent pas la base : ne pas leur léguer la connexion
+        connections.close_all()
+        total = 0
+        prets = []
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            for nom, ecrits, presentes in executor.map(_traiter, taches, chunksize=4):
+                total += ecrits
+                if presentes:
+                    prets.append(nom)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{nom} : {ecrits} fichier(s)")
+
+        # Les gabarits lisent ces champs au lieu d'interroger le stockage
+        for i in range(0, len(prets), 500):
+            lot = prets[i:i + 500]
+            Produit.objects.filter(image__in=lot).update(image_variantes=F('image'))
+            UserProfile.objects.filter(photo__in=lot).update(photo_variantes=F('photo'))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(taches)} image(s) traitée(s), {total} variante(s) écrite(s)."
+        ))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Boutique import dispatch
+from Boutique.checks import cache_partage
+
+
+class Command(BaseCommand):
+    help = "Attribue les commandes en attente aux livreurs disponibles les plus proches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Tourne en continu au lieu d'un seul passage.")
+        parser.add_argument('--interval', type=float, default=dispatch.INTERVALLE,
+                            help="Attente (secondes) entre deux passages (avec --loop).")
+        parser.add_argument('--batch-size', type=int, default=dispatch.TAILLE_LOT,
+                            help="Commandes lues par requête dans la file commune.")
+        parser.add_argument('--capacity', type=int, default=dispatch.CAPACITE_LIVREUR,
+                            help="Commandes en cours au maximum par livreur.")
+        parser.add_argument('--radius', type=float, default=dispatch.RAYON_MAX_KM,
+                            help="Distance maximale (km) entre le livreur et la commande.")
+
+    def handle(self, *args, **options):
+        if not cache_partage():
+            raise CommandError(
+                "Cache local au processus : cette commande ne verrait pas les positions "
+                "reçues par les workers web. Configurer REDIS_URL (voir settings.CACHES)."
+            )
+        while True:
+            attributions = dispatch.repartir(options['batch_size'], options['capacity'], options['radius'])
+            self.stdout.write(f"{len(attributions)} commande(s) attribuée(s).")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Boutique import positions
+from Boutique.checks import cache_partage
+
+
+class Command(BaseCommand):
+    help = "Écrit en base la dernière position GPS des livreurs (un UPDATE groupé par passage)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Tourne en continu au lieu d'un seul passage.")
+        parser.add_argument('--interval', type=float, default=positions.INTERVALLE_VIDAGE,
+                            help="Attente (secondes) entre deux passages (avec --loop).")
+
+    def handle(self, *args, **options):
+        if not cache_partage():
+            raise CommandError(
+                "Cache local au processus : cette commande ne verrait pas les positions "
+                "reçues par les workers web. Configurer REDIS_URL (voir settings.CACHES)."
+            )
+        while True:
+            total = positions.vider()
+            self.stdout.write(f"{total} commande(s) mise(s) à jour.")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
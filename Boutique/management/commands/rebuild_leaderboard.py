@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from Boutique import classement
+
+
+class Command(BaseCommand):
+    help = "Recalcule la moyenne globale et le classement bayésien de tous les produits."
+
+    def handle(self, *args, **options):
+        total = classement.reconstruire()
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} produit(s) classé(s) (moyenne globale : {classement.moyenne_globale():.2f})."
+        ))
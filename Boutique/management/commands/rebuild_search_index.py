@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from Boutique import search
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des produits."
+
+    def handle(self, *args, **options):
+        if not search.moteur():
+            self.stdout.write(self.style.WARNING(
+                "Aucun index plein texte pour ce moteur de base de données : recherche icontains utilisée."
+            ))
+            return
+        total = search.reconstruire_index()
+        self.stdout.write(self.style.SUCCESS(f"{total} produit(s) indexé(s)."))
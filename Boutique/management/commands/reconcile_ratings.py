@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Boutique import notation
+
+
+class Command(BaseCommand):
+    help = "Recalcule rating_sum et rating_count de tous les produits à partir des notes."
+
+    def handle(self, *args, **options):
+        total = notation.reconcilier()
+        self.stdout.write(self.style.SUCCESS(f"{total} produit(s) recalculé(s)."))
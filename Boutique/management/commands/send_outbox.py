@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Boutique import outbox
+
+
+class Command(BaseCommand):
+    help = "Envoie les e-mails en attente de la file (outbox) par lots, sur une connexion SMTP réutilisée."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.TAILLE_LOT,
+                            help="Nombre de messages réservés par lot.")
+        parser.add_argument('--loop', action='store_true',
+                            help="Tourne en continu au lieu de vider la file une fois.")
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help="Attente (secondes) entre deux passages quand la file est vide (avec --loop).")
+
+    def handle(self, *args, **options):
+        total_envoyes = total_echecs = 0
+        while True:
+            envoyes, echecs = outbox.traiter_file(options['batch_size'])
+            total_envoyes += envoyes
+            total_echecs += echecs
+            if envoyes or echecs:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total_envoyes} e-mail(s) envoyé(s), {total_echecs} échec(s) replanifié(s)."
+        ))
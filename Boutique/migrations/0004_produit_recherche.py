@@ -0,0 +1,28 @@
+from django.db import migrations
+
+from Boutique import search
+
+
+def creer_index(apps, schema_editor):
+    search.creer_index(schema_editor)
+    # Indexer les produits déjà présents
+    Produit = apps.get_model('Boutique', 'Produit')
+    if search.moteur(schema_editor.connection):
+        search.indexer_lignes(
+            Produit.objects.using(schema_editor.connection.alias).values_list('id', 'nom', 'description')
+        )
+
+
+def supprimer_index(apps, schema_editor):
+    search.supprimer_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0003_alter_categorie_options_categorie_is_active_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calculer_agregats(apps, schema_editor):
+    Produit = apps.get_model('Boutique', 'Produit')
+    Note = apps.get_model('Boutique', 'Note')
+    notes = Note.objects.filter(produit=OuterRef('pk')).order_by().values('produit')
+    Produit.objects.update(
+        rating_sum=Coalesce(Subquery(notes.annotate(s=Sum('valeur')).values('s'), output_field=IntegerField()), Value(0)),
+        rating_count=Coalesce(Subquery(notes.annotate(c=Count('pk')).values('c'), output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0004_produit_recherche'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Nombre de notes'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Somme des notes'),
+        ),
+        migrations.RunPython(calculer_agregats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:12
+
+from django.db import migrations, models
+
+
+def calculer_chemins(apps, schema_editor):
+    Categorie = apps.get_model('Boutique', 'Categorie')
+    categories = {c.pk: c for c in Categorie.objects.all()}
+
+    def remplir(c, visites=()):
+        if c.chemin:
+            return
+        parent = categories.get(c.parent_id)
+        if parent is None or parent.pk in visites:
+            c.chemin, c.nom_complet, c.profondeur = f"{c.pk}/", c.nom, 0
+            return
+        remplir(parent, visites + (c.pk,))
+        c.chemin = f"{parent.chemin}{c.pk}/"
+        c.nom_complet = f"{parent.nom_complet}/{c.nom}"
+        c.profondeur = parent.profondeur + 1
+
+    for c in categories.values():
+        remplir(c)
+    Categorie.objects.bulk_update(categories.values(), ['chemin', 'nom_complet', 'profondeur'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0005_produit_rating_sum_produit_rating_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categorie',
+            name='chemin',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='categorie',
+            name='nom_complet',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='categorie',
+            name='profondeur',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calculer_chemins, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+from Boutique.constants import CLASSEMENT_NOTE_A_PRIORI, CLASSEMENT_POIDS_A_PRIORI
+
+
+def remplir_classement(apps, schema_editor):
+    Produit = apps.get_model('Boutique', 'Produit')
+    ClassementProduit = apps.get_model('Boutique', 'ClassementProduit')
+    totaux = Produit.objects.aggregate(somme=Sum('rating_sum'), nombre=Sum('rating_count'))
+    moyenne = totaux['somme'] / totaux['nombre'] if totaux['nombre'] else CLASSEMENT_NOTE_A_PRIORI
+    ClassementProduit.objects.bulk_create(
+        [
+            ClassementProduit(
+                produit_id=pk,
+                score=(CLASSEMENT_POIDS_A_PRIORI * moyenne + somme) / (CLASSEMENT_POIDS_A_PRIORI + nombre),
+                note_moyenne=somme / nombre if nombre else 0,
+                nombre_notes=nombre,
+            )
+            for pk, somme, nombre in Produit.objects.values_list('id', 'rating_sum', 'rating_count')
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0006_categorie_chemin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassementProduit',
+            fields=[
+                ('produit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='classement', serialize=False, to='Boutique.produit')),
+                ('score', models.FloatField(default=0)),
+                ('note_moyenne', models.FloatField(default=0)),
+                ('nombre_notes', models.PositiveIntegerField(default=0)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Classement produit',
+                'verbose_name_plural': 'Classement des produits',
+                'indexes': [models.Index(fields=['-score', '-produit'], name='classement_score_idx')],
+            },
+        ),
+        migrations.RunPython(remplir_classement, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0007_classementproduit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
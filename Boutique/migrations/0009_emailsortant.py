@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0008_commande_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sujet', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('expediteur', models.CharField(blank=True, max_length=254)),
+                ('destinataires', models.JSONField(default=list)),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', "En cours d'envoi"), ('ENVOYE', 'Envoyé'), ('ECHEC', 'Échec définitif')], default='EN_ATTENTE', max_length=20)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('prochaine_tentative', models.DateTimeField(default=django.utils.timezone.now)),
+                ('jeton', models.CharField(blank=True, db_index=True, default='', max_length=32)),
+                ('bail_expire', models.DateTimeField(blank=True, null=True)),
+                ('derniere_erreur', models.TextField(blank=True, default='')),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_envoi', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'E-mail sortant',
+                'verbose_name_plural': 'E-mails sortants',
+                'indexes': [models.Index(fields=['statut', 'prochaine_tentative'], name='emailsortant_file_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0009_emailsortant'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='cle_idempotence',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='commande',
+            constraint=models.UniqueConstraint(fields=('user', 'cle_idempotence'), name='commande_cle_idempotence_unique'),
+        ),
+    ]
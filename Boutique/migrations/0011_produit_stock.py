@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0010_commande_cle_idempotence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def affecter_livreur(apps, schema_editor):
+    """
+    Les commandes déjà prises (en cours ou livrées) n'ont jamais enregistré leur livreur.
+    Lorsqu'il n'existe qu'un seul livreur, elles lui sont attribuées ; sinon elles
+    restent sans livreur (l'information n'existe pas) : les livrées gardent leur
+    historique, les en cours sont remises en attente par 0016. Les commandes en
+    attente restent dans la file commune.
+    """
+    UserProfile = apps.get_model('Boutique', 'UserProfile')
+    Commande = apps.get_model('Boutique', 'Commande')
+    livreurs = list(UserProfile.objects.filter(role='LIVREUR').values_list('user_id', flat=True)[:2])
+    if len(livreurs) == 1:
+        Commande.objects.filter(livreur__isnull=True, statut__in=['EN_COURS', 'LIVREE']).update(livreur_id=livreurs[0])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0011_produit_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='livreur',
+            field=models.ForeignKey(blank=True, limit_choices_to={'userprofile__role': 'LIVREUR'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='livraisons', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['livreur', 'statut', '-id'], name='commande_livreur_statut_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(condition=models.Q(('livreur__isnull', True)), fields=['statut', '-id'], name='commande_file_commune_idx'),
+        ),
+        migrations.RunPython(affecter_livreur, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:31
+
+from django.db import migrations, models
+
+from Boutique.geo import encoder
+
+
+def calculer_geohash(apps, schema_editor):
+    Commande = apps.get_model('Boutique', 'Commande')
+    commandes = list(
+        Commande.objects.filter(latitude__isnull=False, longitude__isnull=False).only('id', 'latitude', 'longitude')
+    )
+    for commande in commandes:
+        commande.geohash = encoder(float(commande.latitude), float(commande.longitude))
+    Commande.objects.bulk_update(commandes, ['geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0012_commande_livreur'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commande',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(calculer_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:48
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+from Boutique.constants import CLASSEMENT_NOTE_A_PRIORI, CLASSEMENT_POIDS_A_PRIORI
+
+
+def enregistrer_moyenne(apps, schema_editor):
+    """Fige la moyenne globale actuelle et recalcule les scores avec elle."""
+    Produit = apps.get_model('Boutique', 'Produit')
+    ClassementProduit = apps.get_model('Boutique', 'ClassementProduit')
+    MoyenneClassement = apps.get_model('Boutique', 'MoyenneClassement')
+    totaux = Produit.objects.aggregate(somme=Sum('rating_sum'), nombre=Sum('rating_count'))
+    moyenne = totaux['somme'] / totaux['nombre'] if totaux['nombre'] else CLASSEMENT_NOTE_A_PRIORI
+    MoyenneClassement.objects.create(pk=1, moyenne=moyenne)
+    ClassementProduit.objects.update(
+        score=(CLASSEMENT_POIDS_A_PRIORI * moyenne + F('note_moyenne') * F('nombre_notes'))
+        / (CLASSEMENT_POIDS_A_PRIORI + F('nombre_notes')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0013_commande_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoyenneClassement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('moyenne', models.FloatField()),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Moyenne du classement',
+            },
+        ),
+        migrations.RunPython(enregistrer_moyenne, migrations.RunPython.noop),
+    ]
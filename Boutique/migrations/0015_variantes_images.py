@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:55
+
+from django.db import migrations, models
+from django.db.models import F
+
+from Boutique.images import variantes_presentes
+
+
+def marquer_variantes_existantes(apps, schema_editor):
+    """Une seule fois : relève les images dont les variantes ont déjà été générées."""
+    for modele, champ in (('Produit', 'image'), ('UserProfile', 'photo')):
+        Modele = apps.get_model('Boutique', modele)
+        noms = set(Modele.objects.exclude(**{champ: ''}).exclude(**{f'{champ}__isnull': True})
+                   .values_list(champ, flat=True))
+        prets = [nom for nom in noms if variantes_presentes(nom)]
+        for i in range(0, len(prets), 500):
+            Modele.objects.filter(**{f'{champ}__in': prets[i:i + 500]}).update(**{f'{champ}_variantes': F(champ)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0014_moyenneclassement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='image_variantes',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='photo_variantes',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(marquer_variantes_existantes, migrations.RunPython.noop),
+    ]
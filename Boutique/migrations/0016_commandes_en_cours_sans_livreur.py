@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-17 14:05
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def remettre_en_attente(apps, schema_editor):
+    """
+    Commandes EN_COURS sans livreur : avec plusieurs livreurs, 0012 n'a pas pu
+    savoir qui les avait prises. Aucun livreur ne les voit dans « mes livraisons »
+    (filtre sur livreur) ni dans la file commune (filtre sur EN_ATTENTE) : elles
+    y retournent, pour être acceptées de nouveau ou attribuées par le dispatch.
+    Irréversible : le livreur d'origine n'a jamais été enregistré.
+    """
+    Commande = apps.get_model('Boutique', 'Commande')
+    Commande.objects.filter(statut='EN_COURS', livreur__isnull=True).update(
+        statut='EN_ATTENTE', updated_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Boutique', '0015_variantes_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(remettre_en_attente, migrations.RunPython.noop),
+    ]
@@ -2,11 +2,13 @@ from django.db import models
 
 # Create your models here.
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Avg
+from django.db.models import Avg, CharField, F, Subquery, TextField, Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 from django.utils.text import slugify
 
 
@@ -46,6 +48,12 @@ class Categorie(models.Model):
         default=True,
         verbose_name="Est active"
     )
+
+    # 5. Arborescence matérialisée (maintenue par save())
+    # chemin = identifiants des ancêtres puis de la catégorie, ex: "3/12/41/"
+    chemin = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
+    nom_complet = models.TextField(blank=True, default='', editable=False)
+    profondeur = models.PositiveSmallIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name = "Catégorie"
@@ -59,12 +67,57 @@ class Categorie(models.Model):
         return self.nom
 
     def save(self, *args, **kwargs):
-        """Génère le slug si le champ est vide ou s'il s'agit d'un nouvel enregistrement."""
+        """
+        Génère le slug si le champ est vide ou s'il s'agit d'un nouvel enregistrement,
+        puis maintient le chemin matérialisé de la catégorie et de ses descendants.
+        """
         if not self.slug or not self.pk:
             # Création du slug à partir du nom
             self.slug = slugify(self.nom)
-            
-        super().save(*args, **kwargs)
+
+        parent = None
+        if self.parent_id:
+            parent = Categorie.objects.filter(pk=self.parent_id).values(
+                'chemin', 'nom_complet', 'profondeur'
+            ).first()
+        ancien = None
+        if self.pk:
+            ancien = Categorie.objects.filter(pk=self.pk).values(
+                'chemin', 'nom_complet', 'profondeur'
+            ).first()
+        if parent and ancien and ancien['chemin'] and parent['chemin'].startswith(ancien['chemin']):
+            raise ValidationError("Une catégorie ne peut pas être rattachée à l'une de ses sous-catégories.")
+
+        prefixe = parent['chemin'] if parent else ''
+        self.nom_complet = f"{parent['nom_complet']}/{self.nom}" if parent else self.nom
+        self.profondeur = parent['profondeur'] + 1 if parent else 0
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'chemin', 'nom_complet', 'profondeur'}
+
+        with transaction.atomic():
+            if self.pk is None:
+                super().save(*args, **kwargs)
+                self.chemin = f"{prefixe}{self.pk}/"
+                Categorie.objects.filter(pk=self.pk).update(chemin=self.chemin)
+                return
+
+            self.chemin = f"{prefixe}{self.pk}/"
+            super().save(*args, **kwargs)
+            if ancien and ancien['chemin'] and (
+                ancien['chemin'] != self.chemin or ancien['nom_complet'] != self.nom_complet
+            ):
+                # Réécrit le préfixe de tout le sous-arbre en une seule requête
+                Categorie.objects.filter(chemin__startswith=ancien['chemin']).exclude(pk=self.pk).update(
+                    chemin=Concat(
+                        Value(self.chemin), Substr('chemin', len(ancien['chemin']) + 1),
+                        output_field=CharField(),
+                    ),
+                    nom_complet=Concat(
+                        Value(self.nom_complet), Substr('nom_complet', len(ancien['nom_complet']) + 1),
+                        output_field=TextField(),
+                    ),
+                    profondeur=F('profondeur') + (self.profondeur - ancien['profondeur']),
+                )
 
     # ----------------------------------------------------
     # Propriété Utile : Chemin complet
@@ -72,9 +125,47 @@ class Categorie(models.Model):
     @property
     def full_path(self):
         """Retourne le chemin complet de la catégorie (ex: Électronique/Téléphones)."""
-        if self.parent:
-            return f"{self.parent.full_path}/{self.nom}"
-        return self.nom
+        return self.nom_complet or self.nom
+
+    def descendants(self, inclure_soi=True):
+        """Sous-arbre de la catégorie (une seule requête sur le préfixe du chemin)."""
+        qs = Categorie.objects.filter(chemin__startswith=self.chemin)
+        if not inclure_soi:
+            qs = qs.exclude(pk=self.pk)
+        return qs
+
+    @classmethod
+    def arbre(cls, queryset=None):
+        """
+        Charge toute l'arborescence en une requête et retourne les racines ;
+        chaque nœud porte la liste de ses enfants dans `sous_categories`.
+        """
+        noeuds = list((queryset if queryset is not None else cls.objects.all()).order_by('nom'))
+        par_id = {c.pk: c for c in noeuds}
+        racines = []
+        for c in noeuds:
+            c.sous_categories = []
+        for c in noeuds:
+            parent = par_id.get(c.parent_id)
+            if parent is not None:
+                parent.sous_categories.append(c)
+            else:
+                racines.append(c)
+        return racines
+
+
+class ProduitQuerySet(models.QuerySet):
+
+    def dans_categorie(self, categorie_id):
+        """
+        Produits de la catégorie ou de l'une de ses sous-catégories, en une requête :
+        le chemin de la catégorie sert de préfixe dans une sous-requête.
+        """
+        chemin = Categorie.objects.filter(pk=categorie_id).values('chemin')[:1]
+        liens = Produit.categories.through.objects.filter(
+            categorie__chemin__startswith=Subquery(chemin)
+        ).values('produit_id')
+        return self.filter(pk__in=liens)
 
 
 class Produit(models.Model):
@@ -83,19 +174,35 @@ class Produit(models.Model):
     prix = models.DecimalField(max_digits=10, decimal_places=0)  
     prix_promo = models.DecimalField(max_digits=10, decimal_places=0, blank=True, null=True)
     image = models.ImageField(upload_to='produits/', blank=True, null=True)
+    # Nom de l'image dont les variantes ont été générées (voir images.py) ; évite de sonder le stockage
+    image_variantes = models.CharField(max_length=255, blank=True, default='', editable=False)
     categories = models.ManyToManyField(Categorie, related_name='produits')
     date_creation = models.DateTimeField(auto_now_add=True)
+    # Vide = stock non suivi (illimité) ; décrémenté à la commande (voir commandes.py)
+    stock = models.PositiveIntegerField(null=True, blank=True)
+
+    # Agrégats des notes, maintenus par les signaux de Note (voir notation.py)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name="Somme des notes")
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Nombre de notes")
+
+    objects = ProduitQuerySet.as_manager()
     
     def __str__(self):
         return self.nom
 
     @property
     def note_moyenne(self):
-        return self.notes.aggregate(Avg('valeur'))['valeur__avg'] or 0
+        if not self.rating_count:
+            return 0
+        return self.rating_sum / self.rating_count
     
     @property
     def nombre_notes(self):
-        return self.notes.count()
+        return self.rating_count
+
+    @property
+    def en_stock(self):
+        return self.stock is None or self.stock > 0
 
     @property
     def est_populaire(self):
@@ -106,6 +213,47 @@ class Produit(models.Model):
         return self.categories.first()
 
 
+class ClassementProduit(models.Model):
+    """
+    Classement précalculé des produits par moyenne bayésienne des notes
+    (maintenu par classement.py). Un produit peu noté reste proche de la
+    moyenne globale au lieu de passer en tête avec une seule note de 5.
+    """
+    produit = models.OneToOneField(
+        Produit, on_delete=models.CASCADE, primary_key=True, related_name='classement'
+    )
+    score = models.FloatField(default=0)
+    note_moyenne = models.FloatField(default=0)
+    nombre_notes = models.PositiveIntegerField(default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Classement produit"
+        verbose_name_plural = "Classement des produits"
+        indexes = [
+            models.Index(fields=['-score', '-produit'], name='classement_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.produit_id} - {self.score:.3f}"
+
+
+class MoyenneClassement(models.Model):
+    """
+    Moyenne globale des notes servant d'a priori au classement (une seule
+    ligne, pk=1). Figée à chaque reconstruction pour que tous les processus
+    calculent les scores avec la même valeur.
+    """
+    moyenne = models.FloatField()
+    date_maj = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Moyenne du classement"
+
+    def __str__(self):
+        return f"{self.moyenne:.3f}"
+
+
 class RoleChoices(models.TextChoices):
     CLIENT = 'CLIENT', 'Client'
     LIVREUR = 'LIVREUR', 'Livreur'
@@ -118,6 +266,7 @@ class UserProfile(models.Model):
     phone = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     photo = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    photo_variantes = models.CharField(max_length=255, blank=True, default='', editable=False)
     role = models.CharField(max_length=20, choices=RoleChoices.choices, default=RoleChoices.CLIENT)
 
     def __str__(self):
@@ -136,6 +285,13 @@ class Note(models.Model):
     class Meta:
         unique_together = ('produit', 'user')  # Un utilisateur ne peut noter qu'une fois
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Mémorise l'état chargé pour calculer le delta lors d'une modification
+        instance._etat_initial = (instance.__dict__.get('produit_id'), instance.__dict__.get('valeur'))
+        return instance
+
 
 class Commande(models.Model):
     STATUT_CHOICES = [
@@ -147,6 +303,8 @@ class Commande(models.Model):
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     date_commande = models.DateTimeField(auto_now_add=True)
+    # Mis à jour à chaque modification (sert aussi aux ETag / Last-Modified)
+    updated_at = models.DateTimeField(auto_now=True)
     statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='EN_ATTENTE')
     total = models.DecimalField(max_digits=10, decimal_places=2)
 
@@ -154,15 +312,59 @@ class Commande(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     adresse_gps = models.TextField(blank=True, null=True, help_text="Adresse formatée via géocodage inverse")
+    # Géohash de (latitude, longitude), recalculé à l'enregistrement (voir geo.py)
+    geohash = models.CharField(max_length=12, blank=True, null=True, db_index=True, editable=False)
     
     # Position du livreur (mise à jour en temps réel)
     latitude_livreur = models.DecimalField(max_digits=10, decimal_places=8, null=True, blank=True)
     longitude_livreur = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True)
     derniere_maj_position = models.DateTimeField(null=True, blank=True)
 
+    # Livreur qui a pris la commande (vide = dans la file commune, voir livraison.py)
+    livreur = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='livraisons', limit_choices_to={'userprofile__role': 'LIVREUR'},
+    )
+
+    # Clé d'idempotence envoyée par le formulaire de confirmation (double envoi = même commande)
+    cle_idempotence = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'cle_idempotence'], name='commande_cle_idempotence_unique'),
+        ]
+        indexes = [
+            # File d'un livreur : WHERE livreur_id = ? [AND statut = ?] ORDER BY id DESC
+            models.Index(fields=['livreur', 'statut', '-id'], name='commande_livreur_statut_idx'),
+            # File commune : commandes en attente sans livreur
+            models.Index(
+                fields=['statut', '-id'], name='commande_file_commune_idx',
+                condition=models.Q(livreur__isnull=True),
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Livreur chargé depuis la base : permet d'invalider aussi ses statistiques en cas de réaffectation
+        instance._livreur_initial = instance.__dict__.get('livreur_id')
+        return instance
+
     def __str__(self):
         return f"Commande #{self.id} - {self.user.username}"
 
+    def save(self, *args, **kwargs):
+        from .geo import encoder
+
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encoder(float(self.latitude), float(self.longitude))
+        else:
+            self.geohash = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
     @property
     def position_client(self):
         if self.latitude_client and self.longitude_client:
@@ -208,12 +410,15 @@ class PanierItem(models.Model):
 
     def prix_total(self):
         """Calcule le prix total pour cet item (quantité × prix)"""
-        prix = self.produit.prix_promo if self.produit.prix_promo else self.produit.prix
-        return prix * self.quantite
+        if hasattr(self, 'total_ligne'):
+            return self.total_ligne
+        return self.prix_unitaire() * self.quantite
 
     def prix_unitaire(self):
-        """Retourne le prix unitaire (avec promo si applicable)"""
-        return self.produit.prix_promo if self.produit.prix_promo else self.produit.prix
+        """Retourne le prix unitaire (avec promo si applicable) ; voir tarification.py"""
+        if hasattr(self, 'prix_applique'):
+            return self.prix_applique
+        return self.produit.prix_promo if self.produit.prix_promo is not None else self.produit.prix
 
 class Adresse(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='adresses')
@@ -245,4 +450,41 @@ class Avis(models.Model):
     date_avis = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f'{self.produit.nom} - {self.valeur}/5'
\ No newline at end of file
+        return f'{self.produit.nom} - {self.valeur}/5'
+
+
+class EmailSortant(models.Model):
+    """
+    File d'attente des e-mails (outbox). Les vues enregistrent le message ;
+    la commande `send_outbox` les envoie par lots (voir outbox.py).
+    """
+    STATUT_CHOICES = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours d\'envoi'),
+        ('ENVOYE', 'Envoyé'),
+        ('ECHEC', 'Échec définitif'),
+    ]
+
+    sujet = models.CharField(max_length=255)
+    message = models.TextField()
+    expediteur = models.CharField(max_length=254, blank=True)
+    destinataires = models.JSONField(default=list)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='EN_ATTENTE')
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    prochaine_tentative = models.DateTimeField(default=timezone.now)
+    # Réservation par un worker : jeton + échéance du bail
+    jeton = models.CharField(max_length=32, blank=True, default='', db_index=True)
+    bail_expire = models.DateTimeField(null=True, blank=True)
+    derniere_erreur = models.TextField(blank=True, default='')
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_envoi = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "E-mail sortant"
+        verbose_name_plural = "E-mails sortants"
+        indexes = [
+            models.Index(fields=['statut', 'prochaine_tentative'], name='emailsortant_file_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sujet} -> {', '.join(self.destinataires)} ({self.statut})"
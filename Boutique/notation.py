@@ -0,0 +1,67 @@
+"""
+Agrégats de notes dénormalisés sur Produit (rating_sum / rating_count).
+
+Les compteurs sont mis à jour par des UPDATE atomiques avec F() à chaque
+création, modification ou suppression d'une Note, ce qui évite d'agréger
+la table Note à chaque affichage d'un produit.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def appliquer_delta(produit_id, somme, nombre, using=None):
+    """Ajoute `somme` à rating_sum et `nombre` à rating_count en une requête."""
+    from .models import Produit
+
+    if not produit_id or (not somme and not nombre):
+        return
+    Produit.objects.using(using).filter(pk=produit_id).update(
+        rating_sum=F('rating_sum') + somme,
+        rating_count=F('rating_count') + nombre,
+    )
+
+
+def note_enregistree(note, created, using=None):
+    """Répercute la création ou la modification d'une note."""
+    if created:
+        appliquer_delta(note.produit_id, note.valeur, 1, using)
+    else:
+        ancien_produit, ancienne_valeur = getattr(note, '_etat_initial', (None, None))
+        if ancien_produit is None:
+            # Instance non chargée depuis la base : état précédent inconnu, on reconcilie
+            reconcilier([note.produit_id], using=using)
+        elif ancien_produit != note.produit_id:
+            appliquer_delta(ancien_produit, -ancienne_valeur, -1, using)
+            appliquer_delta(note.produit_id, note.valeur, 1, using)
+        else:
+            appliquer_delta(note.produit_id, note.valeur - ancienne_valeur, 0, using)
+    note._etat_initial = (note.produit_id, note.valeur)
+
+
+def note_supprimee(note, using=None):
+    """Répercute la suppression d'une note."""
+    produit_id, valeur = getattr(note, '_etat_initial', (note.produit_id, note.valeur))
+    appliquer_delta(produit_id, -valeur, -1, using)
+
+
+def reconcilier(produit_ids=None, using=None):
+    """
+    Recalcule rating_sum / rating_count depuis la table Note en un seul UPDATE
+    (sous-requêtes corrélées). Retourne le nombre de produits mis à jour.
+    """
+    from .models import Note, Produit
+
+    notes = Note.objects.using(using).filter(produit=OuterRef('pk')).order_by().values('produit')
+    produits = Produit.objects.using(using).all()
+    if produit_ids is not None:
+        produits = produits.filter(pk__in=produit_ids)
+    return produits.update(
+        rating_sum=Coalesce(
+            Subquery(notes.annotate(s=Sum('valeur')).values('s'), output_field=IntegerField()),
+            Value(0),
+        ),
+        rating_count=Coalesce(
+            Subquery(notes.annotate(c=Count('pk')).values('c'), output_field=IntegerField()),
+            Value(0),
+        ),
+    )
@@ -0,0 +1,160 @@
+"""
+File d'attente des e-mails sortants (outbox).
+
+Le code applicatif enregistre les messages dans EmailSortant (dans la même
+transaction que la donnée qui les déclenche) au lieu d'appeler send_mail
+pendant la requête. Un worker (`manage.py send_outbox`) :
+  1. réserve un lot de messages dus avec un UPDATE conditionnel (jeton + bail),
+     ce qui permet plusieurs workers en parallèle ;
+  2. les envoie sur une seule connexion SMTP ouverte une fois, en prolongeant
+     le bail dès que la moitié en est écoulée (serveur lent, gros lot) : un
+     autre worker ne reprend pas un lot encore en cours d'envoi ;
+  3. enregistre le résultat ; en cas d'échec, replanifie avec un délai
+     exponentiel jusqu'à MAX_TENTATIVES.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EmailSortant
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 50
+MAX_TENTATIVES = 5
+DELAI_BASE = timedelta(minutes=1)
+DELAI_MAX = timedelta(hours=6)
+DUREE_BAIL = timedelta(minutes=5)
+
+
+def mettre_en_file(sujet, message, destinataires, expediteur=None):
+    """Enregistre un e-mail à envoyer et le retourne."""
+    return EmailSortant.objects.create(
+        sujet=sujet[:255],
+        message=message,
+        expediteur=expediteur or settings.DEFAULT_FROM_EMAIL,
+        destinataires=list(destinataires),
+    )
+
+
+def delai_avant_nouvel_essai(tentatives):
+    """1 min, 2 min, 4 min... plafonné à DELAI_MAX."""
+    return min(DELAI_BASE * (2 ** max(tentatives - 1, 0)), DELAI_MAX)
+
+
+def reserver(taille=TAILLE_LOT, maintenant=None):
+    """
+    Réserve jusqu'à `taille` messages dus et les retourne.
+    Les messages dont le bail a expiré (worker interrompu) sont repris.
+    """
+    maintenant = maintenant or timezone.now()
+    disponibles = (
+        Q(statut='EN_ATTENTE', prochaine_tentative__lte=maintenant)
+        | Q(statut='EN_COURS', bail_expire__lt=maintenant)
+    )
+    ids = list(
+        EmailSortant.objects.filter(disponibles)
+        .order_by('prochaine_tentative', 'id')
+        .values_list('id', flat=True)[:taille]
+    )
+    if not ids:
+        return []
+
+    jeton = uuid.uuid4().hex
+    # UPDATE conditionnel : un message déjà pris par un autre worker n'est pas repris
+    EmailSortant.objects.filter(disponibles, pk__in=ids).update(
+        statut='EN_COURS', jeton=jeton, bail_expire=maintenant + DUREE_BAIL,
+    )
+    return list(EmailSortant.objects.filter(jeton=jeton, statut='EN_COURS').order_by('id'))
+
+
+def prolonger_bail(messages):
+    """
+    Prolonge le bail des messages encore réservés par ce lot (une requête) et
+    retourne leurs identifiants. Un message repris par un autre worker après
+    l'expiration du bail (jeton différent) n'en fait plus partie.
+    """
+    bail = timezone.now() + DUREE_BAIL
+    reserves = EmailSortant.objects.filter(
+        pk__in=[m.pk for m in messages], jeton=messages[0].jeton, statut='EN_COURS',
+    )
+    reserves.update(bail_expire=bail)
+    detenus = set(reserves.values_list('pk', flat=True))
+    for m in messages:
+        if m.pk in detenus:
+            m.bail_expire = bail
+    return detenus
+
+
+def envoyer(messages, connection=None):
+    """Envoie les messages réservés sur une seule connexion et enregistre leur statut."""
+    if not messages:
+        return 0, 0
+
+    connection = connection or get_connection(fail_silently=False)
+    envoyes, echecs, perdus = [], [], set()
+    try:
+        connection.open()
+        for m in messages:
+            if m.pk not in perdus and m.jeton and timezone.now() >= m.bail_expire - DUREE_BAIL / 2:
+                # Tout le lot, envoyés compris : leur statut n'est écrit qu'à la fin
+                lot = [x for x in messages if x.pk not in perdus]
+                detenus = prolonger_bail(lot)
+                perdus |= {x.pk for x in lot if x.pk not in detenus}
+            if m.pk in perdus:
+                logger.warning("Bail de l'e-mail #%s perdu : laissé au worker qui l'a repris.", m.pk)
+                continue
+            email = EmailMessage(m.sujet, m.message, m.expediteur or None, m.destinataires, connection=connection)
+            m.tentatives += 1
+            try:
+                connection.send_messages([email])
+            except Exception as e:
+                logger.warning("Échec d'envoi de l'e-mail #%s : %s", m.pk, e)
+                m.derniere_erreur = str(e)
+                echecs.append(m)
+            else:
+                envoyes.append(m)
+    except Exception as e:
+        # Connexion impossible : tout le reste du lot est en échec
+        logger.warning("Connexion au serveur d'e-mails impossible : %s", e)
+        traites = {m.pk for m in envoyes} | {m.pk for m in echecs} | perdus
+        for m in messages:
+            if m.pk not in traites:
+                m.tentatives += 1
+                m.derniere_erreur = str(e)
+                echecs.append(m)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    maintenant = timezone.now()
+    for m in envoyes:
+        m.statut, m.date_envoi, m.derniere_erreur = 'ENVOYE', maintenant, ''
+    for m in echecs:
+        if m.tentatives >= MAX_TENTATIVES:
+            m.statut = 'ECHEC'
+        else:
+            m.statut = 'EN_ATTENTE'
+            m.prochaine_tentative = maintenant + delai_avant_nouvel_essai(m.tentatives)
+    # Les messages repris par un autre worker ne sont pas réécrits
+    messages = [m for m in messages if m.pk not in perdus]
+    for m in messages:
+        m.jeton, m.bail_expire = '', None
+
+    EmailSortant.objects.bulk_update(
+        messages,
+        ['statut', 'tentatives', 'prochaine_tentative', 'derniere_erreur', 'date_envoi', 'jeton', 'bail_expire'],
+    )
+    return len(envoyes), len(echecs)
+
+
+def traiter_file(taille=TAILLE_LOT):
+    """Réserve et envoie un lot. Retourne (envoyés, échecs)."""
+    return envoyer(reserver(taille))
@@ -0,0 +1,168 @@
+"""
+Pagination par curseur (keyset) pour les listes de produits.
+
+Au lieu de `OFFSET n` + `COUNT(*)`, chaque page est lue à partir de la
+dernière ligne affichée : `WHERE (cle, id) > (valeur, pk) ORDER BY cle, id LIMIT n`.
+Le coût d'une page ne dépend donc plus de sa profondeur.
+Le curseur est opaque pour le client (JSON encodé en base64).
+Pour les petits résultats, on garde le `Paginator` Django classique.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+# En dessous de ce nombre de résultats, la pagination par numéro de page est conservée
+SEUIL_OFFSET = 1000
+
+
+class CursorPage:
+    """Page de résultats obtenue par curseur (interface proche de `Page`)."""
+
+    cursor_mode = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def _encoder(ordering, valeurs, arriere=False):
+    data = {'o': list(ordering), 'v': valeurs, 'r': arriere}
+    brut = json.dumps(data, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(brut).decode().rstrip('=')
+
+
+def _decoder(cursor, ordering):
+    """Retourne (valeurs, arriere) ou None si le curseur est invalide ou d'un autre tri."""
+    try:
+        brut = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(brut)
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or data.get('o') != list(ordering):
+        return None
+    valeurs = data.get('v')
+    if not isinstance(valeurs, list) or len(valeurs) != len(ordering):
+        return None
+    return valeurs, bool(data.get('r'))
+
+
+def _champ(nom):
+    return nom.lstrip('-')
+
+
+def _valeurs(obj, ordering):
+    return [getattr(obj, _champ(nom)) for nom in ordering]
+
+
+def _convertir(queryset, champ, brut):
+    """Reconvertit une valeur du curseur (JSON) dans le type du champ ou de l'annotation."""
+    annotation = queryset.query.annotations.get(champ)
+    if annotation is not None:
+        return annotation.output_field.to_python(brut)
+    return queryset.model._meta.get_field('id' if champ == 'pk' else champ).to_python(brut)
+
+
+def _apres(queryset, ordering, valeurs, arriere):
+    """
+    Condition lexicographique « strictement après (ou avant) » la ligne `valeurs`.
+    (a, b) > (x, y)  <=>  a > x  OU  (a = x ET b > y)
+    """
+    condition = Q()
+    egalites = {}
+    for nom, brut in zip(ordering, valeurs):
+        champ = _champ(nom)
+        valeur = _convertir(queryset, champ, brut)
+        croissant = not nom.startswith('-')
+        if arriere:
+            croissant = not croissant
+        lookup = f"{champ}__{'gt' if croissant else 'lt'}"
+        condition |= Q(**egalites, **{lookup: valeur})
+        egalites[champ] = valeur
+    return condition
+
+
+def _inverser(ordering):
+    return [nom[1:] if nom.startswith('-') else f'-{nom}' for nom in ordering]
+
+
+def paginer_par_curseur(queryset, ordering, per_page, cursor=None):
+    """
+    Retourne une `CursorPage`. `ordering` doit se terminer par une clé unique
+    (ex. ('-date_creation', '-id')) pour garantir un ordre stable.
+    """
+    ordering = list(ordering)
+    position = _decoder(cursor, ordering) if cursor else None
+    arriere = False
+
+    qs = queryset.order_by(*ordering)
+    if position:
+        valeurs, arriere = position
+        try:
+            condition = _apres(queryset, ordering, valeurs, arriere)
+        except ValidationError:
+            condition, arriere = None, False
+        if condition is not None:
+            qs = queryset.filter(condition)
+            qs = qs.order_by(*(_inverser(ordering) if arriere else ordering))
+
+    lignes = list(qs[:per_page + 1])
+    encore = len(lignes) > per_page
+    lignes = lignes[:per_page]
+    if arriere:
+        lignes.reverse()
+
+    if not lignes:
+        return CursorPage([])
+
+    suivant = precedent = None
+    # En avançant, "encore" indique une page suivante ; en reculant, une page précédente.
+    if (encore and not arriere) or (arriere and position):
+        suivant = _encoder(ordering, _valeurs(lignes[-1], ordering))
+    if (encore and arriere) or (position and not arriere):
+        precedent = _encoder(ordering, _valeurs(lignes[0], ordering), arriere=True)
+    return CursorPage(lignes, suivant, precedent)
+
+
+def paginer(request, queryset, ordering, per_page, seuil=SEUIL_OFFSET):
+    """
+    Choisit le mode de pagination :
+    - `?cursor=...` présent, ou plus de `seuil` résultats : pagination par curseur ;
+    - sinon : `Paginator` classique avec `?page=N`.
+    Retourne (page_obj, total_count) ; total_count vaut None en mode curseur.
+    """
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        # COUNT borné : ne lit jamais plus de seuil + 1 lignes
+        echantillon = queryset.order_by().values('pk')[:seuil + 1].count()
+        if echantillon <= seuil:
+            paginator = Paginator(queryset.order_by(*ordering), per_page)
+            return paginator.get_page(request.GET.get('page')), echantillon
+    return paginer_par_curseur(queryset, ordering, per_page, cursor), None
+
+
+def query_sans_pagination(request):
+    """Paramètres GET courants sans `page` ni `cursor` (pour construire les liens)."""
+    params = request.GET.copy()
+    params.pop('page', None)
+    params.pop('cursor', None)
+    return params.urlencode()
@@ -0,0 +1,255 @@
+"""
+Services du panier.
+
+Chaque utilisateur a un numéro de version de panier en cache, remplacé
+par une valeur neuve (horodatage en nanosecondes) à chaque modification
+validée de ses PanierItem. Il sert à construire les ETag des réponses qui
+dépendent du panier sans interroger la base.
+
+Le résumé du panier (nombre d'articles et sous-total) est gardé en cache
+sous une clé qui contient la version du panier et celle du catalogue, et
+recalculé (un seul agrégat) à la première lecture après un changement de
+l'une ou de l'autre. La version n'est pas incrémentée mais réécrite
+(cache.set) : sans incr atomique, deux écritures simultanées pourraient
+sinon produire le même numéro, sous lequel un résumé calculé entre les
+deux resterait en cache. Avec deux valeurs distinctes, la dernière écrite
+l'est après la validation des deux écritures ; le résumé rangé sous
+l'autre n'est plus jamais relu.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def _cle_version(user_id):
+    return f'panier:{user_id}:version'
+
+
+def version_panier(user_id):
+    """Version courante du panier de l'utilisateur (initialisée à la demande)."""
+    cle = _cle_version(user_id)
+    v = cache.get(cle)
+    if v is None:
+        cache.add(cle, time.time_ns(), timeout=None)
+        v = cache.get(cle)
+    return v
+
+
+def invalider_panier(user_id):
+    """Signale une modification du panier de l'utilisateur : nouvelle version, jamais réutilisée."""
+    cache.set(_cle_version(user_id), time.time_ns(), timeout=None)
+
+
+# ===================================================================
+# RÉSUMÉ DU PANIER (compteur du badge + sous-total)
+# ===================================================================
+
+# Durée de vie du résumé en cache ; la base reste la référence en cas d'absence
+TTL_RESUME = 60 * 10
+
+
+def _cle_resume(user_id):
+    from .catalog_cache import version as version_catalogue
+
+    return f'panier:{user_id}:resume:{version_panier(user_id)}:{version_catalogue()}'
+
+
+def _calculer_resume(user_id):
+    from .tarification import totaux_panier
+
+    count, subtotal = totaux_panier(user_id)
+    return {'count': count, 'subtotal': subtotal}
+
+
+def resume_panier(user_id):
+    """{'count': nombre d'articles, 'subtotal': montant} ; lu en cache, recalculé si absent."""
+    return cache.get_or_set(_cle_resume(user_id), lambda: _calculer_resume(user_id), TTL_RESUME)
+
+
+def oublier_resume(user_id):
+    """
+    À appeler après chaque écriture validée dans le panier : le résumé en
+    cache (et les ETag qui dépendent du panier) deviennent obsolètes.
+    """
+    invalider_panier(user_id)
+
+
+# ===================================================================
+# AJOUT ATOMIQUE
+# ===================================================================
+
+def ajouter_articles(user_id, quantites):
+    """
+    Ajoute des quantités {produit_id: n} au panier en une seule requête
+    (INSERT ... ON CONFLICT DO UPDATE quantite = quantite + n) et retourne
+    les nouvelles quantités {produit_id: quantite}. Sans perte d'incrément
+    ni IntegrityError lors de clics simultanés.
+    """
+    from .models import PanierItem
+
+    if not quantites:
+        return {}
+    if connection.vendor in ('sqlite', 'postgresql'):
+        table = connection.ops.quote_name(PanierItem._meta.db_table)
+        maintenant = connection.ops.adapt_datetimefield_value(timezone.now())
+        valeurs = ', '.join(['(%s, %s, %s, %s)'] * len(quantites))
+        params = []
+        for produit_id, quantite in quantites.items():
+            params += [user_id, produit_id, quantite, maintenant]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, produit_id, quantite, date_ajout) VALUES {valeurs} "
+                f"ON CONFLICT (user_id, produit_id) DO UPDATE SET quantite = {table}.quantite + excluded.quantite "
+                f"RETURNING produit_id, quantite",
+                params,
+            )
+            return dict(cursor.fetchall())
+
+    # Autres moteurs : UPDATE atomique, sinon création (et nouvel UPDATE si un autre l'a créée entre-temps)
+    resultat = {}
+    for produit_id, quantite in quantites.items():
+        lignes = PanierItem.objects.filter(user_id=user_id, produit_id=produit_id)
+        if not lignes.update(quantite=F('quantite') + quantite):
+            try:
+                with transaction.atomic():
+                    PanierItem.objects.create(user_id=user_id, produit_id=produit_id, quantite=quantite)
+                resultat[produit_id] = quantite
+                continue
+            except IntegrityError:
+                lignes.update(quantite=F('quantite') + quantite)
+        resultat[produit_id] = lignes.values_list('quantite', flat=True).get()
+    return resultat
+
+
+def ajouter_article(user_id, produit_id, quantite=1):
+    """Ajoute `quantite` exemplaires d'un produit et retourne la nouvelle quantité de la ligne."""
+    return ajouter_articles(user_id, {produit_id: quantite})[produit_id]
+
+
+# ===================================================================
+# MODIFICATIONS PAR LOT
+# ===================================================================
+
+class OperationInvalide(ValueError):
+    """Opération de panier mal formée (produit ou quantité)."""
+
+
+def _normaliser_operations(operations):
+    """Valide [{produit_id, qty}, ...] et retourne {produit_id: qty} (la dernière opération l'emporte)."""
+    if not isinstance(operations, list):
+        raise OperationInvalide("Une liste d'opérations est attendue.")
+    quantites = {}
+    for op in operations:
+        try:
+            produit_id, qty = int(op['produit_id']), int(op['qty'])
+        except (KeyError, TypeError, ValueError):
+            raise OperationInvalide("Chaque opération doit contenir produit_id et qty entiers.")
+        if qty < 0:
+            raise OperationInvalide("La quantité ne peut pas être négative.")
+        quantites[produit_id] = qty
+    return quantites
+
+
+def modifier_lot(user_id, operations):
+    """
+    Applique des opérations {produit_id, qty} (qty = 0 : suppression) dans une
+    seule transaction : un SELECT, puis au plus un bulk_update, un bulk_create
+    et un DELETE. Retourne le panier recalculé (tarification.ResumePanier).
+    """
+    from .models import PanierItem, Produit
+    from .tarification import calculer_panier
+
+    quantites = _normaliser_operations(operations)
+    with transaction.atomic():
+        existants = {
+            item.produit_id: item
+            for item in PanierItem.objects.select_for_update().filter(user_id=user_id, produit_id__in=quantites)
+        }
+        a_supprimer = [pid for pid, qty in quantites.items() if qty == 0 and pid in existants]
+        a_modifier = []
+        for pid, qty in quantites.items():
+            if qty and pid in existants and existants[pid].quantite != qty:
+                existants[pid].quantite = qty
+                a_modifier.append(existants[pid])
+        nouveaux = [pid for pid, qty in quantites.items() if qty and pid not in existants]
+        if nouveaux:
+            # Les produits inexistants sont ignorés
+            nouveaux = Produit.objects.filter(pk__in=nouveaux).values_list('pk', flat=True)
+
+        if a_supprimer:
+            PanierItem.objects.filter(user_id=user_id, produit_id__in=a_supprimer).delete()
+        if a_modifier:
+            PanierItem.objects.bulk_update(a_modifier, ['quantite'])
+        if nouveaux:
+            PanierItem.objects.bulk_create(
+                [PanierItem(user_id=user_id, produit_id=pid, quantite=quantites[pid]) for pid in nouveaux],
+                ignore_conflicts=True,
+            )
+
+        resume = calculer_panier(user_id)
+        transaction.on_commit(lambda: oublier_resume(user_id))
+    return resume
+
+
+# ===================================================================
+# PANIER INVITÉ (SESSION)
+# ===================================================================
+
+# Le panier invité est stocké sous forme compacte : "12:3,45:1" (produit:quantité)
+CLE_SESSION = 'panier'
+
+
+def lire_panier_session(session):
+    """Panier invité {produit_id: quantite} ; accepte aussi l'ancien format dict."""
+    brut = session.get(CLE_SESSION)
+    quantites = {}
+    if isinstance(brut, str):
+        for morceau in filter(None, brut.split(',')):
+            produit_id, _, quantite = morceau.partition(':')
+            if produit_id.isdigit() and quantite.isdigit() and int(quantite) > 0:
+                quantites[int(produit_id)] = int(quantite)
+    elif isinstance(brut, dict):
+        for produit_id, ligne in brut.items():
+            quantite = str(ligne.get('quantite', 0) if isinstance(ligne, dict) else ligne)
+            # Entrées illisibles (produit ou quantité non numérique) ignorées, comme en forme compacte
+            if str(produit_id).isdigit() and quantite.isdigit() and int(quantite) > 0:
+                quantites[int(produit_id)] = int(quantite)
+    return quantites
+
+
+def ecrire_panier_session(session, quantites):
+    """Enregistre le panier invité (un panier vide retire la clé de la session)."""
+    if quantites:
+        session[CLE_SESSION] = ','.join(f'{p}:{q}' for p, q in quantites.items() if q > 0)
+    else:
+        session.pop(CLE_SESSION, None)
+
+
+def compter_panier_session(session):
+    """Nombre d'articles du panier invité stocké en session."""
+    return sum(lire_panier_session(session).values())
+
+
+def fusionner_panier_session(session, user_id):
+    """
+    Verse le panier invité dans le panier de l'utilisateur (à la connexion) :
+    une requête pour vérifier les produits, un upsert groupé, puis la session est vidée.
+    Retourne le nombre de lignes fusionnées.
+    """
+    from .models import Produit
+
+    quantites = lire_panier_session(session)
+    if not quantites:
+        session.pop(CLE_SESSION, None)
+        return 0
+
+    existants = set(Produit.objects.filter(pk__in=quantites).values_list('pk', flat=True))
+    quantites = {p: q for p, q in quantites.items() if p in existants}
+    with transaction.atomic():
+        ajouter_articles(user_id, quantites)
+        transaction.on_commit(lambda: oublier_resume(user_id))
+    ecrire_panier_session(session, {})
+    return len(quantites)
@@ -0,0 +1,158 @@
+"""
+Positions GPS des livreurs.
+
+Les téléphones envoient leurs relevés par lots (plusieurs points par POST).
+Seul le plus récent par livreur est gardé, en cache ; un point plus ancien
+que celui déjà connu (arrivé en retard ou rejoué) est ignoré grâce à son
+horodatage. La base n'est écrite qu'une fois par intervalle : un seul
+UPDATE groupé (bulk_update) recopie la dernière position de chaque livreur
+sur ses commandes en cours (latitude_livreur, longitude_livreur,
+derniere_maj_position).
+"""
+import math
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import diffusion
+from .models import Commande
+
+# Intervalle minimal entre deux écritures en base (secondes)
+INTERVALLE_VIDAGE = getattr(settings, 'POSITIONS_INTERVALLE_VIDAGE', 15)
+
+# Relevés refusés : trop anciens ou trop en avance (horloge du téléphone)
+AGE_MAX = timedelta(minutes=10)
+AVANCE_MAX = timedelta(seconds=30)
+
+TAILLE_LOT_MAX = 500
+
+# La position reste en cache bien au-delà de l'intervalle de vidage
+TTL_POSITION = 60 * 60
+
+CLE_VIDAGE = 'positions:vidage'
+
+
+class PositionInvalide(ValueError):
+    """Lot de positions mal formé."""
+
+
+def _cle(livreur_id):
+    return f'positions:{livreur_id}'
+
+
+def _horodatage(brut, maintenant):
+    """Accepte un timestamp Unix (s ou ms) ou une date ISO 8601 ; absent = maintenant."""
+    if brut is None:
+        return maintenant
+    if isinstance(brut, (int, float)) and not isinstance(brut, bool):
+        # json.loads accepte Infinity et NaN
+        if not math.isfinite(brut):
+            raise PositionInvalide("Horodatage invalide.")
+        secondes = brut / 1000 if brut > 1e11 else brut
+        try:
+            return datetime.fromtimestamp(secondes, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise PositionInvalide("Horodatage invalide.")
+    if isinstance(brut, str):
+        date = parse_datetime(brut)
+        if date is not None:
+            return date if timezone.is_aware(date) else timezone.make_aware(date, dt_timezone.utc)
+    raise PositionInvalide("Horodatage invalide.")
+
+
+def _lire_point(point, maintenant):
+    try:
+        lat, lng = float(point['lat']), float(point['lng'])
+    except (KeyError, TypeError, ValueError):
+        raise PositionInvalide("Chaque point doit contenir lat et lng.")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise PositionInvalide("Coordonnées hors limites.")
+    return lat, lng, _horodatage(point.get('ts'), maintenant)
+
+
+def derniere_position(livreur_id):
+    """Dernière position connue {'lat', 'lng', 'ts'} (en cache), ou None."""
+    return cache.get(_cle(livreur_id))
+
+
+def positions_livreurs(livreur_ids):
+    """Dernières positions connues de plusieurs livreurs, en une lecture : {livreur_id: position}."""
+    cles = {_cle(livreur_id): livreur_id for livreur_id in livreur_ids}
+    return {cles[cle]: pos for cle, pos in cache.get_many(list(cles)).items()}
+
+
+async def aderniere_position(livreur_id):
+    """Version asynchrone de derniere_position (flux SSE)."""
+    return await cache.aget(_cle(livreur_id))
+
+
+def enregistrer(livreur_id, points):
+    """
+    Garde le relevé le plus récent du lot s'il est plus récent que la position
+    en cache. Retourne (acceptés, ignorés) : un seul point par lot est retenu,
+    les autres sont comptés comme ignorés.
+    """
+    if not isinstance(points, list) or len(points) > TAILLE_LOT_MAX:
+        raise PositionInvalide(f"Une liste de 1 à {TAILLE_LOT_MAX} points est attendue.")
+
+    maintenant = timezone.now()
+    valides = [
+        p for p in (_lire_point(point, maintenant) for point in points)
+        if maintenant - AGE_MAX <= p[2] <= maintenant + AVANCE_MAX
+    ]
+    if not valides:
+        return 0, len(points)
+
+    lat, lng, ts = max(valides, key=lambda p: p[2])
+    actuelle = derniere_position(livreur_id)
+    if actuelle is not None and actuelle['ts'] >= ts:
+        return 0, len(points)
+
+    position = {'lat': lat, 'lng': lng, 'ts': ts}
+    cache.set(_cle(livreur_id), position, TTL_POSITION)
+    diffusion.publier_position(livreur_id, position)
+    return 1, len(points) - 1
+
+
+def vider_si_du():
+    """Écrit les positions en base si le dernier vidage date de plus d'un intervalle."""
+    if cache.add(CLE_VIDAGE, True, INTERVALLE_VIDAGE):
+        return vider()
+    return 0
+
+
+def vider():
+    """
+    Recopie en base la dernière position des livreurs ayant des commandes
+    en cours : une lecture, un get_many sur le cache, un UPDATE groupé.
+    Retourne le nombre de commandes mises à jour.
+    """
+    commandes = list(
+        Commande.objects.filter(statut='EN_COURS', livreur__isnull=False)
+        .only('id', 'livreur_id', 'derniere_maj_position')
+    )
+    if not commandes:
+        return 0
+
+    positions = positions_livreurs({c.livreur_id for c in commandes})
+
+    a_ecrire = []
+    for c in commandes:
+        pos = positions.get(c.livreur_id)
+        if pos is None or (c.derniere_maj_position and c.derniere_maj_position >= pos['ts']):
+            continue
+        c.latitude_livreur = Decimal(f"{pos['lat']:.8f}")
+        c.longitude_livreur = Decimal(f"{pos['lng']:.8f}")
+        c.derniere_maj_position = pos['ts']
+        a_ecrire.append(c)
+
+    if a_ecrire:
+        Commande.objects.bulk_update(
+            a_ecrire, ['latitude_livreur', 'longitude_livreur', 'derniere_maj_position'], batch_size=500,
+        )
+    return len(a_ecrire)
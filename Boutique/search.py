@@ -0,0 +1,193 @@
+"""
+Index de recherche plein texte des produits.
+
+SQLite : table virtuelle FTS5. PostgreSQL : colonne tsvector + index GIN.
+Les autres moteurs retombent sur un filtre icontains classique.
+Le texte est normalisé (minuscules, accents retirés) avant indexation
+et avant chaque requête, pour que "telephone" trouve "Téléphone".
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+TABLE_INDEX = 'Boutique_produit_recherche'
+
+# Poids du nom par rapport à la description dans le classement
+POIDS_NOM = 10.0
+POIDS_DESCRIPTION = 1.0
+
+TAILLE_LOT = 500
+
+_MOT = re.compile(r'[a-z0-9]+')
+
+
+def normaliser(texte):
+    """Retourne le texte en minuscules et sans accents (é -> e, ç -> c)."""
+    if not texte:
+        return ''
+    decompose = unicodedata.normalize('NFKD', str(texte))
+    return ''.join(c for c in decompose if not unicodedata.combining(c)).lower()
+
+
+def mots(texte):
+    """Découpe un texte normalisé en termes de recherche."""
+    return _MOT.findall(normaliser(texte))
+
+
+def moteur(conn=None):
+    """Retourne 'sqlite', 'postgresql' ou None si aucun index n'est géré."""
+    vendor = (conn or connection).vendor
+    if vendor in ('sqlite', 'postgresql'):
+        return vendor
+    return None
+
+
+# ===================================================================
+# SCHÉMA (utilisé par la migration)
+# ===================================================================
+
+def creer_index(schema_editor):
+    conn = schema_editor.connection
+    table = conn.ops.quote_name(TABLE_INDEX)
+    produits = conn.ops.quote_name('Boutique_produit')
+    if moteur(conn) == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            f"nom, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+    elif moteur(conn) == 'postgresql':
+        schema_editor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"produit_id bigint PRIMARY KEY REFERENCES {produits} (id) ON DELETE CASCADE, "
+            f"document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {conn.ops.quote_name(TABLE_INDEX + '_gin')} "
+            f"ON {table} USING GIN (document)"
+        )
+
+
+def supprimer_index(schema_editor):
+    conn = schema_editor.connection
+    if moteur(conn):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {conn.ops.quote_name(TABLE_INDEX)}")
+
+
+# ===================================================================
+# SYNCHRONISATION
+# ===================================================================
+
+def _lignes(produits):
+    return [(p_id, normaliser(nom), normaliser(description)) for p_id, nom, description in produits]
+
+
+def _ecrire(lignes):
+    if not lignes or not moteur():
+        return
+    table = connection.ops.quote_name(TABLE_INDEX)
+    with connection.cursor() as cursor:
+        if moteur() == 'sqlite':
+            cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(l[0],) for l in lignes])
+            cursor.executemany(
+                f"INSERT INTO {table} (rowid, nom, description) VALUES (%s, %s, %s)", lignes
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {table} (produit_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B')) "
+                f"ON CONFLICT (produit_id) DO UPDATE SET document = EXCLUDED.document",
+                lignes,
+            )
+
+
+def indexer_lignes(produits):
+    """Indexe des tuples (id, nom, description)."""
+    _ecrire(_lignes(produits))
+
+
+def indexer_produit(produit):
+    """Ajoute ou remplace un produit dans l'index."""
+    indexer_lignes([(produit.pk, produit.nom, produit.description)])
+
+
+def retirer_produit(produit_id):
+    """Retire un produit de l'index."""
+    if not moteur():
+        return
+    table = connection.ops.quote_name(TABLE_INDEX)
+    colonne = 'rowid' if moteur() == 'sqlite' else 'produit_id'
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {colonne} = %s", [produit_id])
+
+
+def reconstruire_index():
+    """Vide puis reconstruit l'index complet par lots. Retourne le nombre de produits indexés."""
+    from .models import Produit
+
+    if not moteur():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {connection.ops.quote_name(TABLE_INDEX)}")
+
+    total = 0
+    lot = []
+    for ligne in Produit.objects.values_list('id', 'nom', 'description').iterator(chunk_size=TAILLE_LOT):
+        lot.append(ligne)
+        if len(lot) >= TAILLE_LOT:
+            indexer_lignes(lot)
+            total += len(lot)
+            lot = []
+    indexer_lignes(lot)
+    return total + len(lot)
+
+
+# ===================================================================
+# REQUÊTES
+# ===================================================================
+
+def _requete(termes):
+    """Construit l'expression de recherche (préfixe sur chaque terme, ET implicite)."""
+    if moteur() == 'sqlite':
+        return ' '.join(f'"{t}"*' for t in termes)
+    return ' & '.join(f'{t}:*' for t in termes)
+
+
+def filtrer(queryset, search):
+    """
+    Restreint `queryset` aux produits correspondant à `search` et l'annote
+    avec `pertinence` (plus grand = plus pertinent).
+    """
+    termes = mots(search)
+    if not termes:
+        return queryset
+
+    if not moteur():
+        queryset = queryset.filter(Q(nom__icontains=search) | Q(description__icontains=search))
+        return queryset.annotate(pertinence=RawSQL('0', (), output_field=FloatField()))
+
+    table = connection.ops.quote_name(TABLE_INDEX)
+    produit_id = f"{connection.ops.quote_name(queryset.model._meta.db_table)}.{connection.ops.quote_name('id')}"
+    expression = _requete(termes)
+
+    if moteur() == 'sqlite':
+        correspondances = RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", (expression,))
+        pertinence = RawSQL(
+            f"SELECT -bm25({table}, {POIDS_NOM}, {POIDS_DESCRIPTION}) FROM {table} "
+            f"WHERE {table} MATCH %s AND rowid = {produit_id}",
+            (expression,),
+            output_field=FloatField(),
+        )
+    else:
+        correspondances = RawSQL(
+            f"SELECT produit_id FROM {table} WHERE document @@ to_tsquery('simple', %s)", (expression,)
+        )
+        pertinence = RawSQL(
+            f"SELECT ts_rank(document, to_tsquery('simple', %s)) FROM {table} WHERE produit_id = {produit_id}",
+            (expression,),
+            output_field=FloatField(),
+        )
+
+    return queryset.filter(pk__in=correspondances).annotate(pertinence=pertinence)
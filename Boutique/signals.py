@@ -0,0 +1,139 @@
+"""
+Récepteurs de signaux de l'application Boutique.
+"""
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from django.utils import timezone
+
+from . import catalog_cache, classement, diffusion, livraison, notation, panier, search
+from .models import Categorie, Commande, CommandeItem, Note, Produit
+
+
+# ===================================================================
+# INDEX DE RECHERCHE
+# ===================================================================
+
+@receiver(post_save, sender=Produit)
+def indexer_produit(sender, instance, raw=False, **kwargs):
+    """Met à jour l'index plein texte quand un produit est enregistré."""
+    if raw:
+        return
+    search.indexer_produit(instance)
+
+
+@receiver(post_save, sender=Produit)
+def classer_nouveau_produit(sender, instance, created, raw=False, **kwargs):
+    """Crée la ligne de classement d'un nouveau produit (score = moyenne a priori)."""
+    if created and not raw:
+        classement.actualiser([instance.pk])
+
+
+@receiver(post_delete, sender=Produit)
+def desindexer_produit(sender, instance, **kwargs):
+    """Retire le produit supprimé de l'index plein texte."""
+    search.retirer_produit(instance.pk)
+
+
+# ===================================================================
+# AGRÉGATS DE NOTES
+# ===================================================================
+
+@receiver(post_save, sender=Note)
+def maj_notes_produit(sender, instance, created, raw=False, using=None, **kwargs):
+    """Met à jour rating_sum / rating_count du produit noté."""
+    if raw:
+        return
+    ancien_produit = getattr(instance, '_etat_initial', (None, None))[0]
+    notation.note_enregistree(instance, created, using)
+    produits = {instance.produit_id, ancien_produit}
+    transaction.on_commit(lambda: classement.actualiser(produits), using=using)
+    transaction.on_commit(catalog_cache.invalider_notes, using=using)
+
+
+@receiver(post_delete, sender=Note)
+def retirer_note_produit(sender, instance, using=None, **kwargs):
+    """
+    Retire la note supprimée des agrégats du produit. Le classement est
+    recalculé après validation : si la note part avec son produit (suppression
+    en cascade), le produit n'existe plus et aucune ligne n'est recréée.
+    """
+    notation.note_supprimee(instance, using)
+    transaction.on_commit(lambda: classement.actualiser([instance.produit_id]), using=using)
+    transaction.on_commit(catalog_cache.invalider_notes, using=using)
+
+
+# ===================================================================
+# CACHE DU CATALOGUE
+# ===================================================================
+
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+@receiver(post_save, sender=Categorie)
+@receiver(post_delete, sender=Categorie)
+def invalider_catalogue(sender, raw=False, **kwargs):
+    """Rend obsolètes les entrées du cache catalogue (après validation de la transaction)."""
+    if raw:
+        return
+    transaction.on_commit(catalog_cache.invalider, using=kwargs.get('using'))
+
+
+@receiver(m2m_changed, sender=Produit.categories.through)
+def invalider_catalogue_categories(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(catalog_cache.invalider, using=kwargs.get('using'))
+
+
+# ===================================================================
+# VERSIONS (ETag / Last-Modified, voir conditional.py)
+# La version du panier est renouvelée par panier.py, sans signal sur
+# PanierItem : cela permet les DELETE en une requête (pas de collecte).
+# ===================================================================
+
+@receiver(post_save, sender=CommandeItem)
+@receiver(post_delete, sender=CommandeItem)
+def toucher_commande(sender, instance, raw=False, **kwargs):
+    """Une modification d'article rend la commande plus récente."""
+    if raw:
+        return
+    Commande.objects.filter(pk=instance.commande_id).update(updated_at=timezone.now())
+
+
+# ===================================================================
+# PANIER INVITÉ
+# ===================================================================
+
+@receiver(user_logged_in)
+def fusionner_panier_invite(sender, request, user, **kwargs):
+    """À la connexion (custom_login, register, admin...), verse le panier de session dans PanierItem."""
+    if request is not None and hasattr(request, 'session'):
+        panier.fusionner_panier_session(request.session, user.pk)
+
+
+# ===================================================================
+# STATISTIQUES DES LIVREURS
+# ===================================================================
+
+@receiver(post_save, sender=Commande)
+@receiver(post_delete, sender=Commande)
+def invalider_stats_livreurs(sender, instance, raw=False, **kwargs):
+    """Une commande modifiée change les compteurs de son livreur (et de l'ancien en cas de réaffectation)."""
+    if raw:
+        return
+    livreurs = (instance.livreur_id, getattr(instance, '_livreur_initial', None))
+    if any(livreurs):
+        transaction.on_commit(lambda: livraison.invalider_stats(*livreurs), using=kwargs.get('using'))
+    instance._livreur_initial = instance.livreur_id
+
+
+# ===================================================================
+# SUIVI EN DIRECT (voir diffusion.py)
+# ===================================================================
+
+@receiver(post_save, sender=Commande)
+def diffuser_statut_commande(sender, instance, created, raw=False, **kwargs):
+    """Pousse le statut de la commande aux clients qui la suivent."""
+    if not raw and not created:
+        transaction.on_commit(lambda: diffusion.publier_statut(instance), using=kwargs.get('using'))
@@ -0,0 +1,99 @@
+"""
+Calcul des prix du panier, en SQL.
+
+Une seule définition du prix d'une ligne, partagée par la page panier,
+le passage de commande et le badge :
+  prix unitaire = COALESCE(prix_promo, prix)
+  total ligne   = quantite × prix unitaire
+Les totaux du panier sont calculés par la même requête (fonctions de
+fenêtre), puis les frais de livraison sont ajoutés par un point
+d'extension configurable (`BOUTIQUE_FRAIS_LIVRAISON` dans settings).
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import DecimalField, F, Sum, Window
+from django.db.models.functions import Coalesce
+from django.utils.module_loading import import_string
+
+from .constants import FRAIS_LIVRAISON_DEFAUT
+from .models import PanierItem
+
+MONTANT = DecimalField(max_digits=12, decimal_places=2)
+
+PRIX_UNITAIRE = Coalesce('produit__prix_promo', 'produit__prix', output_field=MONTANT)
+TOTAL_LIGNE = F('quantite') * PRIX_UNITAIRE
+
+
+class ResumePanier:
+    """Résultat du calcul : lignes annotées et totaux."""
+
+    __slots__ = ('lignes', 'count', 'sous_total', 'frais_livraison', 'total')
+
+    def __init__(self, lignes, count, sous_total, frais_livraison):
+        self.lignes = lignes
+        self.count = count
+        self.sous_total = sous_total
+        self.frais_livraison = frais_livraison
+        self.total = sous_total + frais_livraison
+
+    def __bool__(self):
+        return bool(self.lignes)
+
+
+# ===================================================================
+# FRAIS DE LIVRAISON
+# ===================================================================
+
+def frais_livraison_defaut(user_id, count, sous_total):
+    """Forfait FRAIS_LIVRAISON_DEFAUT, offert si le panier est vide."""
+    return FRAIS_LIVRAISON_DEFAUT if count else Decimal('0')
+
+
+def frais_livraison(user_id, count, sous_total):
+    """Appelle la fonction désignée par settings.BOUTIQUE_FRAIS_LIVRAISON (chemin pointé)."""
+    chemin = getattr(settings, 'BOUTIQUE_FRAIS_LIVRAISON', None)
+    calcul = import_string(chemin) if chemin else frais_livraison_defaut
+    return Decimal(calcul(user_id, count, sous_total))
+
+
+# ===================================================================
+# REQUÊTES
+# ===================================================================
+
+def lignes_panier(user_id):
+    """PanierItem de l'utilisateur annotés avec `prix_applique` et `total_ligne`."""
+    return (
+        PanierItem.objects.filter(user_id=user_id)
+        .annotate(prix_applique=PRIX_UNITAIRE, total_ligne=TOTAL_LIGNE)
+        .order_by('date_ajout', 'id')
+    )
+
+
+def totaux_panier(user_id):
+    """(nombre d'articles, sous-total) par un seul agrégat, sans charger les lignes."""
+    totaux = PanierItem.objects.filter(user_id=user_id).aggregate(
+        count=Sum('quantite'),
+        sous_total=Sum(TOTAL_LIGNE, output_field=MONTANT),
+    )
+    return totaux['count'] or 0, totaux['sous_total'] or Decimal('0')
+
+
+def calculer_panier(user_id, avec_produits=True):
+    """
+    Lignes et totaux du panier en une requête : chaque ligne porte aussi
+    le nombre d'articles et le sous-total du panier (SUM() OVER ()).
+    """
+    qs = lignes_panier(user_id).annotate(
+        panier_count=Window(Sum('quantite')),
+        panier_sous_total=Window(Sum(TOTAL_LIGNE, output_field=MONTANT)),
+    )
+    if avec_produits:
+        qs = qs.select_related('produit')
+    lignes = list(qs)
+
+    if lignes:
+        count, sous_total = lignes[0].panier_count, lignes[0].panier_sous_total
+    else:
+        count, sous_total = 0, Decimal('0')
+    return ResumePanier(lignes, count, sous_total, frais_livraison(user_id, count, sous_total))
@@ -0,0 +1,37 @@
+from django import template
+from django.utils.html import format_html
+
+from Boutique import images
+
+register = template.Library()
+
+
+@register.filter
+def srcset(fieldfile, fmt='jpeg'):
+    """{{ produit.image|srcset:"webp" }} -> liste d'URL des variantes avec leur largeur."""
+    if not fieldfile:
+        return ''
+    return images.srcset(fieldfile, fmt)
+
+
+@register.simple_tag
+def image_responsive(fieldfile, variante='card', sizes='100vw', alt='', css_class=''):
+    """
+    Balise <picture> (WebP + JPEG) pointant sur les variantes générées.
+    Retombe sur l'image originale si les variantes n'existent pas encore.
+    """
+    if not fieldfile:
+        return ''
+    if not images.variantes_disponibles(fieldfile):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">', fieldfile.url, alt, css_class
+        )
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        images.srcset(fieldfile, 'webp'), sizes,
+        images.url_variante(fieldfile, variante), images.srcset(fieldfile), sizes,
+        alt, css_class,
+    )
@@ -1,3 +1,1337 @@
-from django.test import TestCase
+import asyncio
+import base64
+import itertools
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import FloatField, Value
+from django.db.models.functions import Coalesce
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    catalog_cache, checks, classement, diffusion, dispatch, facets, geo, images, itineraire, livraison, notation,
+    outbox, panier, positions, search,
+)
+from .commandes import PanierVide, StockInsuffisant, passer_commande
+from .constants import FRAIS_LIVRAISON_DEFAUT
+from .livraison import prendre_commande
+from .models import (
+    Categorie, ClassementProduit, Commande, CommandeItem, EmailSortant, MoyenneClassement, Note, PanierItem,
+    Produit, UserProfile,
+)
+from .pagination import paginer, paginer_par_curseur
+from .tarification import calculer_panier, totaux_panier
+from .views import ORDRES_TRI
+
+
+class RechercheTests(TestCase):
+
+    def setUp(self):
+        # La coque est créée d'abord : le classement ne doit rien devoir à l'id
+        self.coque = Produit.objects.create(nom='Coque', prix=Decimal(5000), description='Protège votre téléphone')
+        self.telephone = Produit.objects.create(nom='Téléphone Galaxy', prix=Decimal(150000), description='Écran OLED')
+        Produit.objects.create(nom='Clavier', prix=Decimal(8000), description='Mécanique')
+
+    def _resultats(self, texte):
+        return list(search.filtrer(Produit.objects.all(), texte).order_by('-pertinence').values_list('pk', flat=True))
+
+    def test_accents_et_casse_ignores(self):
+        self.assertEqual(search.normaliser('Téléphone ÇA'), 'telephone ca')
+        self.assertEqual(self._resultats('ecran'), [self.telephone.pk])
+        self.assertEqual(self._resultats('ÉCRAN'), [self.telephone.pk])
+
+    def test_nom_avant_description_et_prefixe(self):
+        self.assertEqual(self._resultats('telephone'), [self.telephone.pk, self.coque.pk])
+        self.assertEqual(self._resultats('tele'), [self.telephone.pk, self.coque.pk])
+        # Tous les termes doivent correspondre
+        self.assertEqual(self._resultats('telephone oled'), [self.telephone.pk])
+
+    def test_index_suit_les_modifications(self):
+        self.coque.nom = 'Étui'
+        self.coque.description = ''
+        self.coque.save()
+        self.assertEqual(self._resultats('etui'), [self.coque.pk])
+        self.assertEqual(self._resultats('telephone'), [self.telephone.pk])
+        self.telephone.delete()
+        self.assertEqual(self._resultats('telephone'), [])
+
+
+class PaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        produits = Produit.objects.bulk_create([
+            Produit(nom=f'Produit {i % 9}', prix=Decimal(1000 * (i % 7))) for i in range(53)
+        ])
+        # Dates et scores avec ex aequo : seul l'id final départage
+        debut = timezone.now()
+        for i, p in enumerate(produits):
+            Produit.objects.filter(pk=p.pk).update(date_creation=debut - timedelta(days=i % 5))
+        ClassementProduit.objects.bulk_create([
+            ClassementProduit(produit=p, score=(i % 4) / 2) for i, p in enumerate(produits) if i % 3
+        ])
+
+    def _queryset(self, tri):
+        qs = Produit.objects.all()
+        if tri == 'rating':
+            qs = qs.annotate(score_classement=Coalesce('classement__score', Value(0.0), output_field=FloatField()))
+        return qs
+
+    def _pages(self, tri, par_page=7):
+        ordering = ORDRES_TRI[tri]
+        pages, curseur = [], None
+        while True:
+            page = paginer_par_curseur(self._queryset(tri), ordering, par_page, curseur)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            curseur = page.next_cursor
+
+    def test_tous_les_tris_sans_doublon_ni_trou(self):
+        for tri, ordering in ORDRES_TRI.items():
+            with self.subTest(tri=tri):
+                pages = self._pages(tri)
+                ids = [p.pk for page in pages for p in page]
+                attendu = list(self._queryset(tri).order_by(*ordering).values_list('pk', flat=True))
+                self.assertEqual(ids, attendu)
+                self.assertFalse(pages[0].has_previous())
+
+                # Retour en arrière depuis la dernière page : mêmes pages, dans l'ordre inverse
+                page, arriere = pages[-1], [pages[-1]]
+                while page.has_previous():
+                    page = paginer_par_curseur(self._queryset(tri), ordering, 7, page.previous_cursor)
+                    arriere.append(page)
+                self.assertEqual(
+                    [[p.pk for p in page] for page in reversed(arriere)],
+                    [[p.pk for p in page] for page in pages],
+                )
+
+    def test_curseur_altere_ramene_a_la_premiere_page(self):
+        ordering = ORDRES_TRI['prix_asc']
+        premiere = [p.pk for p in paginer_par_curseur(Produit.objects.all(), ordering, 7)]
+        autre_tri = self._pages('nom')[0].next_cursor
+        type_invalide = base64.urlsafe_b64encode(b'{"o":["prix","id"],"v":["abc",1],"r":false}').decode()
+        for curseur in ('%%%', 'bm9uLWpzb24', autre_tri, type_invalide):
+            with self.subTest(curseur=curseur):
+                page = paginer_par_curseur(Produit.objects.all(), ordering, 7, curseur)
+                self.assertEqual([p.pk for p in page], premiere)
+
+    def test_bascule_offset_curseur(self):
+        fabrique = RequestFactory()
+        ordering = ORDRES_TRI['date']
+        page, total = paginer(fabrique.get('/'), Produit.objects.all(), ordering, 10, seuil=53)
+        self.assertEqual(total, 53)
+        self.assertFalse(getattr(page, 'cursor_mode', False))
+
+        page, total = paginer(fabrique.get('/'), Produit.objects.all(), ordering, 10, seuil=52)
+        self.assertIsNone(total)
+        self.assertTrue(page.cursor_mode)
+
+        # Un curseur dans l'URL impose le mode curseur, même sous le seuil
+        page, total = paginer(fabrique.get('/', {'cursor': page.next_cursor}), Produit.objects.all(), ordering, 10)
+        self.assertIsNone(total)
+        self.assertEqual(len(page), 10)
+
+
+class AgregatsNotesTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('client', password='secret')
+        self.produit = Produit.objects.create(nom='Casque', prix=Decimal(15000))
+        self.autre = Produit.objects.create(nom='Enceinte', prix=Decimal(20000))
+
+    def _agregats(self, produit):
+        produit.refresh_from_db(fields=['rating_sum', 'rating_count'])
+        return produit.rating_sum, produit.rating_count
+
+    def test_update_or_create_applique_le_delta(self):
+        note, created = Note.objects.update_or_create(produit=self.produit, user=self.user, defaults={'valeur': 2})
+        self.assertTrue(created)
+        self.assertEqual(self._agregats(self.produit), (2, 1))
+
+        Note.objects.update_or_create(produit=self.produit, user=self.user, defaults={'valeur': 5})
+        self.assertEqual(self._agregats(self.produit), (5, 1))
+
+        # Note déplacée sur un autre produit : retirée de l'un, ajoutée à l'autre
+        note = Note.objects.get(pk=note.pk)
+        note.produit = self.autre
+        note.save()
+        self.assertEqual(self._agregats(self.produit), (0, 0))
+        self.assertEqual(self._agregats(self.autre), (5, 1))
+
+        note.delete()
+        self.assertEqual(self._agregats(self.autre), (0, 0))
+
+    def test_reconciliation_depuis_la_table_des_notes(self):
+        Note.objects.bulk_create([Note(produit=self.produit, user=self.user, valeur=4)])
+        self.assertEqual(self._agregats(self.produit), (0, 0))
+        notation.reconcilier()
+        self.assertEqual(self._agregats(self.produit), (4, 1))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheCatalogueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.categorie = Categorie.objects.create(nom='Audio')
+        self.produit = Produit.objects.create(nom='Casque', prix=Decimal(15000), prix_promo=Decimal(12000))
+
+    def _change_la_version(self, operation):
+        avant = catalog_cache.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            operation()
+            # Rien ne change avant la validation de la transaction
+            self.assertEqual(catalog_cache.version(), avant)
+        self.assertNotEqual(catalog_cache.version(), avant)
+
+    def test_version_suit_produits_categories_et_liens(self):
+        self._change_la_version(self.produit.save)
+        self._change_la_version(self.categorie.save)
+        self._change_la_version(lambda: self.produit.categories.add(self.categorie))
+        self._change_la_version(lambda: self.produit.categories.remove(self.categorie))
+        self._change_la_version(self.produit.categories.clear)
+        self._change_la_version(lambda: Categorie.objects.create(nom='Vidéo').delete())
+        self._change_la_version(self.produit.delete)
+
+    def test_entrees_relues_puis_recalculees(self):
+        self.assertEqual(catalog_cache.promotions(), [self.produit])
+        with self.assertNumQueries(0):
+            catalog_cache.promotions()
+        with self.captureOnCommitCallbacks(execute=True):
+            Produit.objects.create(nom='Enceinte', prix=Decimal(30000), prix_promo=Decimal(25000))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(catalog_cache.promotions()), 2)
+
+    def test_expiration(self):
+        maintenant = time.time()
+        calcul = mock.Mock(side_effect=[1, 2])
+        with mock.patch('time.time', return_value=maintenant):
+            self.assertEqual(catalog_cache.obtenir('essai', calcul, ttl=60), 1)
+        with mock.patch('time.time', return_value=maintenant + 59):
+            self.assertEqual(catalog_cache.obtenir('essai', calcul, ttl=60), 1)
+        with mock.patch('time.time', return_value=maintenant + 61):
+            self.assertEqual(catalog_cache.obtenir('essai', calcul, ttl=60), 2)
+        self.assertEqual(calcul.call_count, 2)
+
+    def test_eviction_ciblee(self):
+        catalog_cache.obtenir('a', lambda: 'a')
+        catalog_cache.obtenir('b', lambda: 'b')
+        version = catalog_cache.version()
+        catalog_cache.evincer('a')
+        self.assertEqual(catalog_cache.version(), version)
+        self.assertEqual(catalog_cache.obtenir('a', lambda: 'a2'), 'a2')
+        self.assertEqual(catalog_cache.obtenir('b', lambda: 'b2'), 'b')
+
+    def test_notes_sans_toucher_au_catalogue(self):
+        catalog_cache.obtenir('mieux_notes', lambda: 'ancien')
+        version, notes = catalog_cache.version(), catalog_cache.version_notes()
+        catalog_cache.invalider_notes()
+        self.assertEqual(catalog_cache.version(), version)
+        self.assertNotEqual(catalog_cache.version_notes(), notes)
+        self.assertEqual(catalog_cache.obtenir('mieux_notes', lambda: 'nouveau'), 'nouveau')
+
+
+class ArborescenceCategoriesTests(TestCase):
+
+    def setUp(self):
+        self.electronique = Categorie.objects.create(nom='Électronique')
+        self.maison = Categorie.objects.create(nom='Maison')
+        self.telephones = Categorie.objects.create(nom='Téléphones', parent=self.electronique)
+        self.android = Categorie.objects.create(nom='Android', parent=self.telephones)
+
+    def _chemins(self, *categories):
+        return [
+            Categorie.objects.values_list('chemin', 'nom_complet', 'profondeur').get(pk=c.pk) for c in categories
+        ]
+
+    def test_chemin_a_la_creation(self):
+        e, t, a = self.electronique.pk, self.telephones.pk, self.android.pk
+        self.assertEqual(self._chemins(self.android), [(f'{e}/{t}/{a}/', 'Électronique/Téléphones/Android', 2)])
+
+    def test_rattachement_reecrit_le_sous_arbre(self):
+        produit = Produit.objects.create(nom='Pixel', prix=Decimal(300000))
+        produit.categories.add(self.android)
+
+        self.telephones.parent = self.maison
+        self.telephones.save()
+
+        m, t, a = self.maison.pk, self.telephones.pk, self.android.pk
+        self.assertEqual(self._chemins(self.telephones, self.android), [
+            (f'{m}/{t}/', 'Maison/Téléphones', 1),
+            (f'{m}/{t}/{a}/', 'Maison/Téléphones/Android', 2),
+        ])
+        self.assertEqual(list(Produit.objects.dans_categorie(self.maison.pk)), [produit])
+        self.assertFalse(Produit.objects.dans_categorie(self.electronique.pk).exists())
+
+        # Détachement : le sous-arbre remonte à la racine
+        self.telephones.parent = None
+        self.telephones.save()
+        self.assertEqual(self._chemins(self.android), [(f'{t}/{a}/', 'Téléphones/Android', 1)])
+
+    def test_renommage_propage_et_cycle_refuse(self):
+        self.electronique.nom = 'High-tech'
+        self.electronique.save()
+        self.assertEqual(self._chemins(self.android)[0][1], 'High-tech/Téléphones/Android')
+
+        self.electronique.parent = self.android
+        with self.assertRaises(ValidationError):
+            self.electronique.save()
+
+
+class FacettesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.electronique = Categorie.objects.create(nom='Électronique')
+        self.telephones = Categorie.objects.create(nom='Téléphones', parent=self.electronique)
+        self.android = Categorie.objects.create(nom='Android', parent=self.telephones)
+        self.maison = Categorie.objects.create(nom='Maison')
+        # 30 000 FCFA, mais 9 000 en promotion : tranche 0 (moins de 10 000)
+        self.pixel = Produit.objects.create(nom='Pixel', prix=Decimal(30000), prix_promo=Decimal(9000))
+        self.pixel.categories.add(self.android, self.electronique)
+        self.nokia = Produit.objects.create(nom='Nokia', prix=Decimal(15000))
+        self.nokia.categories.add(self.telephones)
+        self.lampe = Produit.objects.create(nom='Lampe', prix=Decimal(60000))
+        self.lampe.categories.add(self.maison)
+
+    def _prix(self, facettes_):
+        return [t['nombre'] for t in facettes_['prix']]
+
+    def test_categories_comptent_les_descendants_sans_doublon(self):
+        self.assertEqual(facets.compter_categories(Produit.objects.all()), {
+            self.electronique.pk: 2, self.telephones.pk: 2, self.android.pk: 1, self.maison.pk: 1,
+        })
+
+    def test_tranches_sur_le_prix_promo(self):
+        self.assertEqual(self._prix(facets.calculer(Produit.objects.all())), [1, 1, 0, 1, 0, 0])
+        self.assertEqual(list(facets.filtrer_tranche(Produit.objects.all(), 0)), [self.pixel])
+        self.assertFalse(facets.filtrer_tranche(Produit.objects.all(), 2).exists())
+        # Tranche invalide : pas de filtre
+        self.assertEqual(facets.filtrer_tranche(Produit.objects.all(), 'x').count(), 3)
+
+    def test_facettes_disjonctives(self):
+        compteurs = facets.calculer(Produit.objects.all(), categorie_id=self.telephones.pk, tranche=1)
+        # Les prix ignorent la tranche choisie mais suivent la catégorie, et inversement
+        self.assertEqual(self._prix(compteurs), [1, 1, 0, 0, 0, 0])
+        self.assertEqual(compteurs['categories'], {self.electronique.pk: 1, self.telephones.pk: 1})
+
+    def test_recherche_active_non_mise_en_cache(self):
+        base = search.filtrer(Produit.objects.all(), 'pixel')
+        compteurs = facets.calculer(base, search='pixel')
+        self.assertEqual(compteurs['categories'], {
+            self.electronique.pk: 1, self.telephones.pk: 1, self.android.pk: 1,
+        })
+        self.assertEqual(self._prix(compteurs), [1, 0, 0, 0, 0, 0])
+        with self.assertNumQueries(2):
+            facets.calculer(base, search='pixel')
+
+    def test_cache_invalide_par_la_version_du_catalogue(self):
+        self.assertEqual(self._prix(facets.calculer(Produit.objects.all())), [1, 1, 0, 1, 0, 0])
+        with self.assertNumQueries(0):
+            facets.calculer(Produit.objects.all())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Produit.objects.create(nom='Tablette', prix=Decimal(30000))
+        self.assertEqual(self._prix(facets.calculer(Produit.objects.all())), [1, 1, 1, 1, 0, 0])
+
+
+class VariantesImagesTests(TestCase):
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(MEDIA_ROOT=dossier.name)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def _produit(self):
+        tampon = BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(tampon, 'JPEG')
+        return Produit.objects.create(
+            nom='Casque', prix=Decimal(15000), image=SimpleUploadedFile('casque.jpg', tampon.getvalue()),
+        )
+
+    def test_rendu_sans_acces_au_stockage(self):
+        produit = self._produit()
+        gabarit = Template("{% load boutique_images %}{% image_responsive produit.image 'card' %}")
+
+        with mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError('stockage interrogé')):
+            self.assertNotIn('<picture>', gabarit.render(Context({'produit': produit})))
+
+        images.generer_pour_champ(produit.image)
+        produit = Produit.objects.get(pk=produit.pk)
+        self.assertEqual(produit.image_variantes, produit.image.name)
+        with mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError('stockage interrogé')):
+            self.assertIn('<picture>', gabarit.render(Context({'produit': produit})))
+
+        # Nouvelle image : l'original est servi jusqu'à la prochaine génération
+        produit.image.name = 'produits/autre.jpg'
+        self.assertFalse(images.variantes_disponibles(produit.image))
+
+
+class ClassementTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('client', password='secret')
+
+    def test_suppression_produit_note(self):
+        produit = Produit.objects.create(nom='Casque', prix=Decimal(15000))
+        Note.objects.create(produit=produit, user=self.user, valeur=4)
+        self.assertEqual(ClassementProduit.objects.get(produit=produit).nombre_notes, 1)
+
+        produit.delete()
+
+        self.assertFalse(ClassementProduit.objects.filter(produit_id=produit.pk).exists())
+
+    def test_moyenne_globale_persistee(self):
+        produit = Produit.objects.create(nom='Clavier', prix=Decimal(8000))
+        Note.objects.create(produit=produit, user=self.user, valeur=5)
+        classement.reconstruire()
+        self.assertEqual(MoyenneClassement.objects.get(pk=1).moyenne, 5.0)
+
+        # Une mise à jour incrémentale relit l'a priori en base, pas dans le cache local
+        cache.clear()
+        autre = User.objects.create_user('autre', password='secret')
+        Note.objects.create(produit=produit, user=autre, valeur=3)
+        ligne = ClassementProduit.objects.get(produit=produit)
+        self.assertAlmostEqual(ligne.score, classement.calculer_score(8, 2, 5.0))
+
+
+class CatalogueConditionnelTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.produit = Produit.objects.create(nom='Casque', prix=Decimal(15000))
+        self.url = reverse('boutique')
+        self.client.get(self.url)  # pose le cookie CSRF, qui entre dans l'ETag
+
+    def _etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        return response['ETag']
+
+    def _statut(self, etag):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_304_puis_200_apres_ajout_au_panier_invite(self):
+        etag = self._etag()
+        self.assertEqual(self._statut(etag), 304)
+        self.client.post(reverse('ajouter_au_panier', args=[self.produit.pk]))
+        self.assertEqual(self._statut(etag), 200)
+
+    def test_200_apres_nouvelle_note(self):
+        etag = self._etag()
+        user = User.objects.create_user('client', password='secret')
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(produit=self.produit, user=user, valeur=5)
+        self.assertEqual(self._statut(etag), 200)
+
+    def test_200_apres_connexion(self):
+        etag = self._etag()
+        self.client.force_login(User.objects.create_user('client', password='secret'))
+        self.assertEqual(self._statut(etag), 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code, 200)
+
+    def test_etag_faible_et_lie_au_secret_csrf(self):
+        etag = self._etag()
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertEqual(self._statut(etag), 304)
+
+        # La connexion renouvelle le secret CSRF ; il reste différent après la déconnexion
+        User.objects.create_user('client', password='secret')
+        self.client.post(reverse('login'), {'username': 'client', 'password': 'secret'})
+        self.client.post(reverse('logout'))
+        self.assertEqual(self._statut(etag), 200)
+
+
+class ResumePanierTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('client', password='secret')
+        self.produit = Produit.objects.create(nom='Souris', prix=Decimal(3000))
+
+    def test_resume_suit_les_ecritures_et_les_prix(self):
+        panier.ajouter_article(self.user.pk, self.produit.pk, 2)
+        panier.oublier_resume(self.user.pk)
+        self.assertEqual(panier.resume_panier(self.user.pk), {'count': 2, 'subtotal': Decimal(6000)})
+        with self.assertNumQueries(0):
+            panier.resume_panier(self.user.pk)
+
+        # Pas d'ajustement du résumé : la nouvelle version du panier force le recalcul
+        panier.ajouter_article(self.user.pk, self.produit.pk, 1)
+        panier.oublier_resume(self.user.pk)
+        self.assertEqual(panier.resume_panier(self.user.pk)['count'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produit.prix_promo = Decimal(2000)
+            self.produit.save()
+        self.assertEqual(panier.resume_panier(self.user.pk)['subtotal'], Decimal(6000))
+
+    def test_chaque_invalidation_donne_une_version_neuve(self):
+        versions = [panier.version_panier(self.user.pk)]
+        for _ in range(50):
+            panier.invalider_panier(self.user.pk)
+            versions.append(panier.version_panier(self.user.pk))
+        self.assertEqual(len(set(versions)), len(versions))
+
+
+class PasserCommandeTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('client', email='client@example.com', password='secret')
+
+    def _remplir_panier(self, nombre):
+        produits = Produit.objects.bulk_create([
+            Produit(nom=f'Produit {i}', prix=Decimal(1000 + i), prix_promo=Decimal(900) if i % 2 else None)
+            for i in range(nombre)
+        ])
+        PanierItem.objects.bulk_create([
+            PanierItem(user=self.user, produit=p, quantite=i + 1) for i, p in enumerate(produits)
+        ])
+        return produits
+
+    def _compter_requetes(self, nombre_lignes):
+        self._remplir_panier(nombre_lignes)
+        with CaptureQueriesContext(connection) as ctx:
+            passer_commande(self.user)
+        return len(ctx.captured_queries)
+
+    def test_nombre_de_requetes_constant(self):
+        une_ligne = self._compter_requetes(1)
+        Commande.objects.all().delete()
+        cinquante_lignes = self._compter_requetes(50)
+        self.assertEqual(une_ligne, cinquante_lignes)
+
+    def test_commande_creee_et_panier_vide(self):
+        produits = self._remplir_panier(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            commande = passer_commande(self.user)
+
+        attendu = sum((p.prix_promo or p.prix) * (i + 1) for i, p in enumerate(produits))
+        self.assertEqual(commande.total, attendu + FRAIS_LIVRAISON_DEFAUT)
+        self.assertEqual(CommandeItem.objects.filter(commande=commande).count(), 3)
+        self.assertEqual(
+            CommandeItem.objects.get(commande=commande, produit=produits[1]).prix_unitaire, Decimal(900)
+        )
+        self.assertFalse(PanierItem.objects.filter(user=self.user).exists())
+        self.assertTrue(EmailSortant.objects.filter(destinataires=['client@example.com']).exists())
+
+    def test_email_mis_en_file_sans_envoi(self):
+        self._remplir_panier(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            passer_commande(self.user)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(EmailSortant.objects.filter(statut='EN_ATTENTE').count(), 1)
+
+    def test_panier_vide(self):
+        with self.assertRaises(PanierVide):
+            passer_commande(self.user)
+        self.assertFalse(Commande.objects.exists())
+
+    def test_cle_idempotence_rejouee(self):
+        self._remplir_panier(2)
+        premiere = passer_commande(self.user, cle_idempotence='abc123')
+        self._remplir_panier(1)
+
+        with self.assertNumQueries(1):
+            rejouee = passer_commande(self.user, cle_idempotence='abc123')
+
+        self.assertEqual(rejouee.pk, premiere.pk)
+        self.assertTrue(rejouee.rejouee)
+        self.assertEqual(Commande.objects.count(), 1)
+        self.assertEqual(EmailSortant.objects.count(), 1)
+        # Le panier rempli après coup n'a pas été touché
+        self.assertEqual(PanierItem.objects.filter(user=self.user).count(), 1)
+
+    def test_ajout_concurrent_conserve(self):
+        produits = self._remplir_panier(2)
+        nouveau = Produit.objects.create(nom='Nouveau', prix=Decimal(500))
+
+        def calculer_puis_ajouter(*args, **kwargs):
+            resume = calculer_panier(*args, **kwargs)
+            # Ajouts validés par une autre requête après la lecture du panier
+            panier.ajouter_articles(self.user.pk, {produits[0].pk: 2, nouveau.pk: 1})
+            return resume
+
+        with mock.patch('Boutique.commandes.calculer_panier', calculer_puis_ajouter):
+            commande = passer_commande(self.user)
+
+        self.assertEqual(CommandeItem.objects.filter(commande=commande).count(), 2)
+        self.assertEqual(
+            dict(PanierItem.objects.filter(user=self.user).values_list('produit_id', 'quantite')),
+            {produits[0].pk: 2, nouveau.pk: 1},
+        )
+
+    def test_coordonnees_invalides_refusees(self):
+        self._remplir_panier(1)
+        self.client.force_login(self.user)
+        for latitude, longitude in (('abc', '-17.4'), ('1234.5', '-17.4'), ('14.7', ''), ('NaN', '1')):
+            response = self.client.post(reverse('confirmer_commande'), {'latitude': latitude, 'longitude': longitude})
+            self.assertRedirects(response, reverse('voir_panier'), fetch_redirect_response=False)
+        self.assertFalse(Commande.objects.exists())
+
+        self.client.post(reverse('confirmer_commande'), {'latitude': '14.6928', 'longitude': '-17.4467'})
+        commande = Commande.objects.get()
+        self.assertEqual((commande.latitude, commande.longitude), (Decimal('14.692800'), Decimal('-17.446700')))
+
+
+class BackendEnEchec(BaseEmailBackend):
+    """Backend de test : chaque envoi échoue."""
+
+    def send_messages(self, email_messages):
+        raise SMTPException('serveur indisponible')
+
+
+class OutboxTests(TestCase):
+
+    def test_lot_envoye_sur_une_connexion(self):
+        for i in range(3):
+            outbox.mettre_en_file(f'Sujet {i}', 'Message', [f'client{i}@example.com'])
+        backend = get_connection('django.core.mail.backends.locmem.EmailBackend')
+
+        with mock.patch('Boutique.outbox.get_connection', return_value=backend) as obtenir, \
+                mock.patch.object(backend, 'open', wraps=backend.open) as ouvrir, \
+                mock.patch.object(backend, 'close', wraps=backend.close) as fermer:
+            envoyes, echecs = outbox.traiter_file()
+
+        self.assertEqual((envoyes, echecs), (3, 0))
+        self.assertEqual((obtenir.call_count, ouvrir.call_count, fermer.call_count), (1, 1, 1))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailSortant.objects.filter(statut='ENVOYE', date_envoi__isnull=False).count(), 3)
+        self.assertEqual(outbox.traiter_file(), (0, 0))
+
+    def test_bail_prolonge_pendant_un_long_lot(self):
+        for i in range(6):
+            outbox.mettre_en_file(f'Sujet {i}', 'Message', [f'client{i}@example.com'])
+        horloge = [timezone.now()]
+        repris = []
+
+        class BackendLent(BaseEmailBackend):
+            # Chaque envoi prend 2 minutes ; un second worker tente de réserver entre deux envois
+            def send_messages(self, email_messages):
+                horloge[0] += timedelta(minutes=2)
+                repris.extend(outbox.reserver())
+                return len(email_messages)
+
+        with mock.patch('django.utils.timezone.now', side_effect=lambda: horloge[0]):
+            resultat = outbox.envoyer(outbox.reserver(), connection=BackendLent())
+
+        # 12 minutes d'envoi pour un bail de 5 : prolongé en route, rien n'est repris
+        self.assertEqual(resultat, (6, 0))
+        self.assertEqual(repris, [])
+        self.assertEqual(EmailSortant.objects.filter(statut='ENVOYE', jeton='').count(), 6)
+
+    def test_bail_perdu_non_envoye(self):
+        email = outbox.mettre_en_file('Sujet', 'Message', ['client@example.com'])
+        lot = outbox.reserver()
+        # Le worker a pris trop de retard : le bail expire et un autre worker reprend le message
+        EmailSortant.objects.filter(pk=email.pk).update(bail_expire=timezone.now() - timedelta(seconds=1))
+        autre = outbox.reserver()
+        lot[0].bail_expire = timezone.now() - timedelta(seconds=1)
+
+        self.assertEqual(outbox.envoyer(lot), (0, 0))
+        self.assertEqual(mail.outbox, [])
+        email.refresh_from_db()
+        self.assertEqual((email.statut, email.jeton), ('EN_COURS', autre[0].jeton))
+
+    @override_settings(EMAIL_BACKEND='Boutique.tests.BackendEnEchec')
+    def test_echec_replanifie_puis_abandonne(self):
+        email = outbox.mettre_en_file('Sujet', 'Message', ['client@example.com'])
+
+        self.assertEqual(outbox.traiter_file(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.statut, 'EN_ATTENTE')
+        self.assertEqual(email.tentatives, 1)
+        self.assertIn('serveur indisponible', email.derniere_erreur)
+        self.assertGreater(email.prochaine_tentative, timezone.now())
+        # Pas encore dû : rien n'est réservé
+        self.assertEqual(outbox.traiter_file(), (0, 0))
+
+        for _ in range(outbox.MAX_TENTATIVES - 1):
+            EmailSortant.objects.filter(pk=email.pk).update(prochaine_tentative=timezone.now())
+            outbox.traiter_file()
+        email.refresh_from_db()
+        self.assertEqual(email.statut, 'ECHEC')
+        self.assertEqual(email.tentatives, outbox.MAX_TENTATIVES)
+
+    def test_bail_expire_repris(self):
+        email = outbox.mettre_en_file('Sujet', 'Message', ['client@example.com'])
+        self.assertEqual(len(outbox.reserver()), 1)
+        # Déjà réservé : un second worker ne le reprend pas
+        self.assertEqual(outbox.reserver(), [])
+
+        EmailSortant.objects.filter(pk=email.pk).update(bail_expire=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.traiter_file(), (1, 0))
+
+
+class ConcurrenceTestCase(TransactionTestCase):
+    """
+    Tests à plusieurs threads écrivant en base. Avec SQLite, ils exigent la
+    base de test sur disque (InnovaTech.settings_test) et des transactions IMMEDIATE :
+    la base mémoire partagée lève « database table is locked » au hasard.
+    """
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            if connection.is_in_memory_db():
+                self.skipTest("Base SQLite en mémoire : écritures concurrentes impossibles.")
+            if connection.settings_dict['OPTIONS'].get('transaction_mode') != 'IMMEDIATE':
+                self.skipTest("SQLite sans transactions IMMEDIATE : verrous non attendus.")
+        super().setUp()
+
+
+class AjoutPanierConcurrentTests(ConcurrenceTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('client', password='secret')
+        self.produit = Produit.objects.create(nom='Clavier', prix=Decimal(5000))
+
+    def test_ajouts_simultanes_sans_perte(self):
+        nb_threads, ajouts = 8, 5
+        depart = threading.Barrier(nb_threads)
+        erreurs = []
+
+        def cliquer():
+            try:
+                depart.wait()
+                for _ in range(ajouts):
+                    panier.ajouter_article(self.user.pk, self.produit.pk, 2)
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=cliquer) for _ in range(nb_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(erreurs, [])
+        item = PanierItem.objects.get(user=self.user, produit=self.produit)
+        self.assertEqual(item.quantite, nb_threads * ajouts * 2)
+
+    def test_vue_retourne_ligne_et_totaux(self):
+        self.client.force_login(self.user)
+        url = reverse('ajouter_au_panier', args=[self.produit.pk])
+        self.client.post(url, {'quantite': 2}, HTTP_ACCEPT='application/json')
+        reponse = self.client.post(url, {'quantite': 3}, HTTP_ACCEPT='application/json')
+
+        data = reponse.json()
+        self.assertEqual(data['ligne']['quantite'], 5)
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(Decimal(data['subtotal']), Decimal(25000))
+
+
+class ModifierLotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('client', password='secret')
+        self.souris, self.clavier, self.ecran = Produit.objects.bulk_create([
+            Produit(nom='Souris', prix=Decimal(3000)),
+            Produit(nom='Clavier', prix=Decimal(8000), prix_promo=Decimal(6000)),
+            Produit(nom='Écran', prix=Decimal(90000)),
+        ])
+        PanierItem.objects.create(user=self.user, produit=self.souris, quantite=1)
+        PanierItem.objects.create(user=self.user, produit=self.clavier, quantite=1)
+
+    def _quantites(self):
+        return dict(PanierItem.objects.filter(user=self.user).values_list('produit_id', 'quantite'))
+
+    def test_ajout_modification_suppression_en_une_transaction(self):
+        operations = [
+            {'produit_id': self.souris.pk, 'qty': 4},
+            {'produit_id': self.clavier.pk, 'qty': 0},
+            {'produit_id': self.ecran.pk, 'qty': 1},
+            {'produit_id': 999999, 'qty': 2},  # produit inexistant : ignoré
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            resume = panier.modifier_lot(self.user.pk, operations)
+
+        self.assertEqual(self._quantites(), {self.souris.pk: 4, self.ecran.pk: 1})
+        self.assertEqual([(l.produit_id, l.total_ligne) for l in resume.lignes], [
+            (self.souris.pk, Decimal(12000)), (self.ecran.pk, Decimal(90000)),
+        ])
+        self.assertEqual((resume.count, resume.sous_total), (5, Decimal(102000)))
+        self.assertEqual(resume.total, Decimal(102000) + FRAIS_LIVRAISON_DEFAUT)
+        self.assertEqual(panier.resume_panier(self.user.pk), {'count': 5, 'subtotal': Decimal(102000)})
+
+    def test_operations_invalides_sans_effet(self):
+        for operations in ({'produit_id': 1}, [{'produit_id': self.souris.pk}], [{'produit_id': self.souris.pk, 'qty': -1}]):
+            with self.assertRaises(panier.OperationInvalide):
+                panier.modifier_lot(self.user.pk, operations)
+        self.assertEqual(self._quantites(), {self.souris.pk: 1, self.clavier.pk: 1})
+
+    def test_point_d_acces_json(self):
+        self.client.force_login(self.user)
+        url = reverse('modifier_panier_lot')
+        response = self.client.post(
+            url, {'operations': [{'produit_id': self.clavier.pk, 'qty': 3}]}, content_type='application/json',
+        )
+        data = response.json()
+        self.assertEqual((data['count'], Decimal(data['sous_total'])), (4, Decimal(21000)))
+        ligne = data['lignes'][1]
+        self.assertEqual((ligne['produit_id'], ligne['quantite']), (self.clavier.pk, 3))
+        self.assertEqual((Decimal(ligne['prix_unitaire']), Decimal(ligne['total'])), (Decimal(6000), Decimal(18000)))
+        response = self.client.post(url, {'operations': 'x'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class FusionPanierInviteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('client', password='secret')
+        self.souris = Produit.objects.create(nom='Souris', prix=Decimal(3000))
+        self.clavier = Produit.objects.create(nom='Clavier', prix=Decimal(8000))
+
+    def _panier_invite(self, valeur):
+        session = self.client.session
+        session[panier.CLE_SESSION] = valeur
+        session.save()
+
+    def test_connexion_fusionne_le_panier_invite(self):
+        self.client.post(reverse('ajouter_au_panier', args=[self.souris.pk]))
+        self.client.post(reverse('ajouter_au_panier', args=[self.souris.pk]))
+        self.assertEqual(self.client.session[panier.CLE_SESSION], f'{self.souris.pk}:2')
+        # Produit supprimé depuis l'ajout : ignoré
+        self._panier_invite(f'{self.souris.pk}:2,{self.clavier.pk}:1,999999:4')
+        PanierItem.objects.create(user=self.user, produit=self.souris, quantite=3)
+
+        self.client.post(reverse('login'), {'username': 'client', 'password': 'secret'})
+
+        self.assertEqual(
+            dict(PanierItem.objects.filter(user=self.user).values_list('produit_id', 'quantite')),
+            {self.souris.pk: 5, self.clavier.pk: 1},
+        )
+        self.assertNotIn(panier.CLE_SESSION, self.client.session)
+        self.assertEqual(panier.resume_panier(self.user.pk)['count'], 6)
+
+    def test_lecture_tolere_les_entrees_illisibles(self):
+        lire = panier.lire_panier_session
+        self.assertEqual(lire({'panier': f'{self.souris.pk}:2,x:1,{self.clavier.pk}:-1,:,{self.clavier.pk}:'}),
+                         {self.souris.pk: 2})
+        # Ancien format dict
+        self.assertEqual(lire({'panier': {
+            str(self.souris.pk): {'quantite': 2}, str(self.clavier.pk): {'quantite': 'abc'}, '7': {}, 'x': 1,
+        }}), {self.souris.pk: 2})
+        self.assertEqual(lire({'panier': {str(self.clavier.pk): '3'}}), {self.clavier.pk: 3})
+        self.assertEqual(lire({}), {})
+
+    def test_forme_compacte(self):
+        session = {}
+        panier.ecrire_panier_session(session, {self.souris.pk: 2, self.clavier.pk: 0})
+        self.assertEqual(session, {panier.CLE_SESSION: f'{self.souris.pk}:2'})
+        self.assertEqual(panier.compter_panier_session(session), 2)
+        panier.ecrire_panier_session(session, {})
+        self.assertEqual(session, {})
+
+
+def frais_offerts_des_20000(user_id, count, sous_total):
+    return 0 if sous_total >= 20000 else 1500
+
+
+class TarificationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('client', password='secret')
+        self.souris = Produit.objects.create(nom='Souris', prix=Decimal(3000))
+        self.clavier = Produit.objects.create(nom='Clavier', prix=Decimal(8000), prix_promo=Decimal(6000))
+        PanierItem.objects.create(user=self.user, produit=self.souris, quantite=2)
+        PanierItem.objects.create(user=self.user, produit=self.clavier, quantite=1)
+
+    def test_prix_promo_et_totaux_en_une_requete(self):
+        with self.assertNumQueries(1):
+            resume = calculer_panier(self.user.pk)
+            lignes = [(l.produit.nom, l.prix_applique, l.total_ligne) for l in resume.lignes]
+        self.assertEqual(lignes, [('Souris', Decimal(3000), Decimal(6000)), ('Clavier', Decimal(6000), Decimal(6000))])
+        self.assertEqual((resume.count, resume.sous_total), (3, Decimal(12000)))
+        self.assertEqual(resume.total, Decimal(12000) + FRAIS_LIVRAISON_DEFAUT)
+        self.assertEqual(totaux_panier(self.user.pk), (3, Decimal(12000)))
+
+    def test_panier_vide_sans_frais(self):
+        PanierItem.objects.all().delete()
+        resume = calculer_panier(self.user.pk)
+        self.assertFalse(resume)
+        self.assertEqual((resume.count, resume.sous_total, resume.total), (0, Decimal(0), Decimal(0)))
+
+    @override_settings(BOUTIQUE_FRAIS_LIVRAISON='Boutique.tests.frais_offerts_des_20000')
+    def test_frais_de_livraison_configurables(self):
+        self.assertEqual(calculer_panier(self.user.pk).frais_livraison, Decimal(1500))
+        PanierItem.objects.filter(produit=self.souris).update(quantite=5)
+        resume = calculer_panier(self.user.pk)
+        self.assertEqual((resume.frais_livraison, resume.total), (Decimal(0), Decimal(21000)))
+
+    def test_page_panier(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('voir_panier'))
+        self.assertEqual(response.context['sous_total'], Decimal(12000))
+        self.assertEqual(response.context['frais_livraison'], FRAIS_LIVRAISON_DEFAUT)
+
+
+class StockTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('client', password='secret')
+
+    def test_rupture_annule_toute_la_commande(self):
+        disponible = Produit.objects.create(nom='Souris', prix=Decimal(3000), stock=10)
+        rare = Produit.objects.create(nom='Écran', prix=Decimal(90000), stock=1)
+        PanierItem.objects.create(user=self.user, produit=disponible, quantite=2)
+        PanierItem.objects.create(user=self.user, produit=rare, quantite=3)
+
+        with self.assertRaises(StockInsuffisant) as ctx:
+            passer_commande(self.user)
+
+        self.assertEqual([(p.pk, demande, dispo) for p, demande, dispo in ctx.exception.manquants], [(rare.pk, 3, 1)])
+        disponible.refresh_from_db()
+        self.assertEqual(disponible.stock, 10)
+        self.assertFalse(Commande.objects.exists())
+        self.assertEqual(PanierItem.objects.filter(user=self.user).count(), 2)
+
+    def test_stock_non_suivi_illimite(self):
+        produit = Produit.objects.create(nom='Câble', prix=Decimal(500))
+        PanierItem.objects.create(user=self.user, produit=produit, quantite=50)
+        passer_commande(self.user)
+        produit.refresh_from_db()
+        self.assertIsNone(produit.stock)
+
+
+class StockConcurrentTests(ConcurrenceTestCase):
+
+    def test_commandes_paralleles_sur_produit_populaire(self):
+        stock_initial, clients = 5, 12
+        produit = Produit.objects.create(nom='Console', prix=Decimal(250000), stock=stock_initial)
+        users = User.objects.bulk_create([User(username=f'client{i}') for i in range(clients)])
+        PanierItem.objects.bulk_create([PanierItem(user=u, produit=produit, quantite=1) for u in users])
+
+        depart = threading.Barrier(clients)
+        resultats, erreurs = [], []
+
+        def commander(user):
+            try:
+                depart.wait()
+                passer_commande(user)
+                resultats.append('ok')
+            except StockInsuffisant:
+                resultats.append('rupture')
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=commander, args=(u,)) for u in users]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(resultats.count('ok'), stock_initial)
+        self.assertEqual(resultats.count('rupture'), clients - stock_initial)
+        produit.refresh_from_db()
+        self.assertEqual(produit.stock, 0)
+        self.assertEqual(Commande.objects.count(), stock_initial)
+
+
+class StatsLivreurTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.livreur = User.objects.create_user('livreur', password='secret')
+        UserProfile.objects.create(user=self.livreur, role='LIVREUR')
+        self.client_user = User.objects.create_user('client', email='client@example.com', password='secret')
+        self.commandes = [
+            Commande.objects.create(user=self.client_user, total=Decimal(5000)) for _ in range(3)
+        ]
+
+    def test_une_requete_puis_cache(self):
+        with self.assertNumQueries(1):
+            stats = livraison.stats_livreur(self.livreur)
+        self.assertEqual((stats['count_all'], stats['in_progress'], stats['revenue_total']), (0, 0, 0))
+        with self.assertNumQueries(0):
+            livraison.stats_livreur(self.livreur)
+
+    def test_invalidation_par_prise_et_changement_de_statut(self):
+        livraison.stats_livreur(self.livreur)
+        with self.captureOnCommitCallbacks(execute=True):
+            livraison.prendre_commande(self.commandes[0].pk, self.livreur)
+            livraison.prendre_commande(self.commandes[1].pk, self.livreur)
+        self.assertEqual(livraison.stats_livreur(self.livreur)['in_progress'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            livraison.changer_statut(self.commandes[0].pk, self.livreur, 'complete')
+            livraison.changer_statut(self.commandes[1].pk, self.livreur, 'release')
+        stats = livraison.stats_livreur(self.livreur)
+        self.assertEqual((stats['count_all'], stats['in_progress'], stats['completed']), (1, 0, 1))
+        self.assertEqual(stats['delivered_today'], 1)
+        self.assertEqual(stats['revenue_today'], FRAIS_LIVRAISON_DEFAUT)
+
+    def test_compteurs_du_jour_recalcules_le_lendemain(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            livraison.prendre_commande(self.commandes[0].pk, self.livreur)
+            livraison.changer_statut(self.commandes[0].pk, self.livreur, 'complete')
+        self.assertEqual(livraison.stats_livreur(self.livreur)['delivered_today'], 1)
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=1)):
+            with self.assertNumQueries(1):
+                stats = livraison.stats_livreur(self.livreur)
+        self.assertEqual((stats['delivered_today'], stats['completed']), (0, 1))
+
+    def test_point_d_acces(self):
+        self.client.force_login(self.livreur)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('livreur_order_accept', args=[self.commandes[0].pk]))
+        self.assertEqual(self.client.get(reverse('livreur_stats_json')).json()['in_progress'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('livreur_order_update_status', args=[self.commandes[0].pk]), {'action': 'complete'})
+        self.assertEqual(self.client.get(reverse('livreur_stats_json')).json()['completed'], 1)
+
+
+class FilesLivraisonTests(TestCase):
+
+    def setUp(self):
+        self.client_user = User.objects.create_user('client', email='client@example.com', password='secret')
+        self.alice = self._livreur('alice')
+        self.bob = self._livreur('bob')
+        self.commandes = [Commande.objects.create(user=self.client_user, total=Decimal(5000)) for _ in range(4)]
+
+    def _livreur(self, nom):
+        user = User.objects.create_user(nom, password='secret')
+        UserProfile.objects.create(user=user, role='LIVREUR')
+        return user
+
+    def _ids(self, commandes):
+        return list(commandes.values_list('id', flat=True))
+
+    def test_une_commande_n_est_prise_qu_une_fois(self):
+        pk = self.commandes[0].pk
+        self.assertEqual(livraison.prendre_commande(pk, self.alice).livreur, self.alice)
+        self.assertIsNone(livraison.prendre_commande(pk, self.bob))
+        self.assertIsNone(livraison.prendre_commande(pk, self.alice))
+        self.assertEqual(Commande.objects.get(pk=pk).livreur, self.alice)
+
+        self.client.force_login(self.bob)
+        response = self.client.post(reverse('livreur_order_accept', args=[pk]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_files_commune_et_personnelle(self):
+        a, b, c, d = (commande.pk for commande in self.commandes)
+        livraison.prendre_commande(a, self.alice)
+        livraison.prendre_commande(b, self.alice)
+        livraison.prendre_commande(c, self.bob)
+        Commande.objects.filter(pk=b).update(statut='LIVREE')
+
+        self.assertEqual(self._ids(livraison.file_commune()), [d])
+        self.assertEqual(self._ids(livraison.commandes_livreur(self.alice)), [b, a])
+        self.assertEqual(self._ids(livraison.commandes_livreur(self.bob)), [c])
+
+        # Seul le livreur de la commande peut la faire avancer ; la libérer la remet dans la file
+        self.assertIsNone(livraison.changer_statut(c, self.alice, 'release'))
+        self.assertIsNone(livraison.changer_statut(c, self.bob, 'inconnue'))
+        livraison.changer_statut(c, self.bob, 'release')
+        self.assertEqual(self._ids(livraison.file_commune()), [d, c])
+        self.assertEqual(self._ids(livraison.commandes_livreur(self.bob)), [])
+
+    def test_point_d_acces_des_files(self):
+        a, b, c, d = (commande.pk for commande in self.commandes)
+        livraison.prendre_commande(a, self.alice)
+        livraison.prendre_commande(b, self.alice)
+        livraison.changer_statut(b, self.alice, 'complete')
+        livraison.prendre_commande(c, self.bob)
+
+        self.client.force_login(self.alice)
+        url = reverse('livreur_orders_json')
+
+        def ids(**params):
+            return [o['id'] for o in self.client.get(url, params).json()['orders']]
+
+        self.assertEqual(ids(file='pool'), [d])
+        self.assertEqual(ids(file='mine'), [b, a])
+        self.assertEqual(ids(file='mine', status='EN_COURS'), [a])
+
+
+class PositionsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.livreur = User.objects.create_user('livreur', password='secret')
+        UserProfile.objects.create(user=self.livreur, role='LIVREUR')
+        self.maintenant = timezone.now()
+
+    def _ts(self, secondes):
+        return (self.maintenant - timedelta(seconds=secondes)).timestamp()
+
+    def test_releve_desordonne_ou_perime_ignore(self):
+        self.assertEqual(positions.enregistrer(self.livreur.pk, [{'lat': 14.70, 'lng': -17.44, 'ts': self._ts(10)}]), (1, 0))
+        # Arrivé en retard : plus ancien que la position connue
+        self.assertEqual(positions.enregistrer(self.livreur.pk, [{'lat': 14.80, 'lng': -17.40, 'ts': self._ts(30)}]), (0, 1))
+        # Trop ancien pour être accepté
+        self.assertEqual(positions.enregistrer(self.livreur.pk, [{'lat': 14.80, 'lng': -17.40, 'ts': self._ts(3600)}]), (0, 1))
+        # Dans un lot, seul le plus récent est retenu
+        lot = [{'lat': 14.71, 'lng': -17.43, 'ts': self._ts(5)}, {'lat': 14.72, 'lng': -17.42, 'ts': self._ts(2)}]
+        self.assertEqual(positions.enregistrer(self.livreur.pk, lot), (1, 1))
+        self.assertEqual(positions.derniere_position(self.livreur.pk)['lat'], 14.72)
+
+    def test_horodatage_infini_refuse(self):
+        self.client.force_login(self.livreur)
+        response = self.client.post(
+            reverse('livreur_positions'), '{"positions": [{"lat": 14.7, "lng": -17.4, "ts": Infinity}]}',
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(positions.PositionInvalide):
+            positions.enregistrer(self.livreur.pk, [{'lat': 14.7, 'lng': -17.4, 'ts': 1e300}])
+
+    def test_vidage_en_un_seul_update(self):
+        client = User.objects.create_user('client', password='secret')
+        autre = User.objects.create_user('autre_livreur', password='secret')
+        Commande.objects.bulk_create([
+            Commande(user=client, total=Decimal(1000), statut='EN_COURS', livreur=l) for l in (self.livreur, self.livreur, autre)
+        ])
+        positions.enregistrer(self.livreur.pk, [{'lat': 14.7, 'lng': -17.4}])
+        positions.enregistrer(autre.pk, [{'lat': 14.8, 'lng': -17.5}])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(positions.vider(), 3)
+        ecritures = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(ecritures), 1)
+        self.assertEqual(
+            Commande.objects.filter(livreur=self.livreur, latitude_livreur=Decimal('14.7')).count(), 2,
+        )
+        # Rien de nouveau : aucune écriture
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(positions.vider(), 0)
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in ctx.captured_queries))
+
+
+class SuiviCommandeTests(TestCase):
+
+    def setUp(self):
+        self.client_user = User.objects.create_user('client', password='secret')
+        self.commande = Commande.objects.create(user=self.client_user, total=Decimal(1000))
+        self.url = reverse('suivi_commande_stream', args=[self.commande.pk])
+
+    async def test_reserve_au_client(self):
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 401)
+        autre = await User.objects.acreate(username='autre')
+        await self.async_client.aforce_login(autre)
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 404)
+
+    async def test_evenements_jusqu_au_statut_final(self):
+        await self.async_client.aforce_login(self.client_user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        flux = aiter(response.streaming_content)
+
+        self.assertEqual(await anext(flux), b'retry: 5000\n\n')
+        self.assertIn(b'"statut": "EN_ATTENTE"', await anext(flux))
+
+        self.commande.statut = 'LIVREE'
+        prochain = asyncio.ensure_future(anext(flux))
+        await asyncio.sleep(0)
+        diffusion.publier_statut(self.commande)
+        evenement = await asyncio.wait_for(prochain, 1)
+        self.assertTrue(evenement.startswith(b'event: statut\n'))
+        self.assertIn(b'"statut": "LIVREE"', evenement)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(flux)
+
+    def test_wsgi_etat_courant_seulement(self):
+        self.client.force_login(self.client_user)
+        response = self.client.get(self.url)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content.count(b'event: statut'), 1)
+
+
+class CarteGeohashTests(TestCase):
+
+    def setUp(self):
+        self.client_user = User.objects.create_user('client', password='secret')
+        # Dakar : trois commandes proches (Plateau), une à Yoff ; une à Thiès, hors de la boîte
+        self.plateau = [self._commande(14.6690 + i * 0.0005, -17.4380 - i * 0.0005) for i in range(3)]
+        self.yoff = self._commande(14.7540, -17.4700)
+        self.thies = self._commande(14.7910, -16.9250)
+        self.boite = (14.60, -17.55, 14.80, -17.30)  # sud, ouest, nord, est
+
+    def _commande(self, lat, lng):
+        return Commande.objects.create(user=self.client_user, total=Decimal(1000), latitude=lat, longitude=lng)
+
+    def test_encodage(self):
+        # Exemple de référence du format geohash
+        self.assertEqual(geo.encoder(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(Commande.objects.get(pk=self.yoff.pk).geohash, geo.encoder(14.7540, -17.4700))
+
+    def test_boite_englobante_par_intervalles_sur_l_index(self):
+        cellules = geo.couverture(*self.boite)
+        self.assertLessEqual(len(cellules), geo.CELLULES_MAX)
+        self.assertTrue(all(c.geohash.startswith(tuple(cellules)) for c in self.plateau + [self.yoff]))
+
+        sud, ouest, nord, est = self.boite
+        naif = Commande.objects.filter(latitude__range=(sud, nord), longitude__range=(ouest, est))
+        resultat = geo.filtrer_boite(Commande.objects.all(), *self.boite)
+        self.assertEqual(set(resultat), set(naif))
+        self.assertEqual(len(resultat), 4)
+        self.assertIn('geohash', str(resultat.query))
+
+    def test_regroupement_selon_le_zoom(self):
+        commandes = geo.filtrer_boite(Commande.objects.all(), *self.boite)
+        # Zoom 12 (géohash à 6 caractères, environ 1 km) : le Plateau en un groupe, Yoff isolé (avec son id)
+        groupes = sorted(geo.regrouper(commandes, 12), key=lambda g: g[2])
+        self.assertEqual([(n, pk) for _, _, n, pk in groupes], [(1, self.yoff.pk), (3, None)])
+        self.assertAlmostEqual(groupes[1][1], 14.6695, places=4)
+        # Au-delà du dernier palier : un point par commande
+        self.assertEqual(len(geo.regrouper(commandes, 18)), 4)
+
+        collection = geo.geojson(groupes)
+        self.assertEqual(collection['features'][0]['properties'], {'n': 1, 'id': self.yoff.pk})
+        self.assertEqual(collection['features'][1]['properties'], {'n': 3})
+        self.assertEqual(collection['features'][0]['geometry']['coordinates'], [-17.47, 14.754])
+
+    def test_point_d_acces(self):
+        livreur = User.objects.create_user('livreur', password='secret')
+        UserProfile.objects.create(user=livreur, role='LIVREUR')
+        self.client.force_login(livreur)
+        url = reverse('livreur_map_geojson')
+        data = self.client.get(url, {'bbox': '-17.55,14.60,-17.30,14.80', 'zoom': 12, 'file': 'pool'}).json()
+        self.assertEqual(sorted(f['properties']['n'] for f in data['features']), [1, 3])
+        self.assertEqual(self.client.get(url, {'bbox': '-17.30,14.60,-17.55,14.80'}).status_code, 400)
+
+
+class ItineraireTests(TestCase):
+
+    # Écart toléré à l'optimum (recherche exhaustive) sur 200 tournées aléatoires de 7 arrêts
+    ECART_MOYEN_MAX = 0.03
+    ECART_PIRE_MAX = 0.25
+
+    def _optimum(self, arrets, depart):
+        distances = itineraire.matrice_distances([depart] + [(lat, lng) for _, lat, lng in arrets])
+        chemins = np.array([(0,) + p for p in itertools.permutations(range(1, len(arrets) + 1))])
+        return distances[chemins[:, :-1], chemins[:, 1:]].sum(axis=1).min()
+
+    def test_ecart_a_l_optimum_borne(self):
+        hasard = random.Random(24)
+        ecarts = []
+        for _ in range(200):
+            arrets = [(i, 14.6 + hasard.random() * 0.2, -17.5 + hasard.random() * 0.2) for i in range(7)]
+            depart = (14.6 + hasard.random() * 0.2, -17.5 + hasard.random() * 0.2)
+            plan = itineraire.planifier(arrets, depart)
+            self.assertEqual(sorted(plan.ordre), list(range(7)))
+            ecarts.append(plan.distance_km / self._optimum(arrets, depart) - 1)
+        self.assertLessEqual(sum(ecarts) / len(ecarts), self.ECART_MOYEN_MAX)
+        self.assertLessEqual(max(ecarts), self.ECART_PIRE_MAX)
+
+    def test_chemin_ouvert_depuis_le_livreur(self):
+        # Arrêts alignés, donnés dans le désordre : l'ordre suit la ligne à partir du livreur
+        arrets = [(3, 14.73, -17.4), (1, 14.71, -17.4), (4, 14.74, -17.4), (2, 14.72, -17.4)]
+        plan = itineraire.planifier(arrets, (14.70, -17.4))
+        self.assertEqual(plan.ordre, [1, 2, 3, 4])
+        self.assertAlmostEqual(plan.distance_km, 4 * 1.112, places=2)
+        self.assertEqual(plan.etapes[-1]['cumul_km'], plan.distance_km)
+        # Sans position : départ à une extrémité
+        self.assertIn(itineraire.planifier(arrets).ordre, ([1, 2, 3, 4], [4, 3, 2, 1]))
+        self.assertEqual(itineraire.planifier([]).ordre, [])
+
+    def test_point_d_acces(self):
+        livreur = User.objects.create_user('livreur', password='secret')
+        UserProfile.objects.create(user=livreur, role='LIVREUR')
+        client_user = User.objects.create_user('client', password='secret')
+        loin, proche = (
+            Commande.objects.create(user=client_user, total=Decimal(1000), latitude=lat, longitude=-17.4,
+                                    livreur=livreur, statut='EN_COURS')
+            for lat in (14.75, 14.71)
+        )
+        cache.clear()
+        positions.enregistrer(livreur.pk, [{'lat': 14.70, 'lng': -17.4}])
+        self.client.force_login(livreur)
+        self.assertEqual(self.client.get(reverse('livreur_itineraire_json')).json()['ordre'], [proche.pk, loin.pk])
+
+
+class DispatchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user('client', password='secret')
+        self.proche = self._livreur('proche', 14.700, -17.440)
+        self.loin = self._livreur('loin', 14.760, -17.380)
+
+    def _livreur(self, nom, lat, lng):
+        user = User.objects.create_user(nom, password='secret')
+        UserProfile.objects.create(user=user, role='LIVREUR')
+        positions.enregistrer(user.pk, [{'lat': lat, 'lng': lng}])
+        return user
+
+    def _commande(self, lat, lng):
+        return Commande.objects.create(user=self.client_user, total=Decimal(1000), latitude=lat, longitude=lng)
+
+    def test_plus_proche_dans_la_limite_de_capacite(self):
+        commandes = [self._commande(14.701, -17.441) for _ in range(3)]
+        sans_position = Commande.objects.create(user=self.client_user, total=Decimal(1000))
+
+        attributions = dispatch.repartir(capacite=2)
+
+        self.assertEqual(attributions, [
+            (commandes[0].pk, self.proche.pk), (commandes[1].pk, self.proche.pk), (commandes[2].pk, self.loin.pk),
+        ])
+        self.assertEqual(Commande.objects.filter(livreur=self.proche, statut='EN_COURS').count(), 2)
+        sans_position.refresh_from_db()
+        self.assertIsNone(sans_position.livreur_id)
+
+    def test_commande_deja_acceptee_non_reattribuee(self):
+        commande = self._commande(14.701, -17.441)
+        self.assertIsNotNone(prendre_commande(commande.pk, self.loin))
+
+        self.assertEqual(dispatch.repartir(), [])
+        commande.refresh_from_db()
+        self.assertEqual(commande.livreur_id, self.loin.pk)
+        # Et inversement : l'acceptation manuelle échoue après l'attribution automatique
+        autre = self._commande(14.702, -17.442)
+        self.assertEqual(dispatch.repartir(), [(autre.pk, self.proche.pk)])
+        self.assertIsNone(prendre_commande(autre.pk, self.loin))
+
+    def test_commandes_hors_de_portee_ne_bloquent_pas_la_file(self):
+        # Plus anciennes que tout le reste, à Saint-Louis : aucun livreur à moins de 15 km
+        for _ in range(5):
+            self._commande(16.020, -16.490)
+        recente = self._commande(14.701, -17.441)
+
+        self.assertEqual(dispatch.repartir(taille_lot=2), [(recente.pk, self.proche.pk)])
+
+    def test_commandes_refusees_sans_cache_partage(self):
+        for commande in ('dispatch_orders', 'flush_positions'):
+            with self.assertRaisesMessage(CommandError, 'REDIS_URL'):
+                call_command(commande)
+        self.assertEqual([w.id for w in checks.verifier_cache_partage(None)], ['Boutique.W001'])
+
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://r:6379'}}
+        with override_settings(CACHES=redis):
+            self.assertTrue(checks.cache_partage())
+            self.assertEqual(checks.verifier_cache_partage(None), [])
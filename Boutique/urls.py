@@ -9,6 +9,22 @@ urlpatterns = [
     path('', views.index, name='home'),
     path('boutique/', views.boutique, name='boutique'),
     path('a-propos/', views.about, name='about'),
+    path('panier/', views.voir_panier, name='voir_panier'),
+    path('panier/ajouter/<int:produit_id>/', views.ajouter_au_panier, name='ajouter_au_panier'),
+    path('panier/modifier/<int:produit_id>/', views.modifier_quantite, name='modifier_quantite'),
+    path('panier/modifier/', views.modifier_panier_lot, name='modifier_panier_lot'),
+    path('panier/retirer/<int:produit_id>/', views.retirer_du_panier, name='retirer_du_panier'),
+    path('panier/confirmer/', views.confirmer_commande, name='confirmer_commande'),
+    path('panier/count/', views.cart_count_ajax, name='cart_count_ajax'),
+    path('commandes/<int:pk>/items/', views.commande_items_json, name='commande_items_json'),
+    path('commandes/<int:pk>/suivi/', views.suivi_commande_stream, name='suivi_commande_stream'),
+    path('livreur/stats.json', views.livreur_stats_json, name='livreur_stats_json'),
+    path('livreur/commandes.json', views.livreur_orders_json, name='livreur_orders_json'),
+    path('livreur/commandes/<int:pk>/accepter/', views.livreur_order_accept, name='livreur_order_accept'),
+    path('livreur/commandes/<int:pk>/statut/', views.livreur_order_update_status, name='livreur_order_update_status'),
+    path('livreur/positions/', views.livreur_positions, name='livreur_positions'),
+    path('livreur/carte.geojson', views.livreur_map_geojson, name='livreur_map_geojson'),
+    path('livreur/itineraire.json', views.livreur_itineraire_json, name='livreur_itineraire_json'),
 
     # Auth
     path('accounts/login/', views.custom_login, name='login'),
@@ -1,8 +1,9 @@
 # Dans un fichier comme votre_app/utils.py
 
-from django.core.mail import send_mail
 from django.conf import settings
 
+from . import outbox
+
 def envoyer_mail_statut_commande(commande, statut_precedent=None):
     """
     Envoie un email au client concernant le statut de sa commande.
@@ -51,7 +52,7 @@ Articles :
 """
     # Ajout de la liste des articles
     items_list = ""
-    for item in commande.items.all():
+    for item in commande.items.select_related('produit'):
         # Assurez-vous que votre modèle Produit a bien un champ 'nom'
         items_list += f"- {item.quantite}x {item.produit.nom} ({item.prix_unitaire} F CFA / unité)\n"
         
@@ -61,16 +62,10 @@ Merci de votre confiance.
 L'équipe de [Votre Boutique/Site].
 """
 
-    # 3. Envoi de l'email
-    try:
-        send_mail(
-            sujet,
-            message_final,
-            settings.EMAIL_HOST_USER,
-            [commande.user.email], # Destinataire
-            fail_silently=False,
-        )
-        print(f"Email de statut envoyé pour la commande #{commande.id} à {commande.user.email}")
-    except Exception as e:
-        # Gérer les erreurs d'envoi (ex: mauvaise configuration SMTP)
-        print(f"Erreur lors de l'envoi de l'email pour la commande #{commande.id} : {e}")
\ No newline at end of file
+    # 3. Mise en file de l'email (envoyé par `manage.py send_outbox`)
+    outbox.mettre_en_file(
+        sujet,
+        message_final,
+        [commande.user.email], # Destinataire
+        expediteur=settings.EMAIL_HOST_USER,
+    )
@@ -3,13 +3,17 @@ from itertools import count
 from os import truncate
 from PIL import Image, ImageDraw, ImageFont
 from functools import wraps
+import asyncio
 import json
+from decimal import Decimal, InvalidOperation
 import os
+import uuid
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
+from django.http import JsonResponse, HttpResponse, HttpResponseRedirect, Http404, StreamingHttpResponse
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import logout, update_session_auth_hash, login, authenticate
@@ -22,9 +26,17 @@ from django.views.decorators.http import require_POST, require_http_methods
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.db.models import Q, Sum, Count
-from django.db.models.functions import TruncDate
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models import FloatField, Value
 from django.db import transaction
 from .utils import envoyer_mail_statut_commande 
+from . import catalog_cache, diffusion, facets as facettes, geo, images, itineraire, livraison, panier, positions, search as recherche
+from .pagination import paginer, paginer_par_curseur, query_sans_pagination
+from .commandes import PanierVide, StockInsuffisant, passer_commande
+from .tarification import calculer_panier
+from .conditional import (
+    catalogue_conditionnel, commande_conditionnelle, panier_conditionnel, peut_voir_toutes_commandes
+)
 from Boutique.forms import (
     AdminProfileForm, AdresseForm, CategorieForm, DelivererCreateForm, 
     DelivererProfileForm, DelivererProfileUpdateForm, DelivererUserUpdateForm, 
@@ -59,70 +71,30 @@ def _pending_choice_for_statut():
     return 'EN_ATTENTE'
 
 def _get_cart_count(request):
-    """Récupère le nombre d'articles dans le panier"""
+    """Récupère le nombre d'articles dans le panier (cache par utilisateur, voir panier.py)"""
     if request.user.is_authenticated:
-        return PanierItem.objects.filter(user=request.user).aggregate(total=Sum('quantite'))['total'] or 0
-    cart = request.session.get('panier', {})
-    return sum(int(v.get('quantite', 0)) for v in cart.values())
+        return panier.resume_panier(request.user.pk)['count']
+    return panier.compter_panier_session(request.session)
+
+def _wants_json(request):
+    """Vrai pour les appels AJAX (fetch / XMLHttpRequest)"""
+    return (
+        request.headers.get('x-requested-with') == 'XMLHttpRequest'
+        or 'application/json' in request.headers.get('accept', '')
+    )
 
 def is_livreur(user):
     """Vérifie si l'utilisateur est un livreur"""
     return getattr(getattr(user, 'userprofile', None), 'role', None) == RoleChoices.LIVREUR
 
-# Fonctions pour les livreurs
+# Fonctions pour les livreurs (voir livraison.py)
 def _livreur_orders_queryset(user=None):
     """Récupère les commandes pour un livreur"""
-    return Commande.objects.select_related('user').order_by('-id')
+    return livraison.commandes_livreur(user)
 
-def _livreur_stats(orders):
-    """Calcule les statistiques pour un livreur"""
-    from django.db.models import Sum, Count
-    from django.utils import timezone
-    
-    today = timezone.now().date()
-    
-    # Utiliser la constante partagée
-    FRAIS_LIVRAISON = FRAIS_LIVRAISON_DEFAUT
-    
-    # Compter les commandes par statut
-    pending = orders.filter(statut='EN_ATTENTE').count()
-    in_progress = orders.filter(statut='EN_COURS').count()
-    completed = orders.filter(statut='LIVREE').count()
-    
-    # Commandes livrées aujourd'hui
-    delivered_today = orders.filter(
-        statut='LIVREE',
-        date_commande__date=today
-    ).count()
-    
-    # Revenus basés sur les frais de livraison
-    # Seules les commandes livrées génèrent des revenus pour le livreur
-    completed_orders = orders.filter(statut='LIVREE')
-    
-    # Revenus totaux = nombre de commandes livrées × frais de livraison
-    revenue_total = completed_orders.count() * FRAIS_LIVRAISON
-    
-    # Revenus du jour = commandes livrées aujourd'hui × frais de livraison
-    revenue_today = delivered_today * FRAIS_LIVRAISON
-    
-    # Revenus du mois
-    revenue_this_month = orders.filter(
-        statut='LIVREE',
-        date_commande__month=today.month,
-        date_commande__year=today.year
-    ).count() * FRAIS_LIVRAISON
-    
-    return {
-        'count_all': orders.count(),
-        'pending': pending,
-        'in_progress': in_progress,
-        'completed': completed,
-        'delivered_today': delivered_today,
-        'revenue_total': revenue_total,
-        'revenue_today': revenue_today,
-        'revenue_this_month': revenue_this_month,
-        'frais_livraison': FRAIS_LIVRAISON,
-    }
+def _livreur_stats(user):
+    """Statistiques du livreur (une requête, en cache par livreur)"""
+    return livraison.stats_livreur(user)
 
 # ===================================================================
 # DÉCORATEURS PERSONNALISÉS
@@ -159,14 +131,24 @@ def accueil(request):
     """Ancienne page d'accueil - redirige vers la boutique"""
     return redirect('boutique')
 
+# Ordres de tri proposés par la boutique ; toujours terminés par une clé unique
+ORDRES_TRI = {
+    'prix_asc': ('prix', 'id'),
+    'prix_desc': ('-prix', '-id'),
+    'date': ('-date_creation', '-id'),
+    'nom': ('nom', 'id'),
+    'rating': ('-score_classement', '-id'),
+}
+
+@catalogue_conditionnel
 def boutique(request):
     """Vue boutique - liste des produits accessible à tous"""
     produits_qs = Produit.objects.all()
 
-    # Recherche
+    # Recherche (index plein texte, voir search.py)
     search = request.GET.get('search')
     if search:
-        produits_qs = produits_qs.filter(Q(nom__icontains=search) | Q(description__icontains=search))
+        produits_qs = recherche.filtrer(produits_qs, search)
 
     # Filtrage par catégorie
     categorie_id = request.GET.get('categorie')
@@ -175,32 +157,59 @@ def boutique(request):
     except (TypeError, ValueError):
         categorie_selected_int = None
 
+    # Facettes calculées avant les filtres catégorie / prix (voir facets.py)
+    tranche = facettes.tranche_valide(request.GET.get('prix'))
+    compteurs = facettes.calculer(produits_qs, categorie_selected_int, tranche, search)
+
     if categorie_selected_int:
-        produits_qs = produits_qs.filter(Q(categories__id=categorie_selected_int)).distinct()
-
-    # Tri
-    sort = request.GET.get('sort', 'nom')
-    if sort == 'prix_asc':
-        produits_qs = produits_qs.order_by('prix')
-    elif sort == 'prix_desc':
-        produits_qs = produits_qs.order_by('-prix')
-    elif sort == 'date':
-        produits_qs = produits_qs.order_by('-date_creation')
+        # Inclut les sous-catégories (chemin matérialisé, voir Categorie.chemin)
+        produits_qs = produits_qs.dans_categorie(categorie_selected_int)
+
+    # Filtrage par tranche de prix (prix promo si présent)
+    produits_qs = facettes.filtrer_tranche(produits_qs, tranche)
+
+    # Tri (par pertinence par défaut lorsqu'une recherche est active)
+    # La clé finale 'id' rend l'ordre stable, ce qu'exige la pagination par curseur.
+    sort = request.GET.get('sort') or ('pertinence' if search else 'nom')
+    par_pertinence = sort == 'pertinence' and 'pertinence' in produits_qs.query.annotations
+    if par_pertinence:
+        ordering = ('-pertinence', 'nom', 'id')
     else:
-        produits_qs = produits_qs.order_by('nom')
+        ordering = ORDRES_TRI.get(sort, ORDRES_TRI['nom'])
+        if sort == 'rating':
+            # Score bayésien précalculé (voir classement.py)
+            produits_qs = produits_qs.annotate(
+                score_classement=Coalesce('classement__score', Value(0.0), output_field=FloatField())
+            )
+    produits_qs = produits_qs.order_by(*ordering)
 
     # Pagination
-    total_count = produits_qs.count()
     try:
         per_page = int(request.GET.get('per_page', 12))
     except (TypeError, ValueError):
         per_page = 12
+    per_page = max(1, min(per_page, 96))
 
-    paginator = Paginator(produits_qs, per_page)
-    page_obj = paginator.get_page(request.GET.get('page'))
-
-    categories = Categorie.objects.all().order_by('nom')
+    if par_pertinence:
+        # Résultats de recherche : peu nombreux, classement non indexable
+        paginator = Paginator(produits_qs, per_page)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        total_count = paginator.count
+    else:
+        page_obj, total_count = paginer(request, produits_qs, ordering, per_page)
+
+    # Rails et catégories servis par le cache du catalogue (voir catalog_cache.py)
+    categories = catalog_cache.categories()
+    facettes_categories = [
+        {'categorie': c, 'nombre': compteurs['categories'][c.pk]}
+        for c in sorted(categories, key=lambda c: c.full_path)
+        if compteurs['categories'].get(c.pk)
+    ]
     context = {
+        'arbre_categories': catalog_cache.arbre_categories(),
+        'facettes_categories': facettes_categories,
+        'facettes_prix': compteurs['prix'],
+        'current_prix': tranche,
         'produits': page_obj.object_list,
         'page_obj': page_obj,
         'categories': categories,
@@ -211,11 +220,215 @@ def boutique(request):
         'per_page': per_page,
         'per_page_options': [12, 24, 48, 96],
         'total_count': total_count,
-        'promotions': produits_qs.filter(prix_promo__isnull=False)[:12],
-        'nouveautes': produits_qs.order_by('-date_creation')[:8],
-        'mieux_notes': produits_qs.order_by('-date_creation')[:8],
+        'pagination_query': query_sans_pagination(request),
+        'promotions': catalog_cache.promotions(),
+        'nouveautes': catalog_cache.nouveautes(),
+        'mieux_notes': catalog_cache.mieux_notes(),
     }
     return render(request, 'boutique/index.html', context)
+
+            # ===================================================================
+            # POINTS D'ACCÈS JSON (AJAX)
+            # ===================================================================
+
+@panier_conditionnel
+def cart_count_ajax(request):
+    """Nombre d'articles du panier (badge) ; 304 si le panier n'a pas changé"""
+    return JsonResponse({'count': _get_cart_count(request)})
+
+@login_required
+@commande_conditionnelle
+def commande_items_json(request, pk):
+    """Articles d'une commande ; 304 tant que la commande n'a pas été modifiée"""
+    commandes = Commande.objects.all()
+    if not peut_voir_toutes_commandes(request.user):
+        commandes = commandes.filter(user=request.user)
+    commande = get_object_or_404(commandes, pk=pk)
+    items = commande.items.select_related('produit')
+    return JsonResponse({
+        'id': commande.id,
+        'statut': commande.statut,
+        'statut_display': commande.get_statut_display(),
+        'total': str(commande.total),
+        'updated_at': commande.updated_at.isoformat(),
+        'items': [
+            {
+                'produit_id': item.produit_id,
+                'nom': item.produit.nom,
+                'quantite': item.quantite,
+                'prix_unitaire': str(item.prix_unitaire),
+                'sous_total': str(item.prix_unitaire * item.quantite),
+            }
+            for item in items
+        ],
+    })
+
+            # ===================================================================
+            # PANIER ET COMMANDE
+            # ===================================================================
+
+@require_POST
+def ajouter_au_panier(request, produit_id):
+    """Ajoute un produit au panier (base si connecté, session sinon)"""
+    produit = get_object_or_404(Produit.objects.only('id', 'nom', 'prix', 'prix_promo'), pk=produit_id)
+    try:
+        quantite = int(request.POST.get('quantite', 1))
+    except (TypeError, ValueError):
+        quantite = 0
+    if quantite <= 0:
+        if _wants_json(request):
+            return JsonResponse({'ok': False, 'error': "Quantité invalide."}, status=400)
+        messages.error(request, "Quantité invalide.")
+        return redirect(request.META.get('HTTP_REFERER') or 'boutique')
+
+    prix = _unit_price(produit)
+    if request.user.is_authenticated:
+        # Upsert atomique : pas de lecture-modification-écriture sur la ligne
+        quantite_ligne = panier.ajouter_article(request.user.pk, produit.pk, quantite)
+        panier.oublier_resume(request.user.pk)
+        resume = panier.resume_panier(request.user.pk)
+    else:
+        cart = panier.lire_panier_session(request.session)
+        cart[produit.pk] = quantite_ligne = cart.get(produit.pk, 0) + quantite
+        panier.ecrire_panier_session(request.session, cart)
+        resume = {'count': sum(cart.values()), 'subtotal': None}
+
+    if _wants_json(request):
+        return JsonResponse({
+            'ok': True,
+            'ligne': {'produit_id': produit.pk, 'quantite': quantite_ligne, 'total': str(prix * quantite_ligne)},
+            'count': resume['count'],
+            'subtotal': None if resume['subtotal'] is None else str(resume['subtotal']),
+        })
+    messages.success(request, f"« {produit.nom} » a été ajouté au panier.")
+    return redirect(request.META.get('HTTP_REFERER') or 'boutique')
+
+@login_required
+@require_POST
+def modifier_quantite(request, produit_id):
+    """Modifie la quantité d'une ligne du panier (0 = suppression)"""
+    item = get_object_or_404(PanierItem, user=request.user, produit_id=produit_id)
+    try:
+        quantite = int(request.POST.get('quantite', item.quantite))
+    except (TypeError, ValueError):
+        messages.error(request, "Quantité invalide.")
+        return redirect('voir_panier')
+
+    if quantite <= 0:
+        item.delete()
+    else:
+        item.quantite = quantite
+        item.save(update_fields=['quantite'])
+    panier.oublier_resume(request.user.pk)
+    return redirect('voir_panier')
+
+@login_required
+@require_POST
+def modifier_panier_lot(request):
+    """
+    Applique plusieurs modifications de quantité en une requête (JSON) :
+    {"operations": [{"produit_id": 3, "qty": 2}, {"produit_id": 7, "qty": 0}]}
+    Retourne le panier recalculé pour mettre la page à jour sans la recharger.
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+        operations = data.get('operations') if isinstance(data, dict) else data
+        resume = panier.modifier_lot(request.user.pk, operations)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'ok': True,
+        'lignes': [
+            {
+                'produit_id': item.produit_id,
+                'nom': item.produit.nom,
+                'quantite': item.quantite,
+                'prix_unitaire': str(item.prix_applique),
+                'total': str(item.total_ligne),
+            }
+            for item in resume.lignes
+        ],
+        'count': resume.count,
+        'sous_total': str(resume.sous_total),
+        'frais_livraison': str(resume.frais_livraison),
+        'total': str(resume.total),
+    })
+
+@login_required
+@require_POST
+def retirer_du_panier(request, produit_id):
+    """Retire une ligne du panier"""
+    item = get_object_or_404(PanierItem.objects.select_related('produit'), user=request.user, produit_id=produit_id)
+    item.delete()
+    panier.oublier_resume(request.user.pk)
+    messages.success(request, f"« {item.produit.nom} » a été retiré du panier.")
+    return redirect('voir_panier')
+
+@login_required
+def voir_panier(request):
+    """Affiche le panier de l'utilisateur connecté"""
+    resume = calculer_panier(request.user.pk)
+    return render(request, 'boutique/panier.html', {
+        'panier': resume,
+        'lignes': resume.lignes,
+        'sous_total': resume.sous_total,
+        'frais_livraison': resume.frais_livraison,
+        'total': resume.total,
+        'adresses': request.user.adresses.all(),
+        # Nouvelle clé à chaque affichage : un double envoi du même formulaire = une seule commande
+        'cle_idempotence': uuid.uuid4().hex,
+    })
+
+def _lire_coordonnees(data):
+    """
+    (latitude, longitude) en Decimal à 6 décimales, ou (None, None) si
+    absentes. Lève ValueError si elles sont incomplètes, mal formées ou hors limites.
+    """
+    brutes = (data.get('latitude') or '').strip(), (data.get('longitude') or '').strip()
+    if not any(brutes):
+        return None, None
+    try:
+        lat, lng = (Decimal(v) for v in brutes)
+    except InvalidOperation:
+        raise ValueError("Coordonnées GPS invalides.")
+    if not (lat.is_finite() and lng.is_finite() and -90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("Coordonnées GPS hors limites.")
+    precision = Decimal('0.000001')
+    return lat.quantize(precision), lng.quantize(precision)
+
+@login_required
+@require_POST
+def confirmer_commande(request):
+    """Transforme le panier en commande (voir commandes.py)"""
+    cle = request.POST.get('cle_idempotence') or request.headers.get('Idempotency-Key') or None
+    if cle and len(cle) > 64:
+        messages.error(request, "Requête invalide.")
+        return redirect('voir_panier')
+    try:
+        latitude, longitude = _lire_coordonnees(request.POST)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('voir_panier')
+    try:
+        commande = passer_commande(
+            request.user,
+            latitude=latitude,
+            longitude=longitude,
+            adresse_gps=request.POST.get('adresse_gps') or None,
+            cle_idempotence=cle,
+        )
+    except PanierVide:
+        messages.error(request, "Votre panier est vide.")
+        return redirect('voir_panier')
+    except StockInsuffisant as e:
+        details = ', '.join(f"« {p.nom} » ({disponible} disponible(s))" for p, _, disponible in e.manquants)
+        messages.error(request, f"Stock insuffisant : {details or 'un produit vient d’être épuisé'}. Ajustez les quantités.")
+        return redirect('voir_panier')
+
+    messages.success(request, f"Commande #{commande.id} enregistrée. Merci pour votre achat !")
+    return redirect('boutique')
+
 def about(request):
     """Page à propos accessible à tous"""
     return render(request, 'boutique/about.html')
@@ -267,6 +480,7 @@ def register(request):
                 address=form3.cleaned_data["address"],
                 photo=form2.cleaned_data.get("photo"),
             )
+            images.generer_pour_champ(profile.photo)
 
             # 3) Génération automatique avatar si aucune photo
             
@@ -464,13 +678,14 @@ def admin_category_delete(request, pk):
 @admin_required
 def admin_products(request):
     """Gestion des produits"""
-    qs = Produit.objects.all().order_by('-date_creation')
-    paginator = Paginator(qs, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    # Notes lues depuis les colonnes dénormalisées ; catégories préchargées
+    qs = Produit.objects.prefetch_related('categories')
+    page_obj, total_count = paginer(request, qs, ORDRES_TRI['date'], 20)
     return render(request, 'admin/products.html', {
         'produits': page_obj.object_list,
         'page_obj': page_obj,
-        'total_count': qs.count(),
+        'total_count': total_count,
+        'pagination_query': query_sans_pagination(request),
     })
 @staff_required
 def admin_product_create(request):
@@ -502,4 +717,197 @@ def admin_product_delete(request, pk):
         return redirect('admin_products')
 @staff_required
 def admin_commande(request):
-    return render(request, 'admin/commandes.html')
\ No newline at end of file
+    return render(request, 'admin/commandes.html')
+# ===================================================================
+# VUES LIVREUR
+# ===================================================================
+
+@login_required
+@user_passes_test(is_livreur)
+def livreur_stats_json(request):
+    """Statistiques du livreur connecté (compteurs et revenus), en JSON"""
+    return JsonResponse(_livreur_stats(request.user))
+
+def _commande_livreur_json(commande):
+    return {
+        'id': commande.id,
+        'client': commande.user.username,
+        'statut': commande.statut,
+        'total': str(commande.total),
+        'date_commande': commande.date_commande.isoformat(),
+        'adresse': commande.adresse_gps or '',
+        'latitude': float(commande.latitude) if commande.latitude is not None else None,
+        'longitude': float(commande.longitude) if commande.longitude is not None else None,
+    }
+
+@login_required
+@user_passes_test(is_livreur)
+def livreur_orders_json(request):
+    """
+    Files de commandes du livreur : ?file=pool (en attente, sans livreur)
+    ou ?file=mine (ses commandes, filtrables par ?status=), paginées par curseur.
+    """
+    if request.GET.get('file') == 'pool':
+        orders = livraison.file_commune()
+    else:
+        orders = _livreur_orders_queryset(request.user)
+        if request.GET.get('status'):
+            orders = orders.filter(statut=request.GET['status'])
+
+    page = paginer_par_curseur(orders, ('-id',), 20, request.GET.get('cursor'))
+    return JsonResponse({
+        'orders': [_commande_livreur_json(c) for c in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+@login_required
+@user_passes_test(is_livreur)
+@require_POST
+def livreur_order_accept(request, pk):
+    """Prendre une commande de la file commune (un seul livreur l'obtient)"""
+    commande = livraison.prendre_commande(pk, request.user)
+    if commande is None:
+        return JsonResponse({'ok': False, 'error': f"Commande #{pk} déjà prise ou indisponible."}, status=409)
+    return JsonResponse({'ok': True, 'order': _commande_livreur_json(commande)})
+
+@login_required
+@user_passes_test(is_livreur)
+@require_POST
+def livreur_order_update_status(request, pk):
+    """Mettre à jour le statut d'une de ses commandes (action=complete|release)"""
+    action = request.POST.get('action', '')
+    commande = livraison.changer_statut(pk, request.user, action)
+    if commande is None:
+        return JsonResponse({'ok': False, 'error': f"Action '{action}' non autorisée pour la commande #{pk}."}, status=409)
+    return JsonResponse({'ok': True, 'order': _commande_livreur_json(commande)})
+
+@login_required
+@user_passes_test(is_livreur)
+@require_POST
+def livreur_positions(request):
+    """
+    Reçoit un lot de relevés GPS du livreur :
+    {"positions": [{"lat": 14.69, "lng": -17.44, "ts": 1718000000000}, ...]}
+    Seul le plus récent est gardé (en cache) ; la base est écrite par intervalles.
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+        points = data.get('positions') if isinstance(data, dict) else data
+        acceptes, ignores = positions.enregistrer(request.user.pk, points)
+    except ValueError as e:
+        return JsonResponse({'ok': False, 'error': str(e)}, status=400)
+
+    positions.vider_si_du()
+    return JsonResponse({'ok': True, 'acceptes': acceptes, 'ignores': ignores})
+
+@login_required
+@user_passes_test(is_livreur)
+def livreur_map_geojson(request):
+    """
+    Commandes géolocalisées de la carte du livreur, en GeoJSON :
+    ?bbox=ouest,sud,est,nord&zoom=12[&file=pool]. Les points sont regroupés
+    côté serveur selon le zoom ; seule la boîte visible est lue (index geohash).
+    """
+    try:
+        ouest, sud, est, nord = (float(v) for v in request.GET['bbox'].split(','))
+        zoom = int(request.GET.get('zoom', 12))
+    except (KeyError, ValueError):
+        return JsonResponse({'error': "Paramètres attendus : bbox=ouest,sud,est,nord et zoom."}, status=400)
+    if not (-90 <= sud <= nord <= 90 and -180 <= ouest <= est <= 180):
+        return JsonResponse({'error': "Boîte englobante invalide."}, status=400)
+
+    if request.GET.get('file') == 'pool':
+        orders = livraison.file_commune()
+    else:
+        orders = _livreur_orders_queryset(request.user)
+    orders = geo.filtrer_boite(orders, sud, ouest, nord, est)
+    return JsonResponse(geo.geojson(geo.regrouper(orders, zoom)))
+
+@login_required
+@user_passes_test(is_livreur)
+def livreur_itineraire_json(request):
+    """Ordre de passage conseillé pour les commandes en cours du livreur (plus proche voisin + 2-opt)."""
+    return JsonResponse(itineraire.itineraire_livreur(request.user).as_dict())
+
+# ===================================================================
+# SUIVI EN DIRECT (Server-Sent Events, servi par ASGI)
+# ===================================================================
+
+# Commentaire envoyé en l'absence d'événement, pour garder la connexion ouverte
+INTERVALLE_PING = 20
+STATUTS_FINAUX = ('LIVREE', 'ANNULEE')
+
+def _sse(evenement, donnees):
+    return f"event: {evenement}\ndata: {json.dumps(donnees, default=str)}\n\n"
+
+async def _flux_suivi(commande, continu=True):
+    """
+    Statut et position du livreur d'une commande, poussés au fil de l'eau.
+    Avec continu=False, seul l'état courant est envoyé puis le flux se ferme
+    (le navigateur se reconnecte après `retry` : simple interrogation périodique).
+    """
+    bus = diffusion.bus()
+    abonnement = bus.abonner(diffusion.canal_commande(commande.pk))
+    livreur_id = commande.livreur_id
+    try:
+        yield "retry: 5000\n\n"
+        yield _sse('statut', {'statut': commande.statut, 'livreur_id': livreur_id})
+        if commande.statut in STATUTS_FINAUX:
+            return
+
+        if livreur_id:
+            bus.ajouter_canal(abonnement, diffusion.canal_livreur(livreur_id))
+            position = await positions.aderniere_position(livreur_id) or commande.position_livreur
+            if position:
+                yield _sse('position', {'lat': position['lat'], 'lng': position['lng'],
+                                        'ts': position.get('ts') or position.get('last_update')})
+        if not continu:
+            return
+
+        while True:
+            try:
+                canal, donnees = await abonnement.recevoir(timeout=INTERVALLE_PING)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+
+            if canal != diffusion.canal_commande(commande.pk):
+                yield _sse('position', donnees)
+                continue
+
+            if donnees['livreur_id'] != livreur_id:
+                # Commande prise ou relâchée : on suit le nouveau livreur
+                if livreur_id:
+                    bus.retirer_canal(abonnement, diffusion.canal_livreur(livreur_id))
+                livreur_id = donnees['livreur_id']
+                if livreur_id:
+                    bus.ajouter_canal(abonnement, diffusion.canal_livreur(livreur_id))
+            yield _sse('statut', donnees)
+            if donnees['statut'] in STATUTS_FINAUX:
+                return
+    finally:
+        bus.desabonner(abonnement)
+
+async def suivi_commande_stream(request, pk):
+    """
+    Flux SSE d'une commande (événements `statut` et `position`), réservé à son client.
+    Vue asynchrone : sous ASGI, une connexion en attente ne mobilise aucun thread.
+    Sous WSGI (runserver, gunicorn synchrone), Django lit toute la réponse
+    avant de l'envoyer : le flux est alors limité à l'état courant.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    commande = await Commande.objects.filter(pk=pk, user_id=user.pk).afirst()
+    if commande is None:
+        raise Http404("Commande introuvable.")
+
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(_flux_suivi(commande), content_type='text/event-stream')
+    else:
+        contenu = [morceau async for morceau in _flux_suivi(commande, continu=False)]
+        response = HttpResponse(''.join(contenu), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Le suivi en direct des commandes (flux SSE, Boutique.views.suivi_commande_stream)
+doit être servi par un serveur ASGI pour que les connexions ouvertes ne bloquent
+pas de thread : en production, gunicorn avec des workers uvicorn (Procfile).
+Sous WSGI, le flux se limite à l'état courant et le navigateur se reconnecte.
 """
 
 import os
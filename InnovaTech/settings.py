@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -64,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'Boutique.context_processors.panier',
             ],
         },
     },
@@ -79,8 +81,46 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Les transactions qui lisent puis écrivent (upsert du panier, UPDATE
+            # conditionnels du stock et des livraisons, bail de l'outbox) prennent
+            # le verrou d'écriture dès BEGIN : en mode DEFERRED, deux d'entre
+            # elles passées en lecture ne peuvent plus monter en écriture et
+            # l'une échoue aussitôt en « database is locked », sans attendre.
+            'transaction_mode': 'IMMEDIATE',
+            # Attente maximale du verrou (secondes) avant l'erreur
+            'timeout': 20,
+        },
     }
 }
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Les workers web et les commandes (flush_positions, dispatch_orders...)
+# partagent par le cache les positions GPS, les versions du catalogue, du
+# panier et des statistiques, et le verrou de vidage (cache.add) : en
+# production, il faut un cache commun à tous les processus, aux opérations
+# atomiques, c'est-à-dire Redis (REDIS_URL, paquet redis) ; Memcached ou
+# DatabaseCache (après `manage.py createcachetable`) conviennent aussi.
+# Sans REDIS_URL, cache mémoire local : un seul processus (runserver).
+# `manage.py check --deploy` le signale et les deux commandes refusent de tourner.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Durée de vie des entrées du cache catalogue (secondes)
+CATALOGUE_CACHE_TTL = 60 * 15
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
@@ -0,0 +1,18 @@
+"""
+Réglages propres aux tests : `python manage.py test` les charge d'office
+(voir manage.py) ; ils complètent InnovaTech.settings sans le modifier.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+# Base de test sur disque : la base mémoire partagée lève « table is locked »
+# dès que deux threads écrivent (tests de concurrence, voir ConcurrenceTestCase)
+DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+# Cache propre au processus de test : REDIS_URL éventuel ignoré, les tests
+# (cache.clear()) ne touchent jamais au cache d'un environnement réel
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}